@@ -829,3 +829,68 @@ def createBryFile(confM2R):
         # ----------------------------------------
 
     f1.close()
+
+
+def writebryfile(confM2R, ntime, boundary, myvar, data1=None, data2=None, data3=None, data4=None):
+    """
+    Write the boundary section of one variable directly to the BRY file. Used when only the BRY file is
+    created (bryonly in configM2R.py): the data are then interpolated to a strip of the ROMS grid along each
+    boundary (model2roms.createboundaryconfigs) and the section is cut from the strip the same way as
+    clim2bry.py cuts the CLIM fields. Ice variables are scaled as in IOwrite.writeclimfile.
+    """
+    grdROMS = confM2R.grdROMS
+
+    def section(data):
+        if boundary == 'west':
+            return np.squeeze(data[..., 0])
+        if boundary == 'east':
+            return np.squeeze(data[..., -1])
+        if boundary == 'south':
+            return np.squeeze(data[..., 0, :])
+        if boundary == 'north':
+            return np.squeeze(data[..., -1, :])
+
+    f1 = Dataset(confM2R.bryname, mode='a', format=confM2R.myformat)
+
+    if myvar == confM2R.globalvarnames[0] and boundary == 'west':
+        if grdROMS.timeunits[0:7] == "seconds":
+            f1.variables['ocean_time'][ntime] = grdROMS.time
+        else:
+            f1.variables['ocean_time'][ntime] = grdROMS.time * 86400.0
+        print('IOBry.py => Appending data to file %s for time %s' % (confM2R.bryname, grdROMS.time))
+
+    if myvar == 'temperature':
+        f1.variables['temp_' + boundary][ntime, :, :] = section(data1)
+    if myvar == 'salinity':
+        f1.variables['salt_' + boundary][ntime, :, :] = section(data1)
+    if myvar == 'ssh':
+        f1.variables['zeta_' + boundary][ntime, :] = section(data1)
+    if myvar == 'vvel':
+        f1.variables['u_' + boundary][ntime, :, :] = section(data1)
+        f1.variables['v_' + boundary][ntime, :, :] = section(data2)
+        f1.variables['ubar_' + boundary][ntime, :] = section(data3)
+        f1.variables['vbar_' + boundary][ntime, :] = section(data4)
+
+    if confM2R.writeice:
+        if myvar == 'ageice':
+            f1.variables['ageice_' + boundary][ntime, :] = section(np.where(abs(data1) > 100, 0, data1))
+        if myvar == 'uice':
+            # NorESM is cm/s divide by 100 to get m/s
+            f1.variables['uice_' + boundary][ntime, :] = section(np.where(abs(data1) > 120, 0, data1) * 0.01)
+            for name in ['sfwat', 'tisrf', 'ti', 'sig11', 'sig12', 'sig22']:
+                f1.variables[name + '_' + boundary][ntime, :] = 0.
+            if confM2R.indatatype == 'GLORYS':
+                # Special care for GLORYS as dataset does not contain sea ice age and snow thickness
+                f1.variables['ageice_' + boundary][ntime, :] = 0.
+                f1.variables['snow_thick_' + boundary][ntime, :] = 0.
+        if myvar == 'vice':
+            f1.variables['vice_' + boundary][ntime, :] = section(np.where(abs(data1) > 120, 0, data1) * 0.01)
+        if myvar == 'aice':
+            # NorESM is % divide by 100 to get fraction
+            f1.variables['aice_' + boundary][ntime, :] = section(np.where(abs(data1) > 120, 0, data1) * 0.01)
+        if myvar == 'hice':
+            f1.variables['hice_' + boundary][ntime, :] = section(np.where(abs(data1) > 10, 0, data1))
+        if myvar == 'snow_thick':
+            f1.variables['snow_thick_' + boundary][ntime, :] = section(np.where(abs(data1) > 10, 0, data1))
+
+    f1.close()
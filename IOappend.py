@@ -0,0 +1,102 @@
+from __future__ import print_function
+import os
+import numpy as np
+from netCDF4 import Dataset, num2date
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Append mode (appendmode in configM2R.py): extend existing CLIM and BRY files with new time steps instead
+    of creating them again, e.g. when one new month of forcing is added at a time.
+
+    The last ocean_time of the existing CLIM file (BRY file for bryonly) is found and only the time steps of
+    the run after that date are converted and written after the existing records. clim2bry.py then only adds
+    the BRY records of the new CLIM records. Before anything is written the files are checked against the
+    ROMS grid of the run: the dimensions, the vertical grid parameters (hc, Tcline, theta_s, theta_b, Cs_r),
+    the units of ocean_time, and the ice variables must match.
+
+    When the files do not exist the run creates them as usual.
+    """
+
+
+def timeunits(confM2R):
+    # The units of ocean_time written by IOwrite.py and IOBry.py
+    if confM2R.indatatype == "NORESM":
+        return 'seconds since 1800-01-01 00:00:00'
+    return 'seconds since 1948-01-01 00:00:00'
+
+
+def validatefile(confM2R, filename):
+    """
+    Check that the existing CLIM or BRY file filename was created for the grid and settings of confM2R.
+    Returns the number of records in the file and the date of the last record (None for an empty file).
+    """
+    grdROMS = confM2R.grdROMS
+    cdf = Dataset(filename)
+    problems = []
+
+    for dimension, size in [('xi_rho', grdROMS.xi_rho), ('eta_rho', grdROMS.eta_rho),
+                            ('s_rho', len(grdROMS.s_rho)), ('s_w', len(grdROMS.s_w))]:
+        if dimension not in cdf.dimensions or len(cdf.dimensions[dimension]) != size:
+            problems.append("dimension %s is not %s" % (dimension, size))
+
+    for name, value in [('hc', grdROMS.hc), ('Tcline', grdROMS.tcline), ('theta_s', grdROMS.theta_s),
+                        ('theta_b', grdROMS.theta_b), ('Cs_r', grdROMS.Cs_rho)]:
+        if name not in cdf.variables or not np.allclose(cdf.variables[name][:], value):
+            problems.append("vertical grid parameter %s differs" % name)
+
+    if 'ocean_time' not in cdf.variables or cdf.variables['ocean_time'].units != timeunits(confM2R):
+        problems.append("ocean_time is not in %s" % timeunits(confM2R))
+
+    icevariables = [name for name in cdf.variables if name == 'aice' or name.startswith('aice_')]
+    if confM2R.writeice != bool(icevariables):
+        problems.append("the ice variables %s" % ("are missing" if confM2R.writeice else "are not written"))
+
+    if problems:
+        cdf.close()
+        for problem in problems:
+            print("=>Can not append to %s: %s" % (filename, problem))
+        raise ValueError("The file %s does not match the grid and settings of the run" % filename)
+
+    records = len(cdf.dimensions['ocean_time'])
+    lastdate = None
+    if records > 0:
+        timevariable = cdf.variables['ocean_time']
+        lastdate = num2date(timevariable[records - 1], units=timevariable.units,
+                            calendar=getattr(timevariable, 'calendar', 'standard'))
+    cdf.close()
+
+    return records, lastdate
+
+
+def setupappend(confM2R, gridconfs, dates):
+    """
+    Find the time steps of the run (dates) that come after the last record of the existing files and set
+    confM2R.firsttime, confM2R.lasttime and the record the first new time step is written to
+    (confM2R.recordoffset). The existing files are opened for writing instead of created again.
+    """
+    existing = []
+    for gridconf in gridconfs:
+        filename = gridconf.bryname if confM2R.bryonly else gridconf.climname
+        if os.path.exists(filename):
+            existing.append(validatefile(gridconf, filename))
+        else:
+            existing.append((0, None))
+
+    if len(set([records for records, lastdate in existing])) > 1:
+        raise ValueError("The files of the output grids have different numbers of records and can not be appended to")
+    records, lastdate = existing[0]
+
+    confM2R.firsttime, confM2R.lasttime, confM2R.recordoffset = 0, len(dates), records
+    if lastdate is not None:
+        last = (lastdate.year, lastdate.month, lastdate.day)
+        confM2R.firsttime = len([date for date in dates if tuple(date) <= last])
+        for gridconf in gridconfs:
+            gridconf.grdROMS.ioClimInitialized = True
+
+    print("=>Appending %s time steps after record %s (%s)" % (confM2R.lasttime - confM2R.firsttime, records,
+                                                              lastdate))
+    return records > 0
@@ -26,9 +26,26 @@ def help():
     """
 
 
-def createinitfile(confM2R, ntime, var, data1=None, data2=None, data3=None, data4=None):
+def createinitfile(confM2R, ntime, var, data1=None, data2=None, data3=None, data4=None, rows=None):
     # Create initial file for use with ROMS. This is the same as extracting time 0 from
     # the climatology file.
+    f1 = openinitfile(confM2R)
+    writeinitvariable(confM2R, f1, var, data1, data2, data3, data4, rows=rows)
+    f1.close()
+
+
+def writeinitfields(confM2R, results):
+    # Write all variables in one open of the INIT file. results is a list of (var, [data1, data2, ...]) as
+    # returned for one target by model2roms.convertvariables
+    f1 = openinitfile(confM2R)
+    for var, fields in results:
+        if fields:
+            writeinitvariable(confM2R, f1, var, *fields)
+    f1.close()
+
+
+def openinitfile(confM2R):
+    # Create the INIT file the first time it is opened, and open it for writing
     if (confM2R.myformat == 'NETCDF4'):
         myzlib = True
     else:
@@ -385,6 +402,18 @@ def createinitfile(confM2R, ntime, var, data1=None, data2=None, data3=None, data
     else:
         f1 = Dataset(confM2R.initname, mode='a', format=confM2R.myformat)
 
+    return f1
+
+
+def writeinitvariable(confM2R, f1, var, data1=None, data2=None, data3=None, data4=None, rows=None):
+    grdROMS = confM2R.grdROMS
+
+    # Only the eta rows given by rows are written when the grid is processed in tiles (tilerows in configM2R.py)
+    if rows is None:
+        rows = vrows = slice(None)
+    else:
+        vrows = slice(rows.start, min(rows.stop, grdROMS.eta_v))
+
     ntime = 0
     if (grdROMS.timeunits[0:7] == "seconds"):
         f1.variables['ocean_time'][ntime] = grdROMS.time
@@ -392,53 +421,84 @@ def createinitfile(confM2R, ntime, var, data1=None, data2=None, data3=None, data
         f1.variables['ocean_time'][ntime] = grdROMS.time * 86400.0
 
     if var.lower() == 'temperature':
-        f1.variables['temp'][ntime, :, :, :] = data1
+        f1.variables['temp'][ntime, :, rows, :] = data1
         if confM2R.writeice:
-            f1.variables['t0mk'][ntime, :, :] = np.squeeze(data1[len(grdROMS.z_r) - 1, :, :])
+            f1.variables['t0mk'][ntime, rows, :] = np.squeeze(data1[len(grdROMS.z_r) - 1, :, :])
     if var.lower() == 'salinity':
-        f1.variables['salt'][ntime, :, :, :] = data1
+        f1.variables['salt'][ntime, :, rows, :] = data1
         if confM2R.writeice:
-            f1.variables['s0mk'][ntime, :, :] = np.squeeze(data1[len(grdROMS.z_r) - 1, :, :])
+            f1.variables['s0mk'][ntime, rows, :] = np.squeeze(data1[len(grdROMS.z_r) - 1, :, :])
 
     if var.lower() == 'ssh':
-        f1.variables['zeta'][ntime, :, :] = data1
+        f1.variables['zeta'][ntime, rows, :] = data1
     if var in ['uvel', 'vvel', 'ubar', 'vbar']:
-        f1.variables['u'][ntime, :, :, :] = data1
-        f1.variables['v'][ntime, :, :, :] = data2
-        f1.variables['ubar'][ntime, :, :] = data3
-        f1.variables['vbar'][ntime, :, :] = data4
+        f1.variables['u'][ntime, :, rows, :] = data1
+        f1.variables['v'][ntime, :, vrows, :] = data2
+        f1.variables['ubar'][ntime, rows, :] = data3
+        f1.variables['vbar'][ntime, vrows, :] = data4
 
     if confM2R.writeice:
         if var.lower() == "ageice":
             data1 = np.where(abs(data1) > 120, 0, data1)
-            f1.variables['ageice'][ntime, :, :] = data1
+            f1.variables['ageice'][ntime, rows, :] = data1
 
         if var.lower() in ['uice', 'vice']:
             data1 = np.where(abs(data1) > 120, 0, data1)
-            f1.variables[var.lower()][ntime, :, :] = data1 / 100.
+            f1.variables[var.lower()][ntime, vrows if var.lower() == 'vice' else rows, :] = data1 / 100.
 
         if var.lower() == 'aice':
             data1 = np.where(abs(data1) > 120, 0, data1)
-            f1.variables['aice'][ntime, :, :] = data1 / 100.
-            f1.variables['sfwat'][ntime, :, :] = 0.
-            f1.variables['tisrf'][ntime, :, :] = 0.
-            f1.variables['ti'][ntime, :, :] = 0.
-            f1.variables['sig11'][ntime, :, :] = 0.
-            f1.variables['sig12'][ntime, :, :] = 0.
-            f1.variables['sig22'][ntime, :, :] = 0.
-
-            if mytype == 'GLORYS':
-                f1.variables['snow_thick'][ntime, :, :] = 0.
-                f1.variables['ageice'][ntime, :, :] = 0.
+            f1.variables['aice'][ntime, rows, :] = data1 / 100.
+            f1.variables['sfwat'][ntime, rows, :] = 0.
+            f1.variables['tisrf'][ntime, rows, :] = 0.
+            f1.variables['ti'][ntime, rows, :] = 0.
+            f1.variables['sig11'][ntime, rows, :] = 0.
+            f1.variables['sig12'][ntime, rows, :] = 0.
+            f1.variables['sig22'][ntime, rows, :] = 0.
+
+            if confM2R.indatatype == 'GLORYS':
+                f1.variables['snow_thick'][ntime, rows, :] = 0.
+                f1.variables['ageice'][ntime, rows, :] = 0.
 
         if var.lower() == 'hice':
             data1 = np.where(abs(data1) > 10, 0, data1)
-            f1.variables['hice'][ntime, :, :] = data1
+            f1.variables['hice'][ntime, rows, :] = data1
         if var.lower() == 'snow_thick':
             data1 = np.where(abs(data1) > 100, 0, data1)
-            f1.variables['snow_thick'][ntime, :, :] = data1
+            f1.variables['snow_thick'][ntime, rows, :] = data1
 
         f1.variables['tau_iw'] = 0.015
         f1.variables['chu_iw'] = 0.0012
 
+
+def extractinitfromclim(confM2R, year, month, day):
+    """
+    Create the INIT file from the record of the existing CLIM file (confM2R.climname) for the date. All variables
+    of the INIT file that are also in the CLIM file are copied in one open of each file.
+    """
+    clim = Dataset(confM2R.climname)
+    climtime = clim.variables['ocean_time']
+    dates = num2date(climtime[:], units=climtime.units, calendar=getattr(climtime, 'calendar', 'standard'))
+    records = [record for record, date in enumerate(dates) if (date.year, date.month, date.day) == (year, month, day)]
+    if not records:
+        clim.close()
+        raise ValueError("Could not find %04d-%02d-%02d in %s" % (year, month, day, confM2R.climname))
+
+    grdROMS = confM2R.grdROMS
+    grdROMS.time = float(climtime[records[0]])
+    grdROMS.timeunits = climtime.units
+    print("=>Extracting INIT file for %s from record %s of %s" % (dates[records[0]], records[0], confM2R.climname))
+
+    f1 = openinitfile(confM2R)
+    f1.variables['ocean_time'][0] = grdROMS.time
+    for name, variable in f1.variables.items():
+        if name != 'ocean_time' and variable.dimensions[0:1] == ('ocean_time',) and name in clim.variables:
+            variable[0] = clim.variables[name][records[0]]
+
+    # The ice model uses the surface temperature and salinity
+    if confM2R.writeice:
+        f1.variables['t0mk'][0] = clim.variables['temp'][records[0], len(grdROMS.z_r) - 1]
+        f1.variables['s0mk'][0] = clim.variables['salt'][records[0], len(grdROMS.z_r) - 1]
+
     f1.close()
+    clim.close()
@@ -0,0 +1,112 @@
+from __future__ import print_function
+import os
+import numpy as np
+from netCDF4 import Dataset, num2date
+
+import IOappend
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Patch mode (patchmode in configM2R.py): convert only the variables in patchvariables for the dates in
+    patchdates again and overwrite their records in the existing CLIM file (BRY file for bryonly), e.g. after
+    the input data of one variable have been corrected. The other variables and records are not touched.
+
+    The records of the dates are found from ocean_time of the existing file, which is checked against the ROMS
+    grid of the run as in append mode (IOappend.py). uvel and vvel are always converted together since the
+    velocities are rotated to the ROMS grid. clim2bry.patchbry then only copies the boundary sections of the
+    patched CLIM variables and records to the BRY file.
+    """
+
+
+# The CLIM variables written by IOwrite.writeclimfile for each variable of model2roms
+CLIMVARIABLES = {'temperature': ['temp'],
+                 'salinity': ['salt'],
+                 'ssh': ['zeta'],
+                 'uvel': ['u', 'v', 'ubar', 'vbar'],
+                 'vvel': ['u', 'v', 'ubar', 'vbar'],
+                 'ageice': ['ageice'],
+                 'uice': ['uice', 'sfwat', 'tisrf', 'ti', 'sig11', 'sig12', 'sig22'],
+                 'vice': ['vice'],
+                 'aice': ['aice'],
+                 'hice': ['hice'],
+                 'snow_thick': ['snow_thick']}
+
+ICEVARIABLES = ['ageice', 'uice', 'vice', 'aice', 'hice', 'snow_thick']
+
+
+def patchvariables(confM2R):
+    # The variables to convert in the order of globalvarnames. uvel and vvel are converted together.
+    myvars = list(confM2R.patchvariables)
+    if 'uvel' in myvars or 'vvel' in myvars:
+        myvars.extend(['uvel', 'vvel'])
+
+    unknown = [myvar for myvar in myvars if myvar not in confM2R.globalvarnames]
+    if unknown:
+        raise ValueError("The patch variables %s are not in globalvarnames" % unknown)
+    return [myvar for myvar in confM2R.globalvarnames if myvar in myvars]
+
+
+def climvariables(confM2R, myvars):
+    # The CLIM (and BRY) variables that are changed when myvars are written
+    names = []
+    for myvar in myvars:
+        if myvar in ICEVARIABLES and not confM2R.writeice:
+            continue
+        names.extend(CLIMVARIABLES[myvar])
+        if myvar == 'uice' and confM2R.indatatype == 'GLORYS':
+            names.extend(['ageice', 'snow_thick'])
+    return [name for n, name in enumerate(names) if name not in names[0:n]]
+
+
+def recorddates(filename):
+    # The date (year, month, day) of each record of the existing file
+    cdf = Dataset(filename)
+    timevariable = cdf.variables['ocean_time']
+    dates = np.atleast_1d(num2date(timevariable[:], units=timevariable.units,
+                                   calendar=getattr(timevariable, 'calendar', 'standard')))
+    cdf.close()
+    return [(date.year, date.month, date.day) for date in dates]
+
+
+def setuppatch(confM2R, gridconfs, dates):
+    """
+    Find the time steps of the run (dates) within patchdates and the records of the existing files they are
+    written to. Sets confM2R.firsttime, confM2R.lasttime and confM2R.recordoffset as in append mode and stores
+    the records in confM2R.patchrecords. The existing files are opened for writing and the INIT file is not
+    written.
+    """
+    first, last = [tuple(date) for date in confM2R.patchdates]
+    steps = [time for time, date in enumerate(dates) if first <= tuple(date) <= last]
+    if not steps:
+        raise ValueError("No time steps of the run are within the patch dates %s to %s" % (first, last))
+
+    records = None
+    for gridconf in gridconfs:
+        filename = gridconf.bryname if confM2R.bryonly else gridconf.climname
+        if not os.path.exists(filename):
+            raise IOError("The file %s to patch does not exist" % filename)
+        IOappend.validatefile(gridconf, filename)
+
+        filedates = recorddates(filename)
+        missing = [tuple(dates[time]) for time in steps if tuple(dates[time]) not in filedates]
+        if missing:
+            raise ValueError("The dates %s are not in %s" % (missing, filename))
+        gridrecords = [filedates.index(tuple(dates[time])) for time in steps]
+        if gridrecords != list(range(gridrecords[0], gridrecords[0] + len(steps))):
+            raise ValueError("The records of the patch dates in %s are not consecutive" % filename)
+        if records is not None and gridrecords != records:
+            raise ValueError("The files of the output grids have different records for the patch dates")
+        records = gridrecords
+
+        gridconf.grdROMS.ioClimInitialized = True
+        gridconf.grdROMS.write_init = False
+
+    confM2R.firsttime, confM2R.lasttime, confM2R.recordoffset = steps[0], steps[-1] + 1, records[0]
+    confM2R.patchrecords = records
+
+    print("=>Patching %s in records %s to %s (%s to %s)" % (", ".join(patchvariables(confM2R)), records[0],
+                                                         records[-1], first, last))
@@ -1,7 +1,9 @@
 
 import datetime
+import os
 import numpy as np
 import grd
+import spatialIndex
 import IOverticalGrid
 from netCDF4 import Dataset
 import time
@@ -95,48 +97,85 @@ def getStationTime(grdMODEL,year,ID):
     
     return jdsoda-jdref, yyyymmdd, message
 
-def testValidStation(cdf,dis,numberOfPoints,gridIndexes):
-    validIndex=[]; validDis=[]
-    for i in range(numberOfPoints):
-        latindex=int(gridIndexes[i][0])
-        lonindex=int(gridIndexes[i][1])
-        
-        """Test to see if station contains anything but missing values. If it does, we assume
-        this holds for salinity, u, and v as well. We also assume all values less than 10000"""
-        if any(abs(cdf.variables["TEMP"][0,:,latindex,lonindex])< 10000):
-            validIndex.append(i)
-            validDis.append(dis[i])
-  
-    if not validIndex:
+def createReadPlan(gridJ,gridI):
+    """Decide how the grid points gridJ, gridI (stations, numberOfPoints) are read from each file.
+
+    One orthogonal read at the (sorted) unique eta and xi indices of all points is a single call to the
+    netCDF library, but it reads the whole cross-product of those rows and columns. For stations spread
+    across the domain that is close to a full field. One read of the bounding box of each station reads only
+    a few points per station, but costs one call (and chunk lookup) per station. The orthogonal read is used
+    when its cross-product is at most twice the total size of the boxes (clustered stations), the boxes
+    otherwise."""
+    uniqueJ, pointJ = np.unique(gridJ, return_inverse=True)
+    uniqueI, pointI = np.unique(gridI, return_inverse=True)
+    pointJ = np.reshape(pointJ, gridJ.shape); pointI = np.reshape(pointI, gridI.shape)
+
+    boxes = [(j.min(),j.max()+1,i.min(),i.max()+1) for j,i in zip(gridJ,gridI)]
+    boxPoints = sum([(j1-j0)*(i1-i0) for j0,j1,i0,i1 in boxes])
+
+    if len(uniqueJ)*len(uniqueI) <= 2*boxPoints:
+        print('Reading the station points in one read of %s x %s grid points'%(len(uniqueJ),len(uniqueI)))
+        return ('orthogonal', uniqueJ, uniqueI, pointJ, pointI)
+    print('Reading the station points in %s reads of %s grid points in total'%(len(boxes),boxPoints))
+    return ('boxes', boxes, gridJ, gridI)
+
+def getStationPoints(cdf,name,t,levels,plan):
+    """Read variable name at time step t for the grid points of all stations as given by plan (see
+    createReadPlan). Returns (levels, stations, numberOfPoints) for 3D variables and (stations,
+    numberOfPoints) for 2D variables (levels is None). Land and missing values (above 10000) are masked."""
+    variable = cdf.variables[name]
+    if plan[0] == 'orthogonal':
+        mode, uniqueJ, uniqueI, pointJ, pointI = plan
+        if levels is None:
+            data = np.ma.asarray(variable[t,uniqueJ,uniqueI])[pointJ,pointI]
+        else:
+            data = np.ma.asarray(variable[t,levels,uniqueJ,uniqueI])[:,pointJ,pointI]
+    else:
+        mode, boxes, gridJ, gridI = plan
+        stations = []
+        for (j0,j1,i0,i1), j, i in zip(boxes,gridJ,gridI):
+            if levels is None:
+                stations.append(np.ma.asarray(variable[t,j0:j1,i0:i1])[j-j0,i-i0])
+            else:
+                stations.append(np.ma.asarray(variable[t,levels,j0:j1,i0:i1])[:,j-j0,i-i0])
+        data = np.ma.stack(stations, axis=-2)
+    return np.ma.masked_where(np.abs(np.ma.getdata(data)) >= 10000, data)
+
+def getStationAverage(data,weights):
+    """Weighted average of the points of each station (last axis of data) using only the points that are not
+    masked at that level, so that land points never pull the value of a coastal station towards 0"""
+    weights = np.where(np.ma.getmaskarray(data), 0.0, weights)
+    total = np.sum(weights, axis=-1)
+    average = np.sum(np.ma.filled(data,0.0)*weights, axis=-1)/np.where(total > 0, total, 1.0)
+    return np.where(total > 0, average, 0.0)
+
+def testValidStation(temp,dis):
+    """Test to see if the grid points of each station contain anything but missing values. If they do, we assume
+    this holds for salinity, u, and v as well. We also assume all values less than 10000. temp is the first
+    temperature record at the points of all stations (levels, stations, numberOfPoints). Returns the weights of
+    the valid points of each station (relative distance to the total distance of the valid points)"""
+    valid = np.any(~np.ma.getmaskarray(temp), axis=0)
+
+    if not np.all(np.any(valid, axis=1)):
         print('No valid data found for position')
         exit()
-    print(("Found %s valid surounding grid cells for station"%(len(validIndex))))
-    return validIndex, validDis
+    print(("Found %s valid surounding grid cells for the stations"%(np.sum(valid, axis=1))))
 
-def testValidDepth(cdf,numberOfPoints,gridIndexes,depth):
+    dis = np.where(valid, dis, 0.0)
+    return dis / np.sum(dis, axis=1)[:,np.newaxis]
+
+def testValidDepth(temp,depth):
     """To avoid having to extract all depth layers that do not
-    contain valid data, we find the deepest depth layer of the surrouding stations
+    contain valid data, we find the deepest depth layer of the surrouding points of each station
     and use that indices in the further extration"""
-    deepestMax=40 # The deepes soda depth is 40
-    deepest=0
-    for i in range(numberOfPoints):
-        latindex=int(gridIndexes[i][0])
-        lonindex=int(gridIndexes[i][1])
-        
-        """Test to see how many depth layers we should extract. We do not want layers
-        that only contain missing values"""
-        d = cdf.variables["TEMP"][0,:,latindex,lonindex]
-        for k in range(len(d)):
-            if abs(d[k]) < 1000:
-                """One of the other stations may have values valid at
-                deeper stations than this one. Make sure we find absolute deepest"""
-                #if k>deepest:
-                deepest=k
-       
-    print(("Found deepest valid depth-layer %s which is equivavelnt to %sm\n" %(deepest+1, depth[deepest+1])))
+    validLevels = np.any(~np.ma.getmaskarray(temp) & (np.abs(np.ma.getdata(temp)) < 1000), axis=2)
+    deepest = np.array([np.max(np.nonzero(validLevels[:,s])[0]) for s in range(temp.shape[1])])
+
+    for d in deepest:
+        print(("Found deepest valid depth-layer %s which is equivavelnt to %sm\n" %(d+1, depth[d+1])))
     """Now we return deepest + 1 as the index is one value more than the counter"""
-    return deepest      
-    
+    return deepest
+
 def initArrays(years,IDS,deepest,name,lon,lat):
     index=(len(years)*len(IDS),deepest)
     indexSSH=(len(years)*len(IDS))
@@ -154,151 +193,132 @@ def initArrays(years,IDS,deepest,name,lon,lat):
     
     return stTemp, stSalt, stSSH, stUvel, stVvel, stTauX, stTauY
 
-def getStationData(years,IDS,sodapath,latlist,lonlist,stationNames):
+def getStationData(years,IDS,sodapath,latlist,lonlist,stationNames,cachedir="cache"):
 
     fileNameIn=sodapath+'SODA_2.0.2_'+str(years[0])+'_'+str(IDS[0])+'.cdf'
-    
+
     """First time in loop, get the essential old grid information"""
     """SODA data already at Z-levels. No need to interpolate to fixed depths, but we use the one we have"""
-    
+
     grdMODEL = grd.grdClass(fileNameIn,"SODA")
     IOverticalGrid.get_z_levels(grdMODEL)
-    
-    station=0
+
     numberOfPoints=4
-   
-    for lat, lon in zip(latlist, lonlist):
-        print(('\n----------------NEW STATION==> %s ------------------------------------------'%(stationNames[station])))
-     
-        """Now we want to find the indices for our longitude, latitude station pairs in the lat-long list"""
-        gridIndexes, dis = getStationIndices(grdMODEL,lon,lat,'SODA',numberOfPoints)
-    
-        stTime=[]; stDate=[]; time=0; counter=0; t=0
-        total=float(len(years)*len(IDS))
-        import progressbar
-        progress = progressbar.ProgressBar(widgets=[Percentage(), Bar()], maxval=total).start()
-
-        for year in years:
-            for ID in IDS:
-                file="SODA_2.0.2_"+str(year)+"_"+str(ID)+".cdf"
-                filename=sodapath+file
-               
-                jdsoda, yyyymmdd, message = getStationTime(grdMODEL,year,ID)
-                
-                stTime.append(jdsoda)
-                stDate.append(yyyymmdd)
-               
-                cdf = Dataset(filename,'r')
- 
-                """Each SODA file consist only of one time step. Get the subset data selected, and
-                store that time step in a new array:"""
-                if year==years[0] and ID==IDS[0]:
-                    validIndex, validDis = testValidStation(cdf,dis,numberOfPoints, gridIndexes)
-                    deepest              = testValidDepth(cdf,numberOfPoints, gridIndexes,grdMODEL.depth)
-                    stTemp, stSalt, stSSH, stUvel, stVvel, stTauX, stTauY = initArrays(years,IDS,deepest,stationNames[station],lon,lat)
-                
-                for i in validIndex:
-                    wgt=float(validDis[i])/sum(validDis)
-                    latindex=int(gridIndexes[i][0])
-                    lonindex=int(gridIndexes[i][1])
-                    
-                    """The values at a station is calculated by interpolating from the
-                    numberOfPoints around the station uysing weights (wgt)
-                    """
-                    stTemp[time,:] = stTemp[time,:] + (cdf.variables["TEMP"][t,0:deepest,latindex,lonindex])*wgt
-                    stSalt[time,:] = stSalt[time,:] + (cdf.variables["SALT"][t,0:deepest,latindex,lonindex])*wgt
-                    stSSH[time]    = stSSH[time]    + (cdf.variables["SSH"][t,latindex,lonindex])*wgt
-                    stTauX[time]    = stTauX[time]    + (cdf.variables["TAUX"][t,latindex,lonindex])*wgt
-                    stTauY[time]    = stTauY[time]    + (cdf.variables["TAUY"][t,latindex,lonindex])*wgt
-                    stUvel[time,:] = stUvel[time,:] + (cdf.variables["U"][t,0:deepest,latindex,lonindex])*wgt
-                    stVvel[time,:] = stVvel[time,:] + (cdf.variables["V"][t,0:deepest,latindex,lonindex])*wgt
-                 
-                cdf.close()
-                counter+=1
-
-                progress.update(time)
-                time+=1
+    numberOfStations=len(latlist)
 
-        
+    """Now we want to find the indices for all our longitude, latitude station pairs in the lat-long list.
+    The spatial index of the SODA grid is stored in cachedir and reused by the next run"""
+    allGridIndexes, allDis = getStationIndices(grdMODEL,np.atleast_1d(lonlist),np.atleast_1d(latlist),'SODA',numberOfPoints,cachedir)
+    if numberOfStations==1:
+        allGridIndexes=[allGridIndexes]; allDis=[allDis]
+
+    """All points of all stations are read together from each file, either in one orthogonal read or one
+    read of the bounding box of each station (see createReadPlan)"""
+    gridJ = np.array([[int(index[i][0]) for i in range(numberOfPoints)] for index in allGridIndexes])
+    gridI = np.array([[int(index[i][1]) for i in range(numberOfPoints)] for index in allGridIndexes])
+    plan = createReadPlan(gridJ, gridI)
+
+    stTime=[]; stDate=[]; time=0; t=0
+    total=float(len(years)*len(IDS))
+    import progressbar
+    progress = progressbar.ProgressBar(widgets=[progressbar.Percentage(), progressbar.Bar()], maxval=total).start()
+
+    for year in years:
+        for ID in IDS:
+            file="SODA_2.0.2_"+str(year)+"_"+str(ID)+".cdf"
+            filename=sodapath+file
+
+            jdsoda, yyyymmdd, message = getStationTime(grdMODEL,year,ID)
+
+            stTime.append(jdsoda)
+            stDate.append(yyyymmdd)
+
+            cdf = Dataset(filename,'r')
+
+            """Each SODA file consist only of one time step. Get the subset data selected, and
+            store that time step in a new array for each station:"""
+            if year==years[0] and ID==IDS[0]:
+                temp = getStationPoints(cdf,"TEMP",0,slice(None),plan)
+                weights = testValidStation(temp,np.asarray(allDis))
+                deepest = testValidDepth(temp,grdMODEL.depth)
+                levels = slice(0,np.max(deepest))
+                stations = [initArrays(years,IDS,deepest[s],stationNames[s],lonlist[s],latlist[s]) for s in range(numberOfStations)]
+
+            """The values at a station is calculated by interpolating from the
+            numberOfPoints around the station using weights"""
+            for n, (name, is3d) in enumerate([("TEMP",True),("SALT",True),("SSH",False),("U",True),("V",True),
+                                              ("TAUX",False),("TAUY",False)]):
+                if is3d:
+                    data = getStationPoints(cdf,name,t,levels,plan)
+                    data = getStationAverage(data, weights[np.newaxis,:,:])
+                    for s in range(numberOfStations):
+                        stations[s][n][time,:] = data[0:deepest[s],s]
+                else:
+                    data = getStationPoints(cdf,name,t,None,plan)
+                    data = getStationAverage(data, weights)
+                    for s in range(numberOfStations):
+                        stations[s][n][time] = data[s]
+
+            cdf.close()
+
+            progress.update(time)
+            time+=1
+
+    for station in range(numberOfStations):
         print(('Total time steps saved to file %s for station %s'%(time,station)))
         #plotData.contourStationData(stTemp,stTime,stDate,-grdMODEL.depth[0:deepest],stationNames[station])
-        
+
+        stTemp, stSalt, stSSH, stUvel, stVvel, stTauX, stTauY = stations[station]
         outfilename='station_'+str(stationNames[station])+'.nc'
         print(('Results saved to file %s'%(outfilename)))
         writeStationNETCDF4(stTemp,stSalt,stUvel,stVvel,stSSH,stTauX,stTauY,stTime,
-                            grdMODEL.depth[0:deepest],lat,lon,outfilename)
-        station+=1
-    
-def getStationIndices(grdObject,st_lon,st_lat,type,numberOfPoints):
+                            grdMODEL.depth[0:deepest[station]],latlist[station],lonlist[station],outfilename)
+
+def getStationIndices(grdObject,st_lon,st_lat,type,numberOfPoints,cachedir=None):
     """
     This is a function that takes longitude and latitude as
-    decimal input, and returns the index values closest to
-    the longitude and latitude. This is an iterative process for finding the best
-    index pair. Trond Kristiansen, 11.03.2008, 09.06.2009
+    decimal input (scalars or arrays of station positions), and returns the index values closest to
+    the longitude and latitude. The closest numberOfPoints grid points of all stations are found in
+    one query of the spatial index of the grid (spatialIndex.py), which is created the first time and
+    stored on the grid object for each type of coordinates (and in cachedir if given, in a file named after
+    the type and the grid coordinates). Trond Kristiansen, 11.03.2008, 09.06.2009
     """
-    if st_lon<0: st_lon=st_lon+360.0; NEG=True
-    else: NEG=False
-    
     if type=='SODA' or type=='AVERAGE':
         longitude=grdObject.lon
         latitude =grdObject.lat
         """Input longitude should go from 0-360"""
         longitude=np.where(longitude<0,longitude+360,longitude)
+        st_lon=np.where(np.asarray(st_lon)<0,np.asarray(st_lon)+360.0,st_lon)
     if type=='ROMS':
         longitude=grdObject.lon_rho
-        latitude =grdObject.lat_rho 
-    
-    distance = np.zeros((longitude.shape),dtype=np.float64)
-    listd=[]
-    """First, create a list of distances from the station of interest, while
-    also save the matrix of dostances that contains the info to get the index pair that the distance
-    of interest corresponds to"""
-    for eta in range(len(latitude[:,0])):
-        for xi in range(len(latitude[0,:])):
-            distance[eta,xi] = np.sqrt( (latitude[eta,xi]-st_lat)**2.0 + (longitude[eta, xi] - st_lon)**2.0 )
-            listd.append(distance[eta,xi])
-
-    listsIndexes=[]
-    listd.sort()
-    
-    """Now find the closest point to the station. When that point is found, remove the
-    closests pooint and find the next closests point, until you have found numberOfPoints
-    closests to station.
-    """
-    for i in range(numberOfPoints):
-        value=listd[0]
-        itemindex=np.where(distance==value)
-        listsIndexes.append(itemindex)
-       
-        listd.pop(0)
-  
-    print('') 
-    print('=====getStationIndices======')
-    if NEG is True:
-        print(('Looking for longitude [%3.3f] and latitude [%3.3f]'%(st_lon-360,st_lat)))
-    else:
-        print(('Looking for longitude [%3.3f] and latitude [%3.3f]'%(st_lon,st_lat)))
-    print('Result ===> ')
-    for i in range(numberOfPoints):
-        print(('Found index pair in gridfile',listsIndexes[i]))
-        if NEG is True:
-            print(('Index corresponds to longitude [%3.3f] and latitude [%3.3f]'%(longitude[listsIndexes[i][0],listsIndexes[i][1]]-360,latitude[listsIndexes[i][0],listsIndexes[i][1]])))
-        else:
-            print(('Index corresponds to longitude [%3.3f] and latitude [%3.3f]'%(longitude[listsIndexes[i][0],listsIndexes[i][1]],latitude[listsIndexes[i][0],listsIndexes[i][1]])))
-    print('======================')
-    print('')
-      
+        latitude =grdObject.lat_rho
+
+    """SODA (and AVERAGE) use lon/lat shifted to 0-360 and ROMS lon_rho/lat_rho, so one index is kept per type"""
+    if getattr(grdObject,'spatialindex',None) is None:
+        grdObject.spatialindex = {}
+    if type not in grdObject.spatialindex:
+        grdObject.spatialindex[type] = spatialIndex.SpatialIndex(longitude,latitude,cachedir,type)
+
+    jj, ii, distance = grdObject.spatialindex[type].query(st_lon,st_lat,numberOfPoints)
+
     """
     We want to use data interpolated from the 4 surrounding points to get appropriate values at station point.
     We do this by using relative weights determined by relative distance to total distance from all 4 points.
+    The distances are in the same units (degrees) as before so that the weights are unchanged.
     Trond Kristiansen, 09.06.2009
     """
-    dis=[]
-    
-    for i in range(numberOfPoints):
-        dis.append(np.sqrt( (latitude[listsIndexes[i][0],listsIndexes[i][1]]-st_lat)**2.0 + (longitude[listsIndexes[i][0],listsIndexes[i][1]] - st_lon)**2.0 ))
-        
-    return listsIndexes, dis
+    st_lon=np.reshape(st_lon,(-1,1)); st_lat=np.reshape(st_lat,(-1,1))
+    dis=np.sqrt( (latitude[jj,ii]-st_lat)**2.0 + (longitude[jj,ii] - st_lon)**2.0 )
+
+    print('')
+    print('=====getStationIndices======')
+    print(('Found the %s closest grid points for %s stations'%(numberOfPoints,len(dis))))
+    print('======================')
+    print('')
+
+    if len(dis)==1:
+        return np.column_stack((jj[0],ii[0])), list(dis[0])
+    return [np.column_stack((j,i)) for j,i in zip(jj,ii)], [list(d) for d in dis]
 
 
 
@@ -274,14 +274,37 @@ class s_coordinate_4(s_coordinate):
             self.Cs_w = Csur
 
 
+def sdepth(h, hc, s, Cs, zeta, Vtrans):
+    """
+    Depths of the s-levels s (with stretching Cs) for the bathymetry h and free surface zeta (ti, ...) using
+    broadcasting. s and Cs are either one level (scalars) or 1D arrays of levels. Returns an array (ti, ...)
+    for one level or (ti, levels, ...) for an array of levels. The result has the precision of the inputs.
+    """
+    if np.ndim(s) == 1:
+        s = np.reshape(s, (-1,) + (1,) * np.ndim(h))
+        Cs = np.reshape(Cs, s.shape)
+        zeta = zeta[:, np.newaxis]
+
+    if Vtrans == 1:
+        z0 = hc * s + (h - hc) * Cs
+        return z0 + zeta * (1.0 + z0 / h)
+    elif Vtrans == 2 or Vtrans == 4:
+        z0 = (hc * s + h * Cs) / (hc + h)
+        return zeta + (zeta + h) * z0
+
+
 class z_r(object):
     """
     return an object that can be indexed to return depths of rho point
 
     z_r = z_r(h, hc, N, s_rho, Cs_r, zeta, Vtrans)
+
+    Only the time steps, levels, and points selected by the index are calculated (see depthslice) so that
+    e.g. z_r[n, k, :, :] or z_r[:, :, j, i] do not create the full (ti, N, eta, xi) array. With dtype='f' the
+    depths are calculated in single precision.
     """
 
-    def __init__(self, h, hc, N, s_rho, Cs_r, zeta, Vtrans):
+    def __init__(self, h, hc, N, s_rho, Cs_r, zeta, Vtrans, dtype='d'):
         self.h = h
         self.hc = hc
         self.N = N
@@ -289,37 +312,10 @@ class z_r(object):
         self.Cs_r = Cs_r
         self.zeta = zeta
         self.Vtrans = Vtrans
+        self.dtype = dtype
 
     def __getitem__(self, key):
-
-        if isinstance(key, tuple) and len(self.zeta.shape) > len(self.h.shape):
-            zeta = self.zeta[key[0]]
-            res_index = (slice(None),) + key[1:]
-        elif len(self.zeta.shape) > len(self.h.shape):
-            zeta = self.zeta[key]
-            res_index = slice(None)
-        else:
-            zeta = self.zeta
-            res_index = key
-     
-        if self.h.ndim == zeta.ndim:       # Assure a time-dimension exists
-            zeta = zeta[np.newaxis, :]
-        
-        ti = zeta.shape[0]
-        z_r = np.empty((ti, self.N) + self.h.shape, 'd')
-        if self.Vtrans == 1:
-            for n in range(ti):
-                for  k in range(self.N):
-                    z0 = self.hc * self.s_rho[k] + (self.h - self.hc) * self.Cs_r[k]
-                    z_r[n,k,:] = z0 + zeta[n,:] * (1.0 + z0 / self.h)
-        elif self.Vtrans == 2 or self.Vtrans == 4:
-            for n in range(ti):
-                for  k in range(self.N):
-                    z0 = (self.hc * self.s_rho[k] + self.h * self.Cs_r[k]) / \
-                          (self.hc + self.h)
-                    z_r[n,k,:] = zeta[n,:] + (zeta[n,:] + self.h) * z0
-
-        return np.squeeze(z_r[res_index])
+        return depthslice(self, key, self.s_rho, self.Cs_r)
 
 
 class z_w(object):
@@ -327,9 +323,11 @@ class z_w(object):
     return an object that can be indexed to return depths of w point
 
     z_w = z_w(h, hc, Np, s_w, Cs_w, zeta, Vtrans)
+
+    Indexed the same way as z_r.
     """
 
-    def __init__(self, h, hc, Np, s_w, Cs_w, zeta, Vtrans):
+    def __init__(self, h, hc, Np, s_w, Cs_w, zeta, Vtrans, dtype='d'):
         self.h = h
         self.hc = hc
         self.Np = Np
@@ -337,38 +335,68 @@ class z_w(object):
         self.Cs_w = Cs_w
         self.zeta = zeta
         self.Vtrans = Vtrans
+        self.dtype = dtype
 
     def __getitem__(self, key):
+        return depthslice(self, key, self.s_w, self.Cs_w)
 
-        if isinstance(key, tuple) and len(self.zeta.shape) > len(self.h.shape):
-            zeta = self.zeta[key[0]]
-            res_index = (slice(None),) + key[1:]
-        elif len(self.zeta.shape) > len(self.h.shape):
-            zeta = self.zeta[key]
-            res_index = slice(None)
-        else:
-            zeta = self.zeta
-            res_index = key
-     
-        if self.h.ndim == zeta.ndim:       # Assure a time-dimension exists
-            zeta = zeta[np.newaxis, :]
-      
-        ti = zeta.shape[0]
-        z_w = np.empty((ti, self.Np) + self.h.shape, 'd')
-        if self.Vtrans == 1:
-            for n in range(ti):
-                for  k in range(self.Np):
-                    z0 = self.hc * self.s_w[k] + (self.h - self.hc) * self.Cs_w[k]
-                    z_w[n,k,:] = z0 + zeta[n,:] * (1.0 + z0 / self.h)
-        elif self.Vtrans == 2 or self.Vtrans == 4:
-            for n in range(ti):
-                for  k in range(self.Np):
-                    z0 = (self.hc * self.s_w[k] + self.h * self.Cs_w[k]) / \
-                          (self.hc + self.h)
-                    z_w[n,k,:] = zeta[n,:] + (zeta[n,:] + self.h) * z0
-
-        return np.squeeze(z_w[res_index])
 
+def depthslice(zgrid, key, s, Cs):
+    """
+    Index the depths (ti, levels, eta, xi) of the z_r or z_w object zgrid with key. The first index selects
+    the time steps (of zeta if zeta has a time dimension), the second the levels, and the rest the points.
+    Integer and slice indices are applied to the inputs before the depths are calculated. Any other index
+    (index arrays, Ellipsis) is applied after calculating all levels and points.
+    """
+    h = np.asarray(zgrid.h, dtype=zgrid.dtype)
+    zeta = np.asarray(zgrid.zeta, dtype=zgrid.dtype)
+    s = np.asarray(s, dtype=zgrid.dtype)
+    Cs = np.asarray(Cs, dtype=zgrid.dtype)
+    hastime = zeta.ndim > h.ndim
+
+    if not isinstance(key, tuple):
+        key = (key,)
+
+    # Select the time steps of zeta and make sure a time dimension exists
+    if hastime:
+        zeta = zeta[key[0]]
+        key = (slice(None),) + key[1:]
+    if zeta.ndim == h.ndim:
+        zeta = zeta[np.newaxis, :]
+
+    if all(isinstance(index, (int, np.integer, slice)) for index in key):
+        levels = key[1] if len(key) > 1 else slice(None)
+        points = key[2:]
+        z = sdepth(h[points], zgrid.hc, s[levels], Cs[levels], zeta[(slice(None),) + points], zgrid.Vtrans)
+        return np.squeeze(z[key[0]])
+
+    z = sdepth(h, zgrid.hc, s, Cs, zeta, zgrid.Vtrans)
+    return np.squeeze(z[key])
+
+
+def prunesourcelevels(grdMODEL, grdROMS):
+    """
+    Find the input (source) z-levels that can ever be used when the data are vertically interpolated
+    to the ROMS grid (interpolation.f90: dovertinter) and drop the rest from grdMODEL. A ROMS rho point at
+    depth z_r only uses source levels shallower than or equal to z_r, plus the level just below it
+    (linear interpolation and the bottom fill rules). Since the ROMS grid does not change during a run
+    this is calculated once: only the levels down to the deepest z_r of the ROMS grid plus one are
+    read, regridded, and filtered. For a shelf grid with a few hundred meters maximum depth this
+    typically removes most of the levels in e.g. SODA3 (50 levels down to 5000+ m).
+
+    The full set of levels is kept in grdMODEL.nlevelsall.
+    """
+    grdMODEL.nlevelsall = grdMODEL.nlevels
+
+    zmin = np.min(grdROMS.z_r)
+    nused = min(int(np.sum(grdMODEL.z_r >= zmin)) + 1, grdMODEL.nlevels)
+
+    grdMODEL.nlevels = nused
+    grdMODEL.z_r = grdMODEL.z_r[0:nused]
+    grdMODEL.h = grdMODEL.h[0:nused]
+
+    print("--->Deepest ROMS depth is %3.2f m: using %s of %s input depth levels (down to %3.2f m)" % (
+        zmin, nused, grdMODEL.nlevelsall, grdMODEL.z_r[-1]))
 
 
 def get_z_levels(self):
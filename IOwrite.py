@@ -28,7 +28,7 @@ def help():
     """
 
 
-def writeclimfile(confM2R, ntime, myvar, data1=None, data2=None, data3=None, data4=None):
+def writeclimfile(confM2R, ntime, myvar, data1=None, data2=None, data3=None, data4=None, rows=None, cols=None):
     if confM2R.myformat == 'NETCDF4':
         myzlib = True
     else:
@@ -36,6 +36,17 @@ def writeclimfile(confM2R, ntime, myvar, data1=None, data2=None, data3=None, dat
 
     grdROMS = confM2R.grdROMS
 
+    # Only the eta rows given by rows are written when the grid is processed in tiles (tilerows in configM2R.py),
+    # and only the xi columns given by cols for the bands along the boundaries (nudgingwidth in configM2R.py)
+    if rows is None:
+        rows = vrows = slice(None)
+    else:
+        vrows = slice(rows.start, min(rows.stop, grdROMS.eta_v))
+    if cols is None:
+        cols = ucols = slice(None)
+    else:
+        ucols = slice(cols.start, min(cols.stop, grdROMS.xi_u))
+
     if confM2R.grdROMS.ioClimInitialized is False:
         confM2R.grdROMS.ioClimInitialized = True
         if os.path.exists(confM2R.climname):
@@ -434,55 +445,55 @@ def writeclimfile(confM2R, ntime, myvar, data1=None, data2=None, data3=None, dat
             grdROMS.message = d
 
         if myvar == 'temperature':
-            f1.variables['temp'][ntime, :, :, :] = data1
+            f1.variables['temp'][ntime, :, rows, cols] = data1
         if myvar == 'salinity':
-            f1.variables['salt'][ntime, :, :, :] = data1
+            f1.variables['salt'][ntime, :, rows, cols] = data1
         if myvar == 'ssh':
-            f1.variables['zeta'][ntime, :, :] = data1
+            f1.variables['zeta'][ntime, rows, cols] = data1
         if myvar == 'vvel':
-            f1.variables['u'][ntime, :, :, :] = data1
-            f1.variables['v'][ntime, :, :, :] = data2
+            f1.variables['u'][ntime, :, rows, ucols] = data1
+            f1.variables['v'][ntime, :, vrows, cols] = data2
 
-            f1.variables['ubar'][ntime, :, :] = data3
-            f1.variables['vbar'][ntime, :, :] = data4
+            f1.variables['ubar'][ntime, rows, ucols] = data3
+            f1.variables['vbar'][ntime, vrows, cols] = data4
 
         if confM2R.writeice:
             if myvar == "ageice":
                 # print "NOTE! Setting values of ageice to ZERO! (IOWrite.py)"
                 data1 = np.where(abs(data1) > 100, 0, data1)
                 print("AGEICE:", np.min(data1), np.max(data1), np.mean(data1), myvar)
-                f1.variables['ageice'][ntime, :, :] = data1
+                f1.variables['ageice'][ntime, rows, cols] = data1
 
             if myvar == 'uice':
                 data1 = np.where(abs(data1) > 120, 0, data1)
                 print("UICE:", np.min(data1 * 0.01), np.max(data1 * 0.01), np.mean(data1 * 0.01), myvar)
-                f1.variables['uice'][ntime, :, :] = data1 * 0.01  # NorESM is cm/s divide by 100 to get m/s
-                f1.variables['sfwat'][ntime, :, :] = 0.
-                f1.variables['tisrf'][ntime, :, :] = 0.
-                f1.variables['ti'][ntime, :, :] = 0.
-                f1.variables['sig11'][ntime, :, :] = 0.
-                f1.variables['sig12'][ntime, :, :] = 0.
-                f1.variables['sig22'][ntime, :, :] = 0.
+                f1.variables['uice'][ntime, rows, ucols] = data1 * 0.01  # NorESM is cm/s divide by 100 to get m/s
+                f1.variables['sfwat'][ntime, rows, cols] = 0.
+                f1.variables['tisrf'][ntime, rows, cols] = 0.
+                f1.variables['ti'][ntime, rows, cols] = 0.
+                f1.variables['sig11'][ntime, rows, cols] = 0.
+                f1.variables['sig12'][ntime, rows, cols] = 0.
+                f1.variables['sig22'][ntime, rows, cols] = 0.
 
                 if confM2R.indatatype == 'GLORYS':
                     # Special care for GLORYS as dataset does not contain sea ice age and snow thickness
-                    f1.variables['ageice'][ntime, :, :] = 0.
-                    f1.variables['snow_thick'][ntime, :, :] = 0
+                    f1.variables['ageice'][ntime, rows, cols] = 0.
+                    f1.variables['snow_thick'][ntime, rows, cols] = 0
 
             if myvar == 'vice':
                 data1 = np.where(abs(data1) > 120, 0, data1)
-                f1.variables['vice'][ntime, :, :] = data1 * 0.01  # NorESM is cm/s divide by 100 to get m/s
+                f1.variables['vice'][ntime, vrows, cols] = data1 * 0.01  # NorESM is cm/s divide by 100 to get m/s
             if myvar == 'aice':
                 data1 = np.where(abs(data1) > 120, 0, data1)
-                f1.variables['aice'][ntime, :, :] = data1 * 0.01  # NorESM is % divide by 100 to get fraction
+                f1.variables['aice'][ntime, rows, cols] = data1 * 0.01  # NorESM is % divide by 100 to get fraction
             if myvar == 'hice':
                 data1 = np.where(abs(data1) > 10, 0, data1)
                 # data1 = np.ma.masked_where(abs(data1) > 10, data1)
-                f1.variables['hice'][ntime, :, :] = data1
+                f1.variables['hice'][ntime, rows, cols] = data1
             if myvar == 'snow_thick':
                 # data1 = np.ma.masked_where(abs(data1) > 100, data1)
                 data1 = np.where(abs(data1) > 10, 0, data1)
-                f1.variables['snow_thick'][ntime, :, :] = data1
+                f1.variables['snow_thick'][ntime, rows, cols] = data1
 
     if confM2R.isclimatology:
         # Climatological time starts at the 15th of each month
@@ -494,9 +505,9 @@ def writeclimfile(confM2R, ntime, myvar, data1=None, data2=None, data3=None, dat
         grdROMS.message = tt.tm_yday + 15
 
         if myvar == 'temperature':
-            f1.variables['temp'][ntime, :, :, :] = data1
+            f1.variables['temp'][ntime, :, rows, cols] = data1
         if myvar == 'salinity':
-            f1.variables['salt'][ntime, :, :, :] = data1
-            f1.variables['SSS'][ntime, :, :, :] = data1
+            f1.variables['salt'][ntime, :, rows, cols] = data1
+            f1.variables['SSS'][ntime, :, rows, cols] = data1
 
     f1.close()
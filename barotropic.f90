@@ -39,12 +39,15 @@ Module velocity
             REAL(4), dimension(Nroms+1,eta_rho,xi_rho) ::  z_w
             REAL(4), dimension(Nroms+1,JJ,II) ::  z_wu
 
+!f2py threadsafe
 !f2py intent(in,overwrite) dat,z_w,z_wu,Nroms, JJ, II, xi_rho, eta_rho
 !f2py intent(in,out,overwrite) outdat
 !f2py intent(hide) ic,jc,kc
 
             print*,'--->Started ubar calculations'
-            ! average z_w to Arakawa-C u,v-points (z_wu, z_wv)
+            ! average z_w to Arakawa-C u,v-points (z_wu, z_wv). The columns are independent and are
+            ! shared between the threads when compiled with OpenMP (see compile.py).
+!$omp parallel do private(ic,kc)
             do jc=1,JJ
               do ic=2,II+1
                   do kc=1,Nroms+1
@@ -52,7 +55,9 @@ Module velocity
                   end do
                end do
             end do
+!$omp end parallel do
 
+!$omp parallel do private(ic,kc)
             do jc=1,JJ
               do ic=1,II
                  outdat(jc,ic)=0.0
@@ -66,6 +71,7 @@ Module velocity
                   end if
               end do
             end do
+!$omp end parallel do
 
             end subroutine ubar
 
@@ -106,11 +112,13 @@ Module velocity
             REAL(4), dimension(Nroms+1,eta_rho,xi_rho) ::    z_w
             REAL(4), dimension(Nroms+1,JJ,II) ::  z_wv
 
+!f2py threadsafe
 !f2py intent(in,overwrite) dat, z_w, z_wv, Nroms, JJ, II, xi_rho, eta_rho
 !f2py intent(in,out,overwrite) outdat
 !f2py intent(hide) ic,jc,kc
 
             print*,'--->Started vbar calculations'
+!$omp parallel do private(ic,kc)
             do jc=2,JJ+1
               do ic=1,II
                   do kc=1,Nroms+1
@@ -118,7 +126,9 @@ Module velocity
                   end do
                end do
             end do
+!$omp end parallel do
 
+!$omp parallel do private(ic,kc)
             do jc=1,JJ
               do ic=1,II
 
@@ -136,6 +146,7 @@ Module velocity
 
               end do
             end do
+!$omp end parallel do
 
             end subroutine vbar
 
@@ -0,0 +1,282 @@
+from __future__ import print_function
+import argparse
+import importlib
+import re
+import time
+
+import numpy as np
+
+import IOverticalGrid
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Microbenchmarks for the Fortran kernels used by model2roms (compiled with f2py, see compile.py):
+
+        interpolation.dovertinter, rho2u, rho2v and rotate (interpolation.f90)
+        barotropic.velocity.ubar and vbar (barotropic.f90)
+        extrapolate.fill (fill.f90)
+
+    Each kernel is run on synthetic arrays for a range of grid sizes and vertical levels and the best
+    time out of a number of repeats is reported as time per grid point (nanoseconds). Each kernel is
+    called twice: once with the arrays prepared the way model2roms.py prepares them (float64 and
+    np.asarray(..., order='Fortran')) and once with native float32 Fortran ordered arrays. Any argument
+    that f2py has to copy before calling the Fortran routine (dtype cast or C/Fortran order) is listed
+    in the report, so that the cost of hidden copies is visible next to the cost of the kernel itself.
+
+    Alternative builds of the kernels (e.g. an optimized interpolation.f90 compiled to a module with
+    another name) can be compared to the default ones with the --variants option:
+
+        python benchmarkKernels.py --sizes 100x100 400x400 --levels 20 40
+        python benchmarkKernels.py --variants interpolation,barotropic,extrapolate \\
+                                              interpolation_omp,barotropic_omp,extrapolate_omp
+
+    The first variant is the reference used to calculate the speedup of the others.
+    """
+
+
+# Source (input model) z-levels used for the synthetic data (SODA3 like, meters)
+SOURCELEVELS = np.asarray([5, 15, 25, 35, 46, 57, 70, 82, 96, 112, 129, 148, 171, 197, 229, 268, 317, 381, 465,
+                           574, 713, 885, 1089, 1320, 1574, 1846, 2132, 2427, 2730, 3039, 3351, 3667, 3986, 4307,
+                           4630, 4955, 5280, 5606], dtype=np.float64)
+
+FILLVALUE = -1.e20
+
+
+class SyntheticGrid(object):
+    """
+    Synthetic ROMS grid and forcing data used to drive the kernels. Bathymetry is a smooth
+    basin with a shelf and a land area along one side so that all the cases in dovertinter
+    (above the surface, below the bottom, in between levels) are exercised.
+    """
+
+    def __init__(self, eta_rho, xi_rho, nlevels, nsource):
+        self.eta_rho = eta_rho
+        self.xi_rho = xi_rho
+        self.eta_u = eta_rho
+        self.xi_u = xi_rho - 1
+        self.eta_v = eta_rho - 1
+        self.xi_v = xi_rho
+        self.nlevels = nlevels
+        self.nsource = min(nsource, len(SOURCELEVELS))
+
+        y, x = np.mgrid[0:eta_rho, 0:xi_rho]
+        self.h = 10.0 + 4000.0 * np.sin(np.pi * x / float(xi_rho)) * np.sin(np.pi * (y + 1) / float(eta_rho + 1))
+        self.angle = 0.3 * np.sin(2 * np.pi * x / float(xi_rho))
+
+        vgrid = IOverticalGrid.s_coordinate_4(self.h, 0.1, 7.0, 250.0, nlevels, 2, 4, zeta=None)
+        self.z_r = vgrid.z_r[0, :]
+        self.z_w = vgrid.z_w[0, :]
+
+        self.zs = -SOURCELEVELS[0:self.nsource]
+
+        # Temperature like profile, with fill values below the bottom of the source data
+        profile = 20.0 * np.exp(self.zs / 500.0)
+        self.dat = np.empty((self.nsource, eta_rho, xi_rho), dtype=np.float64)
+        self.dat[:, :, :] = profile[:, np.newaxis, np.newaxis]
+        self.dat = np.where(self.zs[:, np.newaxis, np.newaxis] < -self.h[np.newaxis, :, :], FILLVALUE, self.dat)
+
+        # Velocities at rho points and a 2D field with undefined areas for the Laplace fill
+        self.u = 0.1 * np.cos(np.pi * y / float(eta_rho))[np.newaxis, :, :] * np.ones((nlevels, 1, 1))
+        self.v = 0.1 * np.sin(np.pi * x / float(xi_rho))[np.newaxis, :, :] * np.ones((nlevels, 1, 1))
+        self.field = np.where(self.h < 500.0, 2.0e35, self.h / 100.0)
+
+
+def expecteddtypes(kernel):
+    """
+    Read the argument types expected by the Fortran routine from the docstring generated by f2py,
+    e.g. 'dat : input rank-3 array('f') with bounds (nsoda,jj,ii)'.
+    """
+    expected = {}
+    for name, rank, typecode in re.findall(r"(\w+) : input rank-(\d+) array\('(\w)'\)", kernel.__doc__ or ""):
+        expected[name] = (int(rank), np.dtype(typecode))
+    return expected
+
+
+def findcopies(kernel, argnames, args):
+    """
+    Return a list describing every array argument that f2py has to copy before it can be
+    passed to Fortran, either because of the dtype (e.g. float64->float32) or the memory order.
+    """
+    expected = expecteddtypes(kernel)
+    copies = []
+    for name, arg in zip(argnames, args):
+        if name not in expected or not isinstance(arg, np.ndarray):
+            continue
+        rank, dtype = expected[name]
+        reasons = []
+        if arg.dtype != dtype:
+            reasons.append("%s->%s" % (arg.dtype, dtype))
+        if rank > 1 and not arg.flags['F_CONTIGUOUS']:
+            reasons.append("C->Fortran order")
+        if reasons:
+            copies.append("%s(%s)" % (name, ",".join(reasons)))
+    return copies
+
+
+def prepare(array, native):
+    # model2roms.py passes float64 arrays through np.asarray(..., order='Fortran'). The native
+    # alternative is what the Fortran routines declare: REAL(4) in Fortran order.
+    if native:
+        return np.asfortranarray(array, dtype=np.float32)
+    return np.asarray(array, dtype=np.float64, order='F')
+
+
+def kernelcases(modules, grid, native):
+    """
+    Return (name, kernel, argnames, argument factory, number of points) for each kernel. The factory
+    is called before every repeat since all kernels overwrite their arguments in place.
+    """
+    interp, barotropic, extrapolate = modules
+    N, M = grid.nlevels, grid.nsource
+    cases = []
+
+    def dovertinterargs():
+        return (prepare(np.zeros((N, grid.eta_rho, grid.xi_rho)), native), prepare(grid.dat, native),
+                prepare(grid.h, native), prepare(grid.z_r, native), prepare(grid.zs, native),
+                N, M, grid.xi_rho, grid.eta_rho, grid.xi_rho, grid.eta_rho)
+
+    cases.append(("dovertinter", interp.interpolation.dovertinter,
+                  ["outdat", "dat", "bathymetry", "zr", "zs"], dovertinterargs, N * grid.eta_rho * grid.xi_rho))
+
+    def rotateargs():
+        return (prepare(np.zeros((N, grid.eta_rho, grid.xi_rho)), native),
+                prepare(np.zeros((N, grid.eta_rho, grid.xi_rho)), native),
+                prepare(grid.u, native), prepare(grid.v, native), prepare(grid.angle, native),
+                grid.xi_rho, grid.eta_rho, N)
+
+    cases.append(("rotate", interp.interpolation.rotate,
+                  ["urot", "vrot", "u_rho", "v_rho", "angle"], rotateargs, N * grid.eta_rho * grid.xi_rho))
+
+    def rho2uargs():
+        return (prepare(np.zeros((N, grid.eta_u, grid.xi_u)), native), prepare(grid.u, native),
+                grid.xi_rho, grid.eta_rho, N)
+
+    cases.append(("rho2u", interp.interpolation.rho2u,
+                  ["udata", "rhodata"], rho2uargs, N * grid.eta_u * grid.xi_u))
+
+    def rho2vargs():
+        return (prepare(np.zeros((N, grid.eta_v, grid.xi_v)), native), prepare(grid.v, native),
+                grid.xi_rho, grid.eta_rho, N)
+
+    cases.append(("rho2v", interp.interpolation.rho2v,
+                  ["vdata", "rhodata"], rho2vargs, N * grid.eta_v * grid.xi_v))
+
+    def ubarargs():
+        return (prepare(grid.u[:, :, 0:grid.xi_u], native), prepare(np.zeros((grid.eta_u, grid.xi_u)), native),
+                prepare(grid.z_w, native), prepare(np.zeros((N + 1, grid.eta_u, grid.xi_u)), native),
+                N, grid.xi_u, grid.eta_u, grid.xi_rho, grid.eta_rho)
+
+    cases.append(("ubar", barotropic.velocity.ubar,
+                  ["dat", "outdat", "z_w", "z_wu"], ubarargs, N * grid.eta_u * grid.xi_u))
+
+    def vbarargs():
+        return (prepare(grid.v[:, 0:grid.eta_v, :], native), prepare(np.zeros((grid.eta_v, grid.xi_v)), native),
+                prepare(grid.z_w, native), prepare(np.zeros((N + 1, grid.eta_v, grid.xi_v)), native),
+                N, grid.xi_v, grid.eta_v, grid.xi_rho, grid.eta_rho)
+
+    cases.append(("vbar", barotropic.velocity.vbar,
+                  ["dat", "outdat", "z_w", "z_wv"], vbarargs, N * grid.eta_v * grid.xi_v))
+
+    def fillargs():
+        # Same arguments as interp2D.laplacefilter
+        return (1, grid.xi_rho, 1, grid.eta_rho, 0.9 * 2.0e35, 0.01, 1.6, 10,
+                prepare(grid.field, native), grid.xi_rho, grid.eta_rho)
+
+    cases.append(("fill", extrapolate.extrapolate.fill,
+                  ["i1", "i2", "j1", "j2", "tx", "critx", "cor", "mxs", "za"], fillargs, grid.eta_rho * grid.xi_rho))
+
+    if hasattr(extrapolate.extrapolate, "fill3d"):
+        def fill3dargs():
+            # Same arguments as interp2D.laplacefilter3d, one 2D field per level
+            return (1, grid.xi_rho, 1, grid.eta_rho, 0.9 * 2.0e35, 0.01, 1.6, 10,
+                    prepare(np.tile(grid.field, (N, 1, 1)), native), grid.xi_rho, grid.eta_rho, N)
+
+        cases.append(("fill3d", extrapolate.extrapolate.fill3d,
+                      ["i1", "i2", "j1", "j2", "tx", "critx", "cor", "mxs", "za"], fill3dargs,
+                      N * grid.eta_rho * grid.xi_rho))
+
+    return cases
+
+
+def timekernel(kernel, factory, repeats):
+    best = None
+    for r in range(repeats):
+        args = factory()
+        start = time.time()
+        kernel(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loadvariant(variant):
+    # A variant is given as three comma separated module names: interpolation,barotropic,extrapolate
+    names = variant.split(",")
+    if len(names) != 3:
+        raise ValueError("Kernel variants must be given as 'interpolation,barotropic,extrapolate' module names,"
+                         " got: %s" % variant)
+    return tuple(importlib.import_module(name) for name in names)
+
+
+def parsesize(size):
+    eta, xi = size.lower().split("x")
+    return int(eta), int(xi)
+
+
+def runbenchmarks(variants, sizes, levels, nsource, repeats, csvfile=None):
+    modules = [loadvariant(variant) for variant in variants]
+    results = []
+
+    print("\n=>Benchmarking Fortran kernels (best of %s repeats, ns per grid point)" % repeats)
+    print("%-12s %-12s %-6s %-30s %-7s %12s %12s %8s  %s" % ("kernel", "eta x xi", "N", "variant", "arrays",
+                                                               "time (s)", "ns/point", "speedup", "f2py copies"))
+    for eta_rho, xi_rho in sizes:
+        for nlevels in levels:
+            grid = SyntheticGrid(eta_rho, xi_rho, nlevels, nsource)
+
+            for native in [False, True]:
+                reference = {}
+                for variant, mods in zip(variants, modules):
+                    for name, kernel, argnames, factory, npoints in kernelcases(mods, grid, native):
+                        copies = findcopies(kernel, argnames, factory())
+                        elapsed = timekernel(kernel, factory, repeats)
+                        if name not in reference:
+                            reference[name] = elapsed
+                        speedup = reference[name] / elapsed if elapsed > 0 else float('nan')
+                        arrays = "f4-F" if native else "f8"
+
+                        print("%-12s %-12s %-6s %-30s %-7s %12.5f %12.2f %8.2f  %s" % (
+                            name, "%sx%s" % (eta_rho, xi_rho), nlevels, variant, arrays, elapsed,
+                            1.e9 * elapsed / npoints, speedup, ", ".join(copies) if copies else "none"))
+
+                        results.append((name, eta_rho, xi_rho, nlevels, variant, arrays, elapsed,
+                                        1.e9 * elapsed / npoints, speedup, len(copies)))
+
+    if csvfile is not None:
+        with open(csvfile, 'w') as f:
+            f.write("kernel,eta_rho,xi_rho,nlevels,variant,arrays,seconds,ns_per_point,speedup,copies\n")
+            for result in results:
+                f.write(",".join(['"%s"' % r if isinstance(r, str) else str(r) for r in result]) + "\n")
+        print("\n=>Benchmark results written to file %s" % csvfile)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the f2py compiled model2roms kernels")
+    parser.add_argument("--variants", nargs="+", default=["interpolation,barotropic,extrapolate"],
+                        help="kernel modules to compare given as interpolation,barotropic,extrapolate")
+    parser.add_argument("--sizes", nargs="+", default=["50x50", "100x100", "200x200", "400x400"],
+                        help="grid sizes (eta_rho x xi_rho)")
+    parser.add_argument("--levels", nargs="+", type=int, default=[20, 40], help="number of ROMS levels")
+    parser.add_argument("--sourcelevels", type=int, default=38, help="number of input z-levels")
+    parser.add_argument("--repeats", type=int, default=3, help="number of times each kernel is timed")
+    parser.add_argument("--csv", default=None, help="write the scaling curves to this csv file")
+    args = parser.parse_args()
+
+    runbenchmarks(args.variants, [parsesize(size) for size in args.sizes], args.levels, args.sourcelevels,
+                  args.repeats, args.csv)
@@ -4,8 +4,10 @@ This is CLM2BRY
 from datetime import datetime
 from netCDF4 import Dataset
 from netCDF4 import num2date
+import os
 import numpy as np
 import IOBry
+import IOappend
 
 __author__ = 'Trond Kristiansen'
 __email__ = 'me@trondkristiansen.com'
@@ -54,8 +56,13 @@ def writebry(confM2R):
 
     # Open the CLIM file
     clim = Dataset(confM2R.climname, 'r')
-    # Generate the BRY netcdf4 file that we will use to fill in data
-    IOBry.createBryFile(confM2R)
+    # Generate the BRY netcdf4 file that we will use to fill in data. In append mode only the CLIM records
+    # that are not yet in the existing BRY file are added (see IOappend.py)
+    firstrecord = 0
+    if confM2R.appendmode and os.path.exists(confM2R.bryname):
+        firstrecord, lastdate = IOappend.validatefile(confM2R, confM2R.bryname)
+    else:
+        IOBry.createBryFile(confM2R)
     # Now open the file we created
     f = Dataset(confM2R.bryname, mode='a', format=confM2R.myformat, zlib=confM2R.myzlib)
 
@@ -64,7 +71,7 @@ def writebry(confM2R):
     ntimes = len(climtime)
 
     # For each time in CLIM file, save clips of boundary data to BRY file
-    for itime in range(ntimes):
+    for itime in range(firstrecord, ntimes):
 
         temp = np.array(clim.variables["temp"][itime, :, :, :])
         salt = np.array(clim.variables["salt"][itime, :, :, :])
@@ -294,4 +301,31 @@ def writebry(confM2R):
             f.variables['sig22_east'][itime, :] = sig22_east
             f.variables['sig22_south'][itime, :] = sig22_south
             f.variables['sig22_north'][itime, :] = sig22_north
+    clim.close()
+    f.close()
+
+
+def patchbry(confM2R, records, names):
+    """
+    Copy the boundary sections of the CLIM variables in names for the CLIM records in records to the existing
+    BRY file (patchmode in configM2R.py, see IOpatch.py). The other variables and records of the BRY file are
+    not changed. The sections are cut as in writebry: the last index along xi and eta is Lp (Mp) for the rho
+    points and Lp - 1 (Mp - 1) for the U (V) points.
+    """
+    IOappend.validatefile(confM2R, confM2R.bryname)
+
+    clim = Dataset(confM2R.climname, 'r')
+    f = Dataset(confM2R.bryname, mode='a', format=confM2R.myformat)
+
+    for itime in records:
+        print('clim2bry.py => Patching %s in file %s for record %s' % (", ".join(names), confM2R.bryname, itime))
+        for name in names:
+            data = np.array(clim.variables[name][itime])
+
+            f.variables[name + '_west'][itime] = np.squeeze(data[..., 0])
+            f.variables[name + '_east'][itime] = np.squeeze(data[..., -1])
+            f.variables[name + '_south'][itime] = np.squeeze(data[..., 0, :])
+            f.variables[name + '_north'][itime] = np.squeeze(data[..., -1, :])
+
+    clim.close()
     f.close()
@@ -26,6 +26,10 @@ def help():
 
     NOTE: cleanarray.f90 is no longer used as fill.90 has better fill options
     using Laplace equation. 
+
+    Each Fortran file is compiled twice: once as a serial module (e.g. interpolation.so) and once
+    with OpenMP as a threaded module (e.g. interpolation_omp.so). Which of the two is used is
+    decided at runtime (see fortranKernels.py and usethreadedkernels in configM2R.py).
     """
 
 
@@ -64,6 +68,17 @@ def compileallifort():
     stdout_value = proc.communicate()[0]
     log.writelines(repr(stdout_value))
 
+    # Threaded (OpenMP) versions of the same kernels. These are selected at runtime with
+    # usethreadedkernels in configM2R.py (see fortranKernels.py)
+    for module, source in [("barotropic", "barotropic.f90"), ("interpolation", "interpolation.f90"),
+                           ("extrapolate", "fill.f90")]:
+        print("Compiling %s to create threaded version ==> %s_omp.so" % (source, module))
+        proc = subprocess.Popen(
+            'f2py --verbose --fcompiler=intelem -c -m %s_omp %s --f90flags="-no-heap-arrays -qopenmp" -liomp5' % (
+                module, source), shell=True, stdout=subprocess.PIPE, )
+        stdout_value = proc.communicate()[0]
+        log.writelines(repr(stdout_value))
+
     log.close()
 
     print("Compilation finished and results written to file => %s" % (logfile))
@@ -103,6 +118,16 @@ def compileallgfortran():
     stdout_value = proc.communicate()[0]
     log.writelines(repr(stdout_value))
 
+    # Threaded (OpenMP) versions of the same kernels. These are selected at runtime with
+    # usethreadedkernels in configM2R.py (see fortranKernels.py)
+    for module, source in [("barotropic", "barotropic.f90"), ("interpolation", "interpolation.f90"),
+                           ("extrapolate", "fill.f90")]:
+        print("Compiling %s to create threaded version ==> %s_omp.so" % (source, module))
+        proc = subprocess.Popen('f2py --verbose -c -m %s_omp %s --f90flags="-fopenmp" -lgomp' % (module, source),
+                                shell=True, stdout=subprocess.PIPE, )
+        stdout_value = proc.communicate()[0]
+        log.writelines(repr(stdout_value))
+
     log.close()
 
     print("Compilation finished and results written to file => %s" % logfile)
@@ -1,4 +1,6 @@
 import time, calendar
+import copy
+import os
 from netCDF4 import Dataset, datetime, date2num, num2date
 import model2roms
 import IOstation
@@ -7,6 +9,8 @@ import decimateGrid
 import grd
 import numpy as np
 import atmosForcing
+import fortranKernels
+import mpiPartition
 import sys
 
 __author__ = 'Trond Kristiansen'
@@ -42,7 +46,77 @@ class Model2romsConfig(object):
     def defineabbreviation(self):
         return {"A20": "a20",
                 "ROHO800": "roho800",
-		"SO5K": "so5k"}[self.outgrid]
+                "SO5K": "so5k"}[self.outgrid]
+
+    def defineverticalgrid(self):
+        if self.outgrid == "ROHO800":
+            # Define nmber of output depth levels
+            self.nlevels = 40
+            # Define the grid stretching properties (leave default if uncertain what to pick)
+            self.vstretching = 4
+            self.vtransform = 2
+            self.theta_s = 7.0
+            self.theta_b = 0.1
+            self.tcline = 250.0
+            self.hc = 250
+
+        if self.outgrid == "SO5K":
+            self.nlevels = 32
+            self.vstretching = 1
+            self.vtransform = 1
+            self.theta_s = 5.0
+            self.theta_b = 0.4
+            self.tcline = 20.0
+            self.hc = 20
+
+    def creategrdroms(self):
+        # Create the grid object for the output grid
+        grdROMS = grd.Grd("ROMS", self)
+        grdROMS.nlevels = self.nlevels
+        grdROMS.vstretching = self.vstretching
+        grdROMS.vtransform = self.vtransform
+        grdROMS.theta_s = self.theta_s
+        grdROMS.theta_b = self.theta_b
+        grdROMS.tcline = self.tcline
+        grdROMS.hc = self.hc
+        grdROMS.lonname = 'lon_rho'
+        grdROMS.latname = 'lat_rho'
+
+        # Read the grid from the snapshot in cachedir if this grid file and vertical grid were used before
+        if self.usegridsnapshot:
+            snapshot = grd.snapshotfilename(self)
+            if os.path.exists(snapshot):
+                grdROMS.loadsnapshot(self, snapshot)
+                return grdROMS
+
+        grdROMS.opennetcdf(self.romsgridpath)
+        grdROMS.createobject(self)
+        grdROMS.getdims()
+
+        if self.usegridsnapshot:
+            if not os.path.exists(self.cachedir):
+                os.makedirs(self.cachedir)
+            grdROMS.savesnapshot(snapshot)
+
+        return grdROMS
+
+    def createextratarget(self, outgrid):
+        # Copy of this configuration for one of the extraoutgrids with its own ROMS grid and output files.
+        # The input grid (grdMODEL) is shared until convertMODEL2ROMS creates the interpolation weights.
+        target = copy.copy(self)
+        target.outgrid = outgrid
+        target.defineverticalgrid()
+        target.romsgridpath = target.defineromsgridpath()
+        target.abbreviation = target.defineabbreviation()
+        target.climname, target.initname, target.bryname = target.defineoutputfilenames()
+
+        if target.isclimatology is True:
+            target.climname = target.abbreviation + '_' + str(target.indatatype) + '_climatology.nc'
+
+        print('\n=>Additional output grid file is: %s' % target.romsgridpath)
+        target.grdROMS = target.creategrdroms()
+
+        return target
 
     def showinfo(self):
         if self.isclimatology:
@@ -110,7 +184,7 @@ class Model2romsConfig(object):
     def defineromsgridpath(self):
         return {'A20': '/home/trondk/Projects/A20/Grid/A20niva_grd_v1.nc',
                 'ROHO800': '/global/homes/a/abarthel/data/forcingfields/fromTrond/ROHO800_grid.nc',
-		'SO5K': '/global/homes/a/abarthel/ROMS/so_grd.rtopo2.2.small.5km.nc'}[self.outgrid]
+                'SO5K': '/global/homes/a/abarthel/ROMS/so_grd.rtopo2.2.small.5km.nc'}[self.outgrid]
 
     def defineforcingdatapath(self):
         return {'SODA3': "/global/homes/a/abarthel/data/forcingfields/fromTrond/",
@@ -142,8 +216,20 @@ class Model2romsConfig(object):
             self.latlist = [59.316667, 59.316667, 58.016667]
             self.lonliost = [4.800000, 4.983333, 6.533333]
 
+        # Interpolate the input data directly to the station (mooring) positions and depths below and write the
+        # time series to one file (stationExtraction.py) instead of creating the ROMS forcing files
+        self.stationmode = False
+        self.stationnames = ["Ytre Utsira", "Indre Utsira", "Lista"]
+        self.stationlons = [4.800000, 4.983333, 6.533333]
+        self.stationlats = [59.316667, 59.316667, 58.016667]
+        # Depths (m, positive) of the station time series
+        self.stationdepths = [0, 10, 25, 50, 75, 100, 150, 200]
+
         # Create the bry, init, and clim files for a given grid and input data
         self.createoceanforcing = True
+        # Only create the BRY file: interpolates just the points along the four boundaries and writes them
+        # directly to the BRY file (no CLIM or INIT file). Use when ROMS is run without CLIM nudging.
+        self.bryonly = False
         # Create atmospheric forcing for the given grid
         self.createatmosforcing = False  # currently in beta stages and unavailable
         # Create a smaller resolution grid based on your original. Decimates every second for
@@ -155,6 +241,79 @@ class Model2romsConfig(object):
         self.useesmf = True
         # Apply filter to smooth the 2D fields after interpolation (time consuming but enhances results)
         self.usefilter = True
+        # Method used to extrapolate into the areas without data after the horizontal interpolation:
+        # "laplace" (fill.f90, iterative) or "nearest" (precomputed nearest wet point maps, much faster).
+        # With extrapolationneighbours > 1 the nearest wet points are weighted by inverse distance.
+        self.extrapolationmethod = "laplace"
+        self.extrapolationneighbours = 1
+        # Folder used to store the extrapolation maps and regrid weights between runs
+        self.cachedir = "cache"
+        # Store the ROMS grid object (including the vertical grid) in cachedir the first time a grid is used and
+        # read it from there in later runs instead of reading the grid file and calculating z_r and z_w
+        self.usegridsnapshot = False
+        # Store the interpolated fields of each variable and time step in cachedir/fields (see fieldCache.py) so that
+        # a rerun with other output settings (format, compression, writeice) or an added variable does not repeat
+        # the interpolation. The least recently used fields are removed when the cache is larger than
+        # fieldcachesize bytes.
+        self.usefieldcache = False
+        self.fieldcachesize = 20.0e9
+        # Scan modelpath once and look up the input file and record of each variable and time step in a catalog
+        # stored in cachedir (see inputCatalog.py). Missing inputs are listed before the conversion starts.
+        self.usecatalog = False
+        # Split the time steps of the run between the MPI ranks (requires mpi4py, see mpiPartition.py). Start with
+        # e.g. mpirun -n 8 python main.py. Each rank writes a part of the CLIM file and rank 0 merges the parts.
+        self.usempi = False
+        # Only convert shard number shard (0 to nshards - 1) of the time steps, e.g. to run one job per year. The
+        # CLIM/BRY files of each shard are written as part files (..._part003.nc) that are concatenated with
+        # mergeParts.py. Set with python main.py --shard 3 --nshards 10.
+        self.shard = 0
+        self.nshards = 1
+        # Append the time steps after the last record of existing CLIM and BRY files to the files instead of
+        # creating them again, e.g. to add one new month of forcing (see IOappend.py)
+        self.appendmode = False
+        # Only create the INIT file for initdate (year, month, day) without creating CLIM and BRY files. The INIT
+        # file is converted from the input data, or extracted from the existing CLIM file with initfromclim.
+        self.initmode = False
+        self.initdate = (2013, 1, 15)
+        self.initfromclim = False
+        # Convert only the variables in patchvariables (globalvarnames) for the dates from patchdates[0] to
+        # patchdates[1] (year, month, day) and overwrite their records in the existing CLIM and BRY files. The
+        # other variables and records are not changed (see IOpatch.py).
+        self.patchmode = False
+        self.patchvariables = ['aice', 'hice']
+        self.patchdates = ((2013, 1, 1), (2013, 12, 31))
+        # Process the ROMS grid in bands of tilerows eta rows (0: the whole grid at once) to limit the memory used
+        # for very large grids. Each tile is written before the next one is interpolated. tilehalo extra rows on
+        # each side of a tile are used by the extrapolation (filter) and rho2v but not written. With usefilter the
+        # tiles use the nearest wet point extrapolation, which gives the same values as the whole grid where the
+        # nearest wet point is within the tile and its halo.
+        self.tilerows = 0
+        self.tilehalo = 10
+        # Only interpolate and write the CLIM fields within nudgingwidth points of the boundaries in
+        # nudgingboundaries (0: the whole grid), i.e. the nudging (sponge) zone where ROMS uses them. The interior
+        # keeps the fill value, which compresses to almost nothing. The other boundaries get a band of two points
+        # for the BRY file. The INIT file is then not written (use initmode).
+        self.nudgingwidth = 0
+        self.nudgingboundaries = ['west', 'east', 'south', 'north']
+        # Read, regrid, and write all months of a year as one block (yearly files of monthly means, e.g. SODA3). The
+        # regridding uses the ESMF weights as a sparse matrix (regridWeights.py) and requires scipy.
+        self.timebatch = False
+        # Use the threaded (OpenMP) versions of the Fortran kernels for vertical interpolation, rotation,
+        # barotropic velocities and the filter. These are compiled together with the serial versions
+        # in compile.py. Set numthreads to the number of cores available for the run.
+        self.usethreadedkernels = False
+        self.numthreads = 4
+        # Convert the independent variables of a time step (temperature, salinity, ssh, uvel/vvel, ice) at the same
+        # time in variableworkers threads. Useful when there are few time steps (e.g. a 12 month climatology).
+        # The horizontal interpolation then uses the ESMF weights as a sparse matrix (regridWeights.py). The Fortran
+        # kernels release the GIL (!f2py threadsafe), so recompile them with compile.py before using this.
+        self.variableworkers = 1
+        # Only read and interpolate the input depth levels that are used by the vertical interpolation
+        # to the ROMS grid (the levels down to the deepest ROMS depth plus one). Speeds up shelf grids.
+        self.prunelevels = True
+        # Only interpolate the ocean points of the ROMS grid (vertical interpolation, rotation and barotropic
+        # velocities). The ocean points are packed into compact arrays and land points set to fillval when writing.
+        self.usewetpoints = True
         # Format to write the ouput to: 'NETCDF4', 'NETCDF4_CLASSIC', 'NETCDF3_64BIT', or 'NETCDF3_CLASSIC'
         # Using NETCDF4 automatically turns on compression of files (ZLIB)
         self.myformat = 'NETCDF4'
@@ -198,26 +357,15 @@ class Model2romsConfig(object):
         self.subsetindata = False
         if self.subsetindata:
             self.subset = self.definesubsetforindata()
-	
-	if self.outgrid == "ROHO800":
-        # Define nmber of output depth levels
-            self.nlevels = 40
-        # Define the grid stretching properties (leave default if uncertain what to pick)
-            self.vstretching = 4
-            self.vtransform = 2
-            self.theta_s = 7.0
-            self.theta_b = 0.1
-            self.tcline = 250.0
-            self.hc = 250
 
-	if self.outgrid == "SO5K":
-  	    self.nlevels = 32
-            self.vstretching = 1
-            self.vtransform = 1
-            self.theta_s = 5.0
-            self.theta_b = 0.4
-            self.tcline = 20.0
-            self.hc = 20
+        # Define the vertical grid of the output grid (see defineverticalgrid)
+        self.defineverticalgrid()
+
+        # Additional output grids that are forced from the same input data in the same run (e.g. nested or
+        # sibling grids: ["ROHO800", "A20"]). Each input file is then only read once and interpolated to all
+        # grids. Each grid gets its own CLIM, INIT, and BRY files named by defineabbreviation.
+        self.extraoutgrids = []
+
         # PATH TO FORCINGDATA --------------------------------------------------------------------
         # Define the path to the input data
         self.modelpath = self.defineforcingdatapath()
@@ -261,10 +409,18 @@ class Model2romsConfig(object):
             import compile;
             compile.compileallgfortran()
 
-        if self.createatmosforcing or self.createoceanforcing:
+        fortranKernels.selectkernels(self)
+
+        self.mpicomm, self.mpirank, self.mpisize = None, 0, 1
+        if self.usempi:
+            self.mpicomm, self.mpirank, self.mpisize = mpiPartition.getcommunicator()
+
+        if self.createatmosforcing or self.createoceanforcing or self.stationmode:
             self.abbreviation = self.defineabbreviation()
 
             self.climname, self.initname, self.bryname = self.defineoutputfilenames()
+            self.stationfilename = self.abbreviation + '_stations_' + str(self.indatatype) + '_' + \
+                                   str(self.formatdatesforoutputnames()) + '.nc'
 
             if self.isclimatology is True:
                 self.climname = self.abbreviation + '_' + str(self.indatatype) + '_climatology.nc'
@@ -278,23 +434,13 @@ class Model2romsConfig(object):
 
 
             # Create the grid object for the output grid
-            self.grdROMS = grd.Grd("ROMS", self)
-            self.grdROMS.nlevels =self.nlevels
-            self.grdROMS.vstretching = self.vstretching
-            self.grdROMS.vtransform = self.vtransform
-            self.grdROMS.theta_s = self.theta_s
-            self.grdROMS.theta_b = self.theta_b
-            self.grdROMS.tcline = self.tcline
-            self.grdROMS.hc = self.hc
-            self.grdROMS.lonname = 'lon_rho'
-            self.grdROMS.latname = 'lat_rho'
-
-            self.grdROMS.opennetcdf(self.romsgridpath)
-            self.grdROMS.createobject(self)
-            self.grdROMS.getdims()
+            self.grdROMS = self.creategrdroms()
 
             # Create the grid object for the input grid
             self.grdMODEL = grd.Grd("FORCINGDATA", self)
             self.grdMODEL.grdType = self.grdtype
             self.grdMODEL.lonName = self.lonname
             self.grdMODEL.latName = self.latname
+
+            # Create the configurations for the additional output grids (forced in the same run)
+            self.extratargets = [self.createextratarget(outgrid) for outgrid in self.extraoutgrids]
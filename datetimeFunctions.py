@@ -72,3 +72,13 @@ def createlistofdays(confM2R, year, month):
         days = [15]
 
     return days
+
+
+def createlistofdates(confM2R):
+    # All time steps of the run as (year, month, day) in the order they are converted
+    dates = []
+    for year in confM2R.years:
+        for month in createlistofmonths(confM2R, year):
+            for day in createlistofdays(confM2R, year, month):
+                dates.append((year, month, day))
+    return dates
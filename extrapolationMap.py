@@ -0,0 +1,130 @@
+from __future__ import print_function
+import hashlib
+import os
+import threading
+import numpy as np
+from spatialIndex import lonlat2xyz
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    print("Could not find module scipy")
+    pass
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Nearest wet point extrapolation used as a fast alternative to the Laplace fill (fill.f90) after the
+    horizontal interpolation. Turned on with extrapolationmethod = "nearest" in configM2R.py.
+
+    The points of the ROMS grid that are undefined after the horizontal interpolation (land in the input
+    data or outside the input grid) are the same for every time step since both the input land mask and
+    the ROMS grid are fixed. The first time a new set of undefined points is found (for a given level or
+    variable) a map from each undefined point to its nearest valid point is created using a KD-tree on the
+    unit sphere. With extrapolationneighbours > 1 the k nearest valid points are used and weighted by
+    inverse distance. Every later time step only gathers the values from the map.
+
+    The maps are identified by a checksum of the grid coordinates and the undefined points, and are stored
+    in cachedir (one file per map in a folder per ROMS grid point type) so that they are reused by the next
+    run. A new map only writes its own file.
+    """
+
+
+class ExtrapolationMap(object):
+
+    def __init__(self, lon, lat, neighbours, cachefolder):
+        self.shape = np.shape(lon)
+        self.xyz = lonlat2xyz(lon, lat)
+        self.neighbours = int(neighbours)
+        self.cachefolder = cachefolder
+        self.gridkey = hashlib.sha1(self.xyz.tobytes()).hexdigest()
+        self.maps = {}
+        # The variables of a time step can be converted in several threads (variableworkers in configM2R.py)
+        self.lock = threading.Lock()
+
+        if self.cachefolder is not None and not os.path.exists(self.cachefolder):
+            os.makedirs(self.cachefolder)
+
+    def loadmap(self, key):
+        # The map stored for key in cachefolder, or None
+        if self.cachefolder is None:
+            return None
+        filename = os.path.join(self.cachefolder, key + ".npz")
+        if not os.path.exists(filename):
+            return None
+        cache = np.load(filename)
+        stored = (cache["undef"], cache["index"], cache["weights"])
+        cache.close()
+        return stored
+
+    def savemap(self, key, undef, index, weights):
+        if self.cachefolder is None:
+            return
+        filename = os.path.join(self.cachefolder, key + ".npz")
+        # Write to a temporary file first so that other processes (MPI ranks) never read a partial file
+        temporary = "%s.%s.%s.npz" % (filename[:-4], os.getpid(), threading.current_thread().ident)
+        np.savez(temporary, undef=undef, index=index, weights=weights)
+        os.rename(temporary, filename)
+
+    def getmap(self, undefined):
+        key = "map_" + hashlib.sha1(self.gridkey.encode() + np.packbits(undefined).tobytes()).hexdigest()
+        with self.lock:
+            if key not in self.maps:
+                stored = self.loadmap(key)
+                if stored is None:
+                    stored = self.createmap(undefined)
+                    self.savemap(key, *stored)
+                self.maps[key] = stored
+            return self.maps[key]
+
+    def createmap(self, undefined):
+        undef = np.flatnonzero(undefined)
+        valid = np.flatnonzero(~undefined)
+        k = min(self.neighbours, len(valid))
+
+        distance, nearest = cKDTree(self.xyz[valid]).query(self.xyz[undef], k=k)
+        distance = np.reshape(distance, (len(undef), k))
+        nearest = np.reshape(nearest, (len(undef), k))
+
+        weights = 1.0 / np.maximum(distance, 1.0e-12)
+        weights = weights / np.sum(weights, axis=1)[:, np.newaxis]
+
+        print("--->Created map for extrapolation of %s points from %s nearest wet points" % (len(undef), k))
+        return undef, valid[nearest], weights
+
+    def fill(self, field, threshold):
+        # Replace all values of the 2D field above threshold with the (weighted) nearest valid values
+        flat = np.array(field, dtype=np.float64).ravel()
+        undefined = np.abs(flat) > threshold
+
+        if undefined.all() or not undefined.any():
+            return np.reshape(flat, self.shape)
+
+        undef, index, weights = self.getmap(undefined)
+        flat[undef] = np.sum(flat[index] * weights, axis=1)
+
+        return np.reshape(flat, self.shape)
+
+    def fill3d(self, field, threshold):
+        for k in range(np.shape(field)[0]):
+            field[k, :, :] = self.fill(field[k, :, :], threshold)
+        return field
+
+
+def createextrapolationmaps(confM2R):
+    grdROMS = confM2R.grdROMS
+    if not os.path.exists(confM2R.cachedir):
+        os.makedirs(confM2R.cachedir)
+
+    print("=>Using nearest wet point extrapolation with %s neighbours" % confM2R.extrapolationneighbours)
+    for point, lon, lat in [("rho", grdROMS.lon_rho, grdROMS.lat_rho),
+                            ("u", grdROMS.lon_u, grdROMS.lat_u),
+                            ("v", grdROMS.lon_v, grdROMS.lat_v)]:
+        cachefolder = os.path.join(confM2R.cachedir, "%s_extrapolation_%s_k%s" % (
+            confM2R.outgrid, point, confM2R.extrapolationneighbours))
+
+        setattr(grdROMS, "extrapolation_" + point,
+                ExtrapolationMap(lon, lat, confM2R.extrapolationneighbours, cachefolder))
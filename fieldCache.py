@@ -0,0 +1,140 @@
+from __future__ import print_function
+import hashlib
+import os
+import threading
+import numpy as np
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Cache of the interpolated fields of each variable and time step (usefieldcache in configM2R.py) stored in
+    cachedir/fields. When a conversion is run again, e.g. after changing the output format, compression or
+    writeice, or after adding a variable, the time steps found in the cache are written without reading,
+    regridding and vertically interpolating the input data again.
+
+    The fields are stored under a key (sha1) made from:
+
+        the input files (name, size, and modification time) and records of the variables
+        the variables (model2roms and input names)
+        the ROMS grids the fields are interpolated to (checksum of the coordinates, depths and masks)
+        the interpolation and extrapolation settings
+
+    so that any change of the input data, grids or settings gives new entries. The cache is limited to
+    fieldcachesize bytes: when it is full the entries that were least recently used are removed.
+    """
+
+
+# Settings in configM2R.py that change the interpolated fields
+SETTINGS = ['indatatype', 'useesmf', 'usefilter', 'extrapolationmethod', 'extrapolationneighbours', 'usewetpoints',
+            'prunelevels', 'subsetindata']
+
+
+def gridkey(grdROMS):
+    # Checksum of the ROMS grid (or strip or tile) the fields are interpolated to
+    checksum = hashlib.sha1()
+    for name in ['lon_rho', 'lat_rho', 'h', 'angle', 'mask_rho', 'z_r']:
+        checksum.update(np.ascontiguousarray(getattr(grdROMS, name), dtype=np.float64).tobytes())
+    checksum.update(str(grdROMS.fillval).encode('utf-8'))
+    return checksum.hexdigest()
+
+
+class FieldCache(object):
+
+    def __init__(self, confM2R, targets):
+        self.folder = os.path.join(confM2R.cachedir, "fields")
+        self.maxsize = confM2R.fieldcachesize
+        self.lock = threading.Lock()
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        # Everything in the key that is the same for all time steps of the run
+        settings = [str(getattr(confM2R, name, None)) for name in SETTINGS]
+        settings.append(str(confM2R.grdMODEL.nlevels))
+        settings.extend([gridkey(targetconf.grdROMS) for boundary, targetconf, gridconf in targets])
+        self.runkey = hashlib.sha1("|".join(settings).encode('utf-8')).hexdigest()
+
+        # Size and last use of the entries
+        self.entries = {}
+        for filename in os.listdir(self.folder):
+            if filename.endswith(".npz"):
+                info = os.stat(os.path.join(self.folder, filename))
+                self.entries[filename] = (info.st_size, info.st_mtime)
+        print("=>Field cache %s: %s entries (%.1f MB)" % (self.folder, len(self.entries), self.totalsize() / 1.0e6))
+
+    def totalsize(self):
+        return sum([size for size, lastuse in self.entries.values()])
+
+    def createkey(self, confM2R, group, year, month, day):
+        # Key of the fields of the variables in group for the time step
+        parts = [self.runkey]
+        for myvar in group:
+            varname = confM2R.inputdatavarnames[confM2R.globalvarnames.index(myvar)]
+            filename, record = confM2R.reader.locate(varname, year, month, day)
+            info = os.stat(filename)
+            parts.append("%s:%s:%s:%s:%s:%s" % (myvar, varname, os.path.abspath(filename), info.st_size,
+                                                info.st_mtime, record))
+        return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest() + ".npz"
+
+    def get(self, key):
+        """
+        Returns the results stored for key as in model2roms.convertvariables: a list of (myvar, fields) where
+        fields has the fields of each target. None when key is not in the cache.
+        """
+        # The entry is read while holding the lock so that put in another thread can not evict it meanwhile
+        with self.lock:
+            if key not in self.entries:
+                return None
+            filename = os.path.join(self.folder, key)
+            try:
+                os.utime(filename, None)
+                self.entries[key] = (self.entries[key][0], os.stat(filename).st_mtime)
+
+                cached = np.load(filename)
+                results = []
+                for n, myvar in enumerate(cached["variables"]):
+                    targetfields = []
+                    for t, nfields in enumerate(cached["layout"][n]):
+                        targetfields.append([cached["v%d_t%d_f%d" % (n, t, f)] for f in range(nfields)])
+                    results.append((str(myvar), targetfields))
+                cached.close()
+            except (IOError, OSError):
+                # Removed by another run using the same cache
+                del self.entries[key]
+                return None
+        print("=>Found %s in the field cache" % ", ".join([myvar for myvar, targetfields in results]))
+        return results
+
+    def put(self, key, results):
+        # Store the results of model2roms.convertvariables and remove the least recently used entries when the
+        # cache is full
+        arrays = {"variables": np.array([myvar for myvar, targetfields in results]),
+                  "layout": np.array([[len(fields) for fields in targetfields] for myvar, targetfields in results])}
+        for n, (myvar, targetfields) in enumerate(results):
+            for t, fields in enumerate(targetfields):
+                for f, field in enumerate(fields):
+                    arrays["v%d_t%d_f%d" % (n, t, f)] = np.asarray(field)
+
+        filename = os.path.join(self.folder, key)
+        temporary = "%s.%s.%s.npz" % (filename[:-4], os.getpid(), threading.current_thread().ident)
+        np.savez(temporary, **arrays)
+        os.rename(temporary, filename)
+
+        with self.lock:
+            info = os.stat(filename)
+            self.entries[key] = (info.st_size, info.st_mtime)
+            self.evict()
+
+    def evict(self):
+        total = self.totalsize()
+        for key in sorted(self.entries, key=lambda key: self.entries[key][1]):
+            if total <= self.maxsize:
+                break
+            total -= self.entries[key][0]
+            del self.entries[key]
+            filename = os.path.join(self.folder, key)
+            if os.path.exists(filename):
+                os.remove(filename)
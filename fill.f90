@@ -57,6 +57,7 @@ SUBROUTINE fill(i1,i2,j1,j2,tx,critx,cor,mxs,za,nx,ny)
     INTEGER              :: n, j, i, i1p1, i2m1, j1p1, j2m1, nnn, nbad
     REAL                 :: suma, asuma, crit, crtest
 
+!f2py threadsafe
 !f2py intent(in,out,overwrite)  za
 !f2py intent(in) nx, ny, i1, i2, j1, j2, tx, critx, cor, mxs, nvalue
    
@@ -162,4 +163,40 @@ SUBROUTINE fill(i1,i2,j1,j2,tx,critx,cor,mxs,za,nx,ny)
 
 END SUBROUTINE
 
+SUBROUTINE fill3d(i1,i2,j1,j2,tx,critx,cor,mxs,za,nx,ny,nz)
+
+    !// Calls fill for each of the nz levels of a 3D field za(nz,ny,nx). This is the 'higher level'
+    !// where the parallelization mentioned in fill is done: when compiled with OpenMP
+    !// (see compile.py) the levels are shared between the threads. Each level is solved exactly
+    !// as in fill, so the results are identical to calling fill level by level.
+    !
+    ! f2py --verbose -c -m extrapolate_omp fill.f90 --f90flags="-fopenmp" -lgomp
+
+    IMPLICIT NONE
+
+    INTEGER  :: nx, ny, nz, i1, i2, j1, j2, mxs
+    REAL     :: tx,critx,cor
+
+    REAL, dimension(nz,ny,nx):: za
+    REAL, allocatable, dimension(:,:) :: work
+
+    INTEGER :: k
+
+!f2py threadsafe
+!f2py intent(in,out,overwrite)  za
+!f2py intent(in) nx, ny, nz, i1, i2, j1, j2, tx, critx, cor, mxs
+
+!$omp parallel do private(k,work) schedule(dynamic)
+    DO k=1,nz
+      IF (.NOT. ALLOCATED(work)) ALLOCATE(work(ny,nx))
+      work = za(k,:,:)
+      CALL fill(i1,i2,j1,j2,tx,critx,cor,mxs,work,nx,ny)
+      za(k,:,:) = work
+    END DO
+!$omp end parallel do
+
+    RETURN
+
+END SUBROUTINE
+
 END MODULE
@@ -0,0 +1,54 @@
+from __future__ import print_function
+import os
+
+import interpolation as interp
+import barotropic
+import extrapolate as ex
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    The Fortran kernels (interpolation.f90, barotropic.f90, and fill.f90) are compiled by compile.py
+    into a serial (interpolation, barotropic, extrapolate) and a threaded OpenMP version
+    (interpolation_omp, barotropic_omp, extrapolate_omp) of each module. All calls to the kernels go
+    through the module attributes interp, barotropic, and ex defined here, e.g.:
+
+        fortranKernels.interp.interpolation.dovertinter(...)
+
+    By default the serial modules are used. selectkernels(confM2R) is called from configM2R.py and
+    switches to the threaded modules if confM2R.usethreadedkernels is True, using confM2R.numthreads
+    threads. If the threaded modules have not been compiled the serial ones are kept.
+    """
+
+
+def selectkernels(confM2R):
+    global interp, barotropic, ex
+
+    if not confM2R.usethreadedkernels:
+        print("=>Using serial Fortran kernels")
+        return
+
+    # The OpenMP runtime reads these when it is loaded. Each thread needs a stack large enough to hold the
+    # work arrays used by fill for a full 2D level. Setting them here has no effect when libgomp was already
+    # loaded by an earlier import (numpy or scipy built with OpenMP), so export OMP_STACKSIZE before starting
+    # python (see runM2R.sh).
+    os.environ["OMP_NUM_THREADS"] = str(confM2R.numthreads)
+    os.environ.setdefault("OMP_STACKSIZE", "512M")
+
+    try:
+        import interpolation_omp
+        import barotropic_omp
+        import extrapolate_omp
+    except ImportError:
+        print("Could not find the threaded Fortran kernels (run compile.py): using serial kernels")
+        return
+
+    interpolation_omp.interpolation.setnumthreads(int(confM2R.numthreads))
+
+    interp = interpolation_omp
+    barotropic = barotropic_omp
+    ex = extrapolate_omp
+    print("=>Using threaded Fortran kernels with %s threads" % confM2R.numthreads)
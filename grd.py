@@ -4,6 +4,9 @@ two types of structures as input: SODA or ROMS
 """
 
 from datetime import datetime
+import copy
+import hashlib
+import os
 from netCDF4 import Dataset
 import numpy as np
 
@@ -23,6 +26,11 @@ __version__ = "1.5"
 __status__ = "Development"
 
 
+# ROMS grid variables that are only read from the grid file when used (see Grd.__getattr__)
+lazyvariables = ["lon_vert", "lat_vert", "x_rho", "y_rho", "x_u", "y_u", "x_v", "y_v", "x_psi", "y_psi",
+                 "x_vert", "y_vert", "xl", "el", "dmde", "dndx", "f", "pm", "pn", "spherical"]
+
+
 class Grd:
 
     def __init__(self, grdtype, confM2R):
@@ -47,6 +55,7 @@ class Grd:
         """Open the netCDF file and store the contents in arrays associated with variable names"""
         try:
             self.cdf = Dataset(self.grdfilename, "r")
+            self.variablenames = set(self.cdf.variables)
             print('GRD file : opennetcdf opened file {}'.format(self.grdfilename))
 
         except IOError:
@@ -168,64 +177,20 @@ line = %d and hmin = %d. \n You need to make sure that tcline <= hmin when using
             self.lon_u = self.cdf.variables["lon_u"][:, :]
             self.lat_u = self.cdf.variables["lat_u"][:, :]
             self.mask_u = self.cdf.variables["mask_u"][:, :]
-            for findvar in self.cdf.variables:
-                if findvar == "lon_vert":
-                    self.lon_vert = self.cdf.variables["lon_vert"][:, :]
-                    self.lat_vert = self.cdf.variables["lat_vert"][:, :]
-
-            for findvar in self.cdf.variables:
-                if findvar == "x_rho":
-                    self.x_rho = self.cdf.variables["x_rho"][:, :]
-                    self.y_rho = self.cdf.variables["y_rho"][:, :]
-
-            for findvar in self.cdf.variables:
-                if findvar == "x_u":
-                    self.x_u = self.cdf.variables["x_u"][:, :]
-                    self.y_u = self.cdf.variables["y_u"][:, :]
-
-            for findvar in self.cdf.variables:
-                if findvar == "x_v":
-                    self.x_v = self.cdf.variables["x_v"][:, :]
-                    self.y_v = self.cdf.variables["y_v"][:, :]
-
-            for findvar in self.cdf.variables:
-                if findvar == "x_psi":
-                    self.x_psi = self.cdf.variables["x_psi"][:, :]
-                    self.y_psi = self.cdf.variables["y_psi"][:, :]
-
-            for findvar in self.cdf.variables:
-                if findvar == "x_vert":
-                    self.x_vert = self.cdf.variables["x_vert"][:, :]
-                    self.y_vert = self.cdf.variables["y_vert"][:, :]
-
-            for findvar in self.cdf.variables:
-                if findvar == "xl":
-                    self.xl = self.cdf.variables["xl"][:]
-                    self.el = self.cdf.variables["el"][:]
-
-            for findvar in self.cdf.variables:
-                if findvar == "dmde":
-                    self.dmde = self.cdf.variables["dmde"][:, :]
-                    self.dndx = self.cdf.variables["dndx"][:, :]
+
+            # The curvilinear coordinates, metrics, and Coriolis parameter are read from the grid file the first
+            # time they are used (see __getattr__ and lazyvariables)
 
             self.lon_v = self.cdf.variables["lon_v"][:, :]
             self.lat_v = self.cdf.variables["lat_v"][:, :]
             self.mask_v = self.cdf.variables["mask_v"][:, :]
 
-            self.spherical = self.cdf.variables["spherical"][:]
-
             self.lon_psi = self.lon_u[:-1, :]
             self.lat_psi = self.lat_v[:, :-1]
             self.mask_psi = self.mask_v[:, :-1]
 
-            self.f = self.cdf.variables["f"][:, :]
             self.angle = self.cdf.variables["angle"][:, :]
 
-            self.pm = self.cdf.variables["pm"][:, :]
-            self.invpm = 1.0 / np.asarray(self.cdf.variables["pm"][:, :])
-            self.pn = self.cdf.variables["pn"][:, :]
-            self.invpn = 1.0 / np.asarray(self.cdf.variables["pn"][:, :])
-
             self.Lp = len(self.lat_rho[1, :])
             self.Mp = len(self.lat_rho[:, 1])
 
@@ -260,6 +225,130 @@ line = %d and hmin = %d. \n You need to make sure that tcline <= hmin when using
                 self.esmfgrid = ESMF.Grid(filename=self.grdfilename, filetype=ESMF.FileFormat.GRIDSPEC,
                                           is_sphere=True, coord_names=[self.lonname, self.latname], add_mask=False)
 
+        # Everything needed is read: the remaining variables are read on demand by __getattr__
+        self.cdf.close()
+        del self.cdf
+
+    def __getattr__(self, name):
+        """
+        Read the grid variables in lazyvariables from the grid file the first time they are used (only called
+        when name is not already an attribute). Variables that are not in the grid file raise AttributeError
+        as before. invpm and invpn are calculated from pm and pn. A subgrid (createsubgrid) only reads its
+        own window of the grid file.
+        """
+        if name in ["invpm", "invpn"]:
+            value = 1.0 / np.asarray(getattr(self, name[3:]))
+        elif name in lazyvariables and name in self.__dict__.get("variablenames", ()):
+            cdf = Dataset(self.grdfilename, "r")
+            variable = cdf.variables[name]
+            window = self.__dict__.get("window")
+            if window is None:
+                value = variable[:]
+            else:
+                value = variable[tuple([windowslice(dimension, window) for dimension in variable.dimensions])]
+            cdf.close()
+        else:
+            raise AttributeError(name)
+
+        setattr(self, name, value)
+        return value
+
+    def createsubgrid(self, confM2R, j0, j1, i0, i1):
+        """
+        Create a ROMS grid object for the window [j0:j1, i0:i1] (rho points) of this ROMS grid. The window
+        is a complete ROMS grid with its own U and V points, vertical grid, and ESMF grids so that it can be
+        used in place of confM2R.grdROMS. Used to interpolate only a narrow strip along each boundary
+        (bryonly in configM2R.py).
+        """
+        subgrid = copy.copy(self)
+
+        # The window of the grid file, also for a subgrid of a subgrid
+        fj0, fj1, fi0, fi1 = self.__dict__.get("window") or (0, self.eta_rho, 0, self.xi_rho)
+        subgrid.window = (fj0 + j0, fj0 + j1, fi0 + i0, fi0 + i1)
+
+        # The lazy variables that are not read yet are read by the subgrid for its own window (__getattr__)
+        for name in lazyvariables + ["invpm", "invpn"]:
+            subgrid.__dict__.pop(name, None)
+        for name in ["f", "pm", "pn", "invpm", "invpn"]:
+            if name in self.__dict__:
+                setattr(subgrid, name, self.__dict__[name][j0:j1, i0:i1])
+
+        for name in ["mask_rho", "lon_rho", "lat_rho", "h", "zeta", "angle"]:
+            setattr(subgrid, name, getattr(self, name)[j0:j1, i0:i1])
+        for name in ["z_r", "z_w"]:
+            setattr(subgrid, name, getattr(self, name)[:, j0:j1, i0:i1])
+        for name in ["mask_u", "lon_u", "lat_u"]:
+            setattr(subgrid, name, getattr(self, name)[j0:j1, i0:i1 - 1])
+        for name in ["mask_v", "lon_v", "lat_v"]:
+            setattr(subgrid, name, getattr(self, name)[j0:j1 - 1, i0:i1])
+
+        subgrid.Lp = i1 - i0
+        subgrid.Mp = j1 - j0
+        subgrid.eta_rho = subgrid.Mp
+        subgrid.eta_u = subgrid.Mp
+        subgrid.eta_v = subgrid.Mp - 1
+        subgrid.eta_psi = subgrid.Mp - 1
+        subgrid.xi_rho = subgrid.Lp
+        subgrid.xi_u = subgrid.Lp - 1
+        subgrid.xi_v = subgrid.Lp
+        subgrid.xi_psi = subgrid.Lp - 1
+        subgrid.M = subgrid.Mp - 1
+        subgrid.L = subgrid.Lp - 1
+
+        if confM2R.useesmf:
+            subgrid.esmfgrid = createesmfgrid(subgrid.lon_rho, subgrid.lat_rho)
+            subgrid.esmfgrid_u = createesmfgrid(subgrid.lon_u, subgrid.lat_u)
+            subgrid.esmfgrid_v = createesmfgrid(subgrid.lon_v, subgrid.lat_v)
+
+        return subgrid
+
+    def savesnapshot(self, filename):
+        """
+        Store the arrays and scalar attributes of this ROMS grid object (everything created by createobject
+        except the open netCDF file and the ESMF grids) in the npz file filename. See loadsnapshot.
+        """
+        arrays = {}
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                arrays[name] = np.ma.getdata(value)
+                # The masks of masked arrays are stored next to the data and restored by loadsnapshot
+                if np.ma.isMaskedArray(value):
+                    arrays[name + "__mask"] = np.ma.getmaskarray(value)
+            elif isinstance(value, (bool, int, float, str, np.number)):
+                arrays[name] = np.asarray(value)
+            elif name == "variablenames":
+                arrays[name] = np.asarray(sorted(value))
+
+        # Write to a temporary file first so that other processes (MPI ranks) never read a partial file
+        temporary = "%s.%s.npz" % (os.path.splitext(filename)[0], os.getpid())
+        np.savez(temporary, **arrays)
+        os.rename(temporary, filename)
+        print('---> Stored grid snapshot in %s' % filename)
+
+    def loadsnapshot(self, confM2R, filename):
+        """
+        Read the grid object stored by savesnapshot instead of reading the grid file and calculating the
+        vertical grid. The ESMF grids are created directly from the coordinate arrays.
+        """
+        snapshot = np.load(filename)
+        for name in snapshot.files:
+            if name.endswith("__mask"):
+                continue
+            value = snapshot[name]
+            if name + "__mask" in snapshot.files:
+                value = np.ma.array(value, mask=snapshot[name + "__mask"])
+            setattr(self, name, value.item() if value.ndim == 0 else value)
+        snapshot.close()
+        if "variablenames" in self.__dict__:
+            self.variablenames = set(self.variablenames)
+
+        self.message = None
+        if confM2R.useesmf:
+            self.esmfgrid = createesmfgrid(self.lon_rho, self.lat_rho)
+            self.esmfgrid_u = createesmfgrid(self.lon_u, self.lat_u)
+            self.esmfgrid_v = createesmfgrid(self.lon_v, self.lat_v)
+        print('---> Read grid snapshot from %s' % filename)
+
     def getdims(self):
         if self.type in ["ROMS"]:
             self.Lp = len(self.lat_rho[1, :])
@@ -271,3 +360,50 @@ line = %d and hmin = %d. \n You need to make sure that tcline <= hmin when using
 
         self.M = self.Mp - 1
         self.L = self.Lp - 1
+
+
+def windowslice(dimension, window):
+    # The part of a grid file dimension covered by the window (j0, j1, i0, i1) of rho points
+    j0, j1, i0, i1 = window
+    slices = {"eta_rho": slice(j0, j1), "xi_rho": slice(i0, i1),
+              "eta_u": slice(j0, j1), "xi_u": slice(i0, i1 - 1),
+              "eta_v": slice(j0, j1 - 1), "xi_v": slice(i0, i1),
+              "eta_psi": slice(j0, j1 - 1), "xi_psi": slice(i0, i1 - 1),
+              "eta_vert": slice(j0, j1 + 1), "xi_vert": slice(i0, i1 + 1)}
+    return slices.get(dimension, slice(None))
+
+
+def createesmfgrid(lon, lat):
+    """
+    Create a spherical ESMF grid from the 2D coordinate arrays lon and lat (eta, xi). ESMF uses (x, y)
+    order so the coordinates are transposed the same way as the data given to the ESMF fields.
+    """
+    grid = ESMF.Grid(np.array(np.shape(lon)[::-1]), staggerloc=ESMF.StaggerLoc.CENTER,
+                     coord_sys=ESMF.CoordSys.SPH_DEG)
+    lower = grid.lower_bounds[ESMF.StaggerLoc.CENTER]
+    upper = grid.upper_bounds[ESMF.StaggerLoc.CENTER]
+
+    gridlon = grid.get_coords(0, staggerloc=ESMF.StaggerLoc.CENTER)
+    gridlat = grid.get_coords(1, staggerloc=ESMF.StaggerLoc.CENTER)
+    gridlon[...] = np.asarray(lon).T[lower[0]:upper[0], lower[1]:upper[1]]
+    gridlat[...] = np.asarray(lat).T[lower[0]:upper[0], lower[1]:upper[1]]
+
+    return grid
+
+
+def snapshotfilename(confM2R):
+    """
+    Name of the grid snapshot file (see Grd.savesnapshot) for the ROMS grid confM2R.romsgridpath. The name
+    contains a checksum of the grid file and of the vertical grid parameters so that a changed grid file or
+    vertical grid gives a new snapshot.
+    """
+    checksum = hashlib.sha1()
+    with open(confM2R.romsgridpath, 'rb') as gridfile:
+        for block in iter(lambda: gridfile.read(1 << 20), b''):
+            checksum.update(block)
+
+    vertical = (confM2R.nlevels, confM2R.vstretching, confM2R.vtransform,
+                confM2R.theta_s, confM2R.theta_b, confM2R.tcline, confM2R.hc)
+    checksum.update(repr(vertical).encode())
+
+    return os.path.join(confM2R.cachedir, "%s_grid_%s.npz" % (confM2R.outgrid, checksum.hexdigest()[:16]))
@@ -0,0 +1,167 @@
+from __future__ import print_function
+from collections import namedtuple
+import hashlib
+import os
+import pickle
+import numpy as np
+from netCDF4 import Dataset, num2date
+
+import datetimeFunctions
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Catalog of the input files in modelpath (usecatalog in configM2R.py). The folder is scanned once and every
+    record of every variable with a time axis is indexed by its date:
+
+        (variable, year, month, day) -> (filename, record, time units, calendar, time value)
+
+    Monthly means are also indexed by (variable, year, month) when the month has only one record, so that the
+    day used by model2roms (the 15th) does not have to match the date stored in the file. The input readers
+    (inputReaders.py) look up the file and record of each time step instead of constructing the filename for
+    each dataset and searching the time axis.
+
+    The catalog is stored in cachedir and only files that are new or changed (size or modification time) are
+    opened again in the next run. All time steps of the run are checked before the conversion starts and the
+    missing inputs are listed.
+
+    Only files with a time axis (confM2R.timename, time, time_counter, or ocean_time) are indexed, so files
+    without a time dimension (SODAMONTHLY) are not supported.
+    """
+
+
+CatalogEntry = namedtuple('CatalogEntry', ['filename', 'record', 'units', 'calendar', 'value'])
+
+TIMENAMES = ['time', 'time_counter', 'ocean_time']
+
+
+def catalogfilename(confM2R):
+    key = hashlib.sha1(os.path.abspath(confM2R.modelpath).encode('utf-8')).hexdigest()[0:16]
+    return os.path.join(confM2R.cachedir, "%s_catalog_%s.pkl" % (confM2R.indatatype, key))
+
+
+def listinputfiles(modelpath):
+    # All netCDF files below modelpath with their size and modification time
+    inputfiles = {}
+    for folder, folders, filenames in os.walk(modelpath):
+        for filename in filenames:
+            if os.path.splitext(filename)[1] in ['.nc', '.cdf', '.nc4']:
+                path = os.path.join(folder, filename)
+                info = os.stat(path)
+                inputfiles[path] = (info.st_size, info.st_mtime)
+    return inputfiles
+
+
+def scanfile(filename, timenames):
+    # List (variable, year, month, day, entry) for all records of the variables with a time axis in filename
+    records = []
+    cdf = Dataset(filename)
+    timename = [name for name in timenames if name in cdf.variables and cdf.variables[name].ndim == 1]
+    if timename:
+        timevariable = cdf.variables[timename[0]]
+        units = timevariable.units
+        calendar = getattr(timevariable, 'calendar', 'standard')
+        values = np.atleast_1d(timevariable[:])
+        try:
+            dates = np.atleast_1d(num2date(values, units=units, calendar=calendar))
+        except ValueError:
+            print("=>Could not read the time axis of %s (%s)" % (filename, units))
+            dates = []
+
+        for name, variable in cdf.variables.items():
+            if name == timename[0] or variable.ndim == 0 or variable.dimensions[0] != timevariable.dimensions[0]:
+                continue
+            for record, date in enumerate(dates):
+                entry = CatalogEntry(filename, record, units, calendar, float(values[record]))
+                records.append((name, date.year, date.month, date.day, entry))
+    cdf.close()
+    return records
+
+
+class InputCatalog(object):
+
+    def __init__(self, confM2R):
+        self.modelpath = confM2R.modelpath
+        self.cachefile = catalogfilename(confM2R)
+        self.timenames = [confM2R.timename] + [name for name in TIMENAMES if name != confM2R.timename]
+        self.files = {}
+        self.index = {}
+
+        self.loadcache()
+        self.update()
+
+    def loadcache(self):
+        if not os.path.exists(self.cachefile):
+            return
+        with open(self.cachefile, "rb") as cache:
+            self.files = pickle.load(cache)
+        print("=>Read the input catalog from %s" % self.cachefile)
+
+    def savecache(self):
+        if not os.path.exists(os.path.dirname(self.cachefile)):
+            os.makedirs(os.path.dirname(self.cachefile))
+        base, extension = os.path.splitext(self.cachefile)
+        temporary = "%s.%s%s" % (base, os.getpid(), extension)
+        with open(temporary, "wb") as cache:
+            pickle.dump(self.files, cache, protocol=2)
+        os.rename(temporary, self.cachefile)
+
+    def update(self):
+        """
+        Scan modelpath and index the files that are new or changed since the catalog was stored. Files that
+        no longer exist are removed from the catalog.
+        """
+        inputfiles = listinputfiles(self.modelpath)
+        changed = [filename for filename, stat in inputfiles.items()
+                   if filename not in self.files or self.files[filename][0] != stat]
+
+        for filename in sorted(changed):
+            self.files[filename] = (inputfiles[filename], scanfile(filename, self.timenames))
+        removed = [filename for filename in self.files if filename not in inputfiles]
+        for filename in removed:
+            del self.files[filename]
+
+        print("=>Input catalog of %s: %s files (%s new or changed)" % (self.modelpath, len(inputfiles), len(changed)))
+        if changed or removed:
+            self.savecache()
+
+        # A month with more than one record of a variable is not indexed by month
+        self.index = {}
+        for filename in sorted(self.files):
+            for name, year, month, day, entry in self.files[filename][1]:
+                self.index[(name, year, month, day)] = entry
+                monthkey = (name, year, month)
+                self.index[monthkey] = None if monthkey in self.index else entry
+
+    def lookup(self, varname, year, month, day):
+        # The input file and record of varname for the date (or the only record of the month). None if missing
+        entry = self.index.get((varname, year, month, day))
+        if entry is None:
+            entry = self.index.get((varname, year, month))
+        return entry
+
+    def findmissing(self, varnames, dates):
+        # List the (variable, year, month, day) of the run that are not found in the catalog
+        return [(varname, year, month, day) for year, month, day in dates for varname in varnames
+                if self.lookup(varname, year, month, day) is None]
+
+
+def createcatalog(confM2R):
+    """
+    Create the catalog of modelpath and check that all input variables are found for all time steps of the
+    run. The missing inputs are listed and the run stopped before the conversion starts.
+    """
+    catalog = InputCatalog(confM2R)
+
+    varnames = [confM2R.inputdatavarnames[n] for n in range(len(confM2R.globalvarnames))]
+    missing = catalog.findmissing(varnames, datetimeFunctions.createlistofdates(confM2R))
+    if missing:
+        print("=>Could not find %s inputs in %s:" % (len(missing), confM2R.modelpath))
+        for varname, year, month, day in missing:
+            print("   %s %04d-%02d-%02d" % (varname, year, month, day))
+        raise IOError("Missing input data in %s" % confM2R.modelpath)
+
+    return catalog
@@ -0,0 +1,348 @@
+from __future__ import print_function
+from datetime import datetime
+import os
+import numpy as np
+from netCDF4 import Dataset, date2num, num2date
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    One reader class for each input dataset (indatatype in configM2R.py). A reader describes how the dataset
+    is stored on disk:
+
+        timename        name of the time variable in the input files
+        recordsperfile  number of time records in each file (12 for yearly files of monthly means, 1 for one
+                        file per time step, None when all time steps are in one file)
+        filename()      the file holding a variable for a given month (the variables can be grouped in several
+                        files, e.g. ocean and ice)
+        record()        the record of the time step in that file (None for files without a time dimension)
+        convert3d(),    unit conversions and masking applied after reading
+        convert2d()
+
+    model2roms.py reads all data through the reader (getTime, get3ddata, get2ddata, getdatablock). readblock
+    reads the records of several months in one read when they are stored as consecutive records of one file
+    (timebatch in configM2R.py). With usecatalog the files and records are looked up in the input catalog
+    (inputCatalog.py) instead.
+
+    To add a new dataset, write a subclass of InputReader and add it to readers below.
+    """
+
+
+class InputReader(object):
+    timename = "time"
+    recordsperfile = 1
+    # Input files where the masked values are replaced by fillval after reading
+    fillmasked = False
+
+    def __init__(self, confM2R):
+        self.confM2R = confM2R
+        self.modelpath = confM2R.modelpath
+        self.fillval = confM2R.grdROMS.fillval
+        self.catalog = getattr(confM2R, 'catalog', None) if confM2R.usecatalog else None
+
+    def filename(self, varname, year, month, day):
+        raise NotImplementedError("No input files defined for %s" % self.confM2R.indatatype)
+
+    def record(self, varname, year, month, day):
+        return 0
+
+    def gridfilename(self):
+        # The input file used to create the input grid object (grd.py)
+        return self.locate(self.confM2R.inputdatavarnames[1], self.confM2R.start_year, self.confM2R.start_month,
+                           self.confM2R.start_day)[0]
+
+    def locate(self, varname, year, month, day):
+        # The file and record of varname for the time step
+        if self.catalog is not None:
+            entry = self.catalog.lookup(varname, year, month, day)
+            return entry.filename, entry.record
+        return self.filename(varname, year, month, day), self.record(varname, year, month, day)
+
+    def timeaxis(self, year, month, day):
+        # Units, calendar, and value of the time axis of the time step
+        varname = self.confM2R.inputdatavarnames[0]
+        if self.catalog is not None:
+            entry = self.catalog.lookup(varname, year, month, day)
+            return entry.units, entry.calendar, entry.value
+
+        filename, record = self.locate(varname, year, month, day)
+        cdf = Dataset(filename)
+        timevariable = cdf.variables[self.timename]
+        units = timevariable.units
+        calendar = getattr(timevariable, "calendar", "standard")
+        value = timevariable[record or 0]
+        cdf.close()
+        return units, calendar, value
+
+    def gettime(self, year, month, day):
+        """
+        Returns the time since 1948-01-01 of the time step, the reference time (1948-01-01), the units of the
+        time axis, and the date.
+        """
+        units, calendar, value = self.timeaxis(year, month, day)
+        jdref = date2num(datetime(1948, 1, 1), units, calendar=calendar)
+        currentdate = datetime(year, month, day)
+        jd = date2num(currentdate, units, calendar=calendar)
+        return jd - jdref, jdref, units, currentdate
+
+    def read(self, varname, year, month, day, index):
+        # Read the part index of the record of varname for the time step. Returns the data and units.
+        filename, record = self.locate(varname, year, month, day)
+        cdf = Dataset(filename)
+        variable = cdf.variables[varname]
+        data = variable[tuple(index) if record is None else (record,) + tuple(index)]
+        units = getattr(variable, 'units', None)
+        cdf.close()
+        return data, units
+
+    def index2d(self, myvar):
+        return slice(None), slice(None)
+
+    def read3d(self, myvar, varname, year, month, day, levels):
+        data, units = self.read(varname, year, month, day, (levels, slice(None), slice(None)))
+        return self.convert3d(myvar, self.fill(data), units)
+
+    def read2d(self, myvar, varname, year, month, day):
+        data, units = self.read(varname, year, month, day, self.index2d(myvar))
+        return self.convert2d(myvar, self.fill(data), units)
+
+    def readblock(self, myvar, varname, year, months, levels):
+        """
+        Read the records of the months of year (monthly data) in as few reads as possible. Consecutive records
+        in the same file are read in one read. Returns an array (month, level, eta, xi) or (month, eta, xi).
+        """
+        index = (levels, slice(None), slice(None)) if levels is not None else self.index2d(myvar)
+        locations = [self.locate(varname, year, month, 15) for month in months]
+        filenames = set([filename for filename, record in locations])
+        records = [record for filename, record in locations]
+
+        if len(filenames) == 1 and None not in records and records == list(range(records[0], records[0] + len(months))):
+            print("=>Extracting data for months %s to %s from %s " % (months[0], months[-1], locations[0][0]))
+            cdf = Dataset(locations[0][0])
+            variable = cdf.variables[varname]
+            data = variable[(slice(records[0], records[-1] + 1),) + tuple(index)]
+            units = getattr(variable, 'units', None)
+            cdf.close()
+        else:
+            blocks = [self.read(varname, year, month, 15, index) for month in months]
+            data, units = np.ma.array([block[0] for block in blocks]), blocks[0][1]
+
+        data = self.fill(data)
+        if levels is not None:
+            return self.convert3d(myvar, data, units)
+        return self.convert2d(myvar, data, units)
+
+    def fill(self, data):
+        if self.fillmasked:
+            return np.where(np.ma.getmaskarray(data), self.fillval, data)
+        return data
+
+    def convert3d(self, myvar, data, units):
+        return data
+
+    def convert2d(self, myvar, data, units):
+        return data
+
+
+class SODAReader(InputReader):
+    # One file per month
+
+    def filename(self, varname, year, month, day):
+        return self.modelpath + "SODA_2.0.2_" + str(year) + "_" + str(month) + ".cdf"
+
+
+class SODAMONTHLYReader(InputReader):
+    # One file per month without a time dimension in the data variables
+
+    def filename(self, varname, year, month, day):
+        return self.modelpath + 'SODA_2.0.2_%s%02d.cdf' % (year, month)
+
+    def record(self, varname, year, month, day):
+        return None
+
+
+class SODA3Reader(InputReader):
+    # Yearly files of monthly means with the ice variables in separate files
+    recordsperfile = 12
+    icevariables = ['cn', 'hi', 'hs']
+
+    def filename(self, varname, year, month, day):
+        if varname in self.icevariables:
+            return self.modelpath + "soda3.3.1_mn_ice_reg_" + str(year) + ".nc"
+        return self.modelpath + "soda3.3.1_mn_ocean_reg_" + str(year) + ".nc"
+
+    def record(self, varname, year, month, day):
+        return month - 1
+
+    def index2d(self, myvar):
+        # We only extract the first thickness concentration. Need to fix this so all 5 classes can be extracted.
+        # http://www.atmos.umd.edu/~ocean/index_files/soda3_readme.htm
+        # hi: sea ice thickness [m ice]
+        # mi: sea ice mass [kg/m^2]
+        # hs: snow thickness [m snow]
+        # {cn1,cn2,cn3,cn4,cn5}: sea ice concentration [0:1] in five ice thickness classes
+        if myvar == 'aice':
+            return 0, slice(None), slice(None)
+        return slice(None), slice(None)
+
+    def gettime(self, year, month, day):
+        # Each SODA file represents 12 month averages.
+        units, calendar, value = self.timeaxis(year, month, day)
+        jdref = date2num(datetime(1948, 1, 1), units="days since 1948-01-01 00:00:00", calendar="standard")
+        currentdate = datetime(year, month, day)
+        jd = date2num(currentdate, units="days since 1948-01-01 00:00:00", calendar="standard")
+        return jd - jdref, jdref, units, currentdate
+
+
+class WOAMONTHLYReader(InputReader):
+    # Monthly climatology with one file per variable
+    recordsperfile = 12
+
+    def filename(self, varname, year, month, day):
+        if varname in ["temperature", "salinity"]:
+            return self.modelpath + '%s_monthly_1deg.nc' % varname
+        print("Could not find any input files in folder: %s" % self.modelpath)
+
+    def record(self, varname, year, month, day):
+        return month - 1
+
+
+class KelvinReader(InputReader):
+    # Datasets that may store the temperature in Kelvin
+    fillmasked = True
+
+    def convert3d(self, myvar, data, units):
+        if myvar == 'temperature' and units in ["degree_Kelvin", "K"]:
+            data = data - 273.15
+        return data
+
+
+class NORESMReader(KelvinReader):
+    # Monthly ocean files and yearly ice files (12 records)
+    icevariables = ['iage', 'uvel', 'vvel', 'aice', 'hi', 'hs']
+
+    def filename(self, varname, year, month, day):
+        if varname in self.icevariables:
+            return self.modelpath + 'ICE/NRCP45AERCN_f19_g16_CLE_01.cice.h.' + str(year) + '.nc'
+        return self.modelpath + 'OCN/NRCP45AERCN_f19_g16_CLE_01.micom.hm.%s-%02d.nc' % (year, month)
+
+    def record(self, varname, year, month, day):
+        # For NORESM data are 12 months of data stored in ice files
+        if varname in self.icevariables:
+            return month - 1
+        return 0
+
+    def gridfilename(self):
+        return self.modelpath + 'GRID/NorESM.nc'
+
+    def gettime(self, year, month, day):
+        # Find the day and month that the NORESM file. We need to use the time modules from
+        # netcdf4 for python as they handle calendars that are no_leap.
+        # http://www.esrl.noaa.gov/psd/people/jeffrey.s.whitaker/python/netcdftime.html#datetime
+        units, calendar, value = self.timeaxis(year, month, day)
+        jdref = date2num(datetime(1800, 1, 1), units, calendar=calendar)
+        currentdate = num2date(value, units=units, calendar=calendar)
+        jd = date2num(currentdate, units, calendar='noleap')
+        return jd - jdref, jdref, units, currentdate
+
+
+class GLORYSReader(KelvinReader):
+    # One file per month and variable group. The files are renamed (production) in the middle of the series.
+    timename = "time_counter"
+
+    def filename(self, varname, year, month, day):
+        if varname in ['iicevelu', 'iicevelv', 'ileadfra', 'iicethic']:
+            prefix, group = 'icemod', 'ice'
+        elif varname in ['sossheig']:
+            prefix, group = 'grid2D' if year == 2014 else 'SSH', 'ssh'
+        elif varname in ['vozocrtx', 'vomecrty']:
+            prefix, group = 'gridUV', 'u-v'
+        elif varname in ['votemper']:
+            prefix, group = 'gridT', 't'
+        elif varname in ['vosaline']:
+            prefix, group = 'gridS', 's'
+        else:
+            prefix, group = 'grid' + str(varname.upper()), varname
+
+        # GLORYS change the name in the middle of the time-series (on December 2010) and we have to
+        # account for that
+        if year == 2014:
+            production = "R20151218"
+        elif (2013 > year >= 2010 and month == 12) or (2013 > year >= 2011):
+            production = "R20140520"
+        elif year == 2013:
+            production = "R20141205"
+        else:
+            production = "R20130808"
+
+        return self.modelpath + 'dataset-global-reanalysis-phys-001-009-ran-fr-glorys2v3-monthly-' + \
+               group.lower() + '/GLORYS2V3_ORCA025_%s%02d15_%s_%s.nc' % (year, month, production, prefix)
+
+    def convert3d(self, myvar, data, units):
+        if myvar == 'temperature' and units in ["degree_Kelvin", "K"]:
+            data = np.where(data <= -32.767, self.fillval, data)
+            data = data - 273.15
+        data = np.where(data <= -32.767, self.fillval, data)
+        return np.ma.masked_where(data <= self.fillval, data)
+
+
+class NS8KMReader(InputReader):
+    # One file per month
+    timename = "ocean_time"
+
+    def filename(self, varname, year, month, day):
+        return self.modelpath + '%s%02d15_mm-IMR-MODEL-ROMS-NWS-20140430-fv02.1.nc' % (year, month)
+
+
+class NS8KMZReader(KelvinReader):
+    # One file per month, or all time steps in one file (allinonefile)
+    recordsperfile = 1
+    # allinonefile = '/work/users/trondk/KINO/FORCING/1600M/northsea_8km_z_mean.nc_2010-2013.nc'
+    allinonefile = ''
+
+    def __init__(self, confM2R):
+        super(NS8KMZReader, self).__init__(confM2R)
+        self.timeindex = None
+        if os.path.exists(self.allinonefile):
+            print("NOTE ! READING ALL MYOCEAN FORCING DATA FROM ONE FILE")
+            self.recordsperfile = None
+
+    def filename(self, varname, year, month, day):
+        if self.recordsperfile is None:
+            return self.allinonefile
+        return self.modelpath + '%s%02d15_mm-IMR-MODEL-ROMS-NWS-20160203-fv02.1.nc' % (year, month)
+
+    def record(self, varname, year, month, day):
+        if self.recordsperfile is not None:
+            return 0
+        # The records of the file are found from the time axis (read once)
+        if self.timeindex is None:
+            cdf = Dataset(self.allinonefile)
+            self.timeunits = cdf.variables["time"].units
+            self.timeindex = dict((value, record) for record, value in enumerate(cdf.variables["time"][:].tolist()))
+            cdf.close()
+        return self.timeindex[date2num(datetime(year, month, day, 12), self.timeunits, calendar="gregorian")]
+
+    def gettime(self, year, month, day):
+        units, calendar, value = self.timeaxis(year, month, day)
+        jdref = date2num(datetime(1948, 1, 1), units="days since 1948-01-01 00:00:00", calendar="standard")
+        currentdate = datetime(year, month, day)
+        jd = date2num(currentdate, units, calendar="gregorian")
+        return jd - jdref, jdref, units, currentdate
+
+
+readers = {'SODA': SODAReader,
+           'SODAMONTHLY': SODAMONTHLYReader,
+           'SODA3': SODA3Reader,
+           'WOAMONTHLY': WOAMONTHLYReader,
+           'NORESM': NORESMReader,
+           'GLORYS': GLORYSReader,
+           'NS8KM': NS8KMReader,
+           'NS8KMZ': NS8KMZReader}
+
+
+def createreader(confM2R):
+    return readers[confM2R.indatatype](confM2R)
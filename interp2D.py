@@ -1,7 +1,7 @@
 from __future__ import print_function
 import numpy as np
 import datetime
-import extrapolate as ex
+import fortranKernels
 
 try:
     import ESMF
@@ -26,12 +26,33 @@ def laplacefilter(field, threshold, toxi, toeta):
 
     field = np.where(abs(field) > threshold, undef, field)
 
-    field = ex.extrapolate.fill(int(1), int(toxi),
-                                int(1), int(toeta),
-                                float(tx), float(critx), float(cor), float(mxs),
-                                np.asarray(field, order='Fortran'),
-                                int(toxi),
-                                int(toeta))
+    field = fortranKernels.ex.extrapolate.fill(int(1), int(toxi),
+                                               int(1), int(toeta),
+                                               float(tx), float(critx), float(cor), float(mxs),
+                                               np.asarray(field, order='Fortran'),
+                                               int(toxi),
+                                               int(toeta))
+    return field
+
+
+def laplacefilter3d(field, threshold, toxi, toeta):
+    # Same as laplacefilter but for all levels of a 3D field (nlevels, eta, xi) in one call. The
+    # threaded version of the kernel (extrapolate_omp) shares the levels between the threads.
+    undef = 2.0e+35
+    tx = 0.9 * undef
+    critx = 0.01
+    cor = 1.6
+    mxs = 10
+
+    field = np.where(abs(field) > threshold, undef, field)
+
+    field = fortranKernels.ex.extrapolate.fill3d(int(1), int(toxi),
+                                                 int(1), int(toeta),
+                                                 float(tx), float(critx), float(cor), int(mxs),
+                                                 np.asarray(field, order='Fortran'),
+                                                 int(toxi),
+                                                 int(toeta),
+                                                 int(field.shape[0]))
     return field
 
 
@@ -56,8 +77,6 @@ def dohorinterpolationregulargrid(confM2R, mydata):
             # Since ESMF uses coordinates (x,y) we need to rotate and flip to get back to (y,x) order.
             field = np.fliplr(np.rot90(field.data, 3))
 
-        if confM2R.usefilter:
-            field = laplacefilter(field, 1000, confM2R.grdROMS.xi_rho, confM2R.grdROMS.eta_rho)
         #  field=field*grdROMS.mask_rho
 
         array1[k, :, :] = field
@@ -71,6 +90,12 @@ def dohorinterpolationregulargrid(confM2R, mydata):
         if confM2R.showprogress is True:
             progress.update(k)
 
+    # Extrapolate into the areas without data for all levels at once
+    if confM2R.usefilter and confM2R.extrapolationmethod == "nearest":
+        array1 = confM2R.grdROMS.extrapolation_rho.fill3d(array1, 1000)
+    elif confM2R.usefilter:
+        array1 = laplacefilter3d(array1, 1000, confM2R.grdROMS.xi_rho, confM2R.grdROMS.eta_rho)
+
     return array1
 
 
@@ -80,16 +105,19 @@ def dohorinterpolationsshregulargrid(confM2R, myvar, mydata):
         toxi = confM2R.grdROMS.xi_u
         toeta = confM2R.grdROMS.eta_u
         mymask = confM2R.grdROMS.mask_u
+        extrapolationmap = getattr(confM2R.grdROMS, "extrapolation_u", None)
     elif myvar in ["vice"]:
         indexROMS_Z_ST = (confM2R.grdMODEL.nlevels, confM2R.grdROMS.eta_v, confM2R.grdROMS.xi_v)
         toxi = confM2R.grdROMS.xi_v
         toeta = confM2R.grdROMS.eta_v
         mymask = confM2R.grdROMS.mask_v
+        extrapolationmap = getattr(confM2R.grdROMS, "extrapolation_v", None)
     else:
         indexROMS_Z_ST = (confM2R.grdMODEL.nlevels, confM2R.grdROMS.eta_rho, confM2R.grdROMS.xi_rho)
         toxi = confM2R.grdROMS.xi_rho
         toeta = confM2R.grdROMS.eta_rho
         mymask = confM2R.grdROMS.mask_rho
+        extrapolationmap = getattr(confM2R.grdROMS, "extrapolation_rho", None)
 
     array1 = np.zeros((indexROMS_Z_ST), dtype=np.float64)
 
@@ -110,7 +138,9 @@ def dohorinterpolationsshregulargrid(confM2R, myvar, mydata):
         #     plotData.contourMap(grdROMS,grdROMS.lon_rho,grdROMS.lat_rho, field, "surface", myvar)
 
     # Smooth the output
-    if confM2R.usefilter:
+    if confM2R.usefilter and confM2R.extrapolationmethod == "nearest":
+        field = extrapolationmap.fill(field, 1000)
+    elif confM2R.usefilter:
         field = laplacefilter(field, 1000, toxi, toeta)
     field = field * mymask
     array1[0, :, :] = field
@@ -119,3 +149,41 @@ def dohorinterpolationsshregulargrid(confM2R, myvar, mydata):
     #  plotData.contourMap(grdROMS, tolon, tolat, field, "34", myvar)
 
     return array1
+
+
+def dohorinterpolationblock(confM2R, myvar, datablock):
+    # Horizontal interpolation of a block of time records (time, level, eta, xi) or (time, eta, xi) in one
+    # sparse matrix product with the regrid weights (see regridWeights.py). Used when timebatch is True.
+    if myvar in ["uice"]:
+        weights = confM2R.grdMODEL.weights_u
+        mymask = confM2R.grdROMS.mask_u
+        extrapolationmap = getattr(confM2R.grdROMS, "extrapolation_u", None)
+    elif myvar in ["vice"]:
+        weights = confM2R.grdMODEL.weights_v
+        mymask = confM2R.grdROMS.mask_v
+        extrapolationmap = getattr(confM2R.grdROMS, "extrapolation_v", None)
+    else:
+        weights = confM2R.grdMODEL.weights_rho
+        mymask = confM2R.grdROMS.mask_rho
+        extrapolationmap = getattr(confM2R.grdROMS, "extrapolation_rho", None)
+
+    if np.ndim(datablock) == 3:
+        # 2D variables are stored with one level as in dohorinterpolationsshregulargrid
+        datablock = datablock[:, np.newaxis, :, :]
+
+    arrayblock = weights.regrid(datablock)
+    shape = np.shape(arrayblock)
+
+    # Extrapolate into the areas without data for all records and levels at once
+    if confM2R.usefilter:
+        levels = np.reshape(arrayblock, (-1,) + shape[-2:])
+        if confM2R.extrapolationmethod == "nearest":
+            levels = extrapolationmap.fill3d(levels, 1000)
+        else:
+            levels = laplacefilter3d(levels, 1000, shape[-1], shape[-2])
+        arrayblock = np.reshape(levels, shape)
+
+    if myvar not in ['temperature', 'salinity', 'uvel', 'vvel']:
+        arrayblock = arrayblock * mymask
+
+    return arrayblock
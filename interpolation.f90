@@ -57,12 +57,16 @@ Module interpolation
             REAL(4), dimension(Nsoda) ::  zs
             REAL(4), dimension(Nroms,eta_rho,xi_rho) :: zr
 
+!f2py threadsafe
 !f2py intent(in,out,overwrite) outdat       
 !f2py intent(in,overwrite) dat, bathymetry, zr, zs
 !f2py intent(in,overwrite) Nroms, Nsoda, JJ, II, xi_rho, eta_rho
 !f2py intent(hide) ic,jc,kc,kT,rz1,rz2, kkT
             fill=-10000
-           
+
+            ! Each (jc,ic) water column is independent. When compiled with OpenMP (see compile.py)
+            ! the columns are distributed between the threads, otherwise the directives are ignored.
+!$omp parallel do private(ic,kc,kT,kkT,rz1,rz2) schedule(dynamic)
             do jc=1,JJ
               do ic=1,II
                   do kc=1,Nroms
@@ -164,7 +168,7 @@ Module interpolation
                   end do
               end do
             end do
-            
+!$omp end parallel do
         
       end subroutine doVertInter
       
@@ -185,12 +189,14 @@ Module interpolation
             REAL(4), dimension(KK,JJ,II) :: rhodata
             REAL(4), dimension(KK,JJ,II-1) :: udata
        
+!f2py threadsafe
 !f2py intent(in,out,overwrite) udata
 !f2py intent(in,overwrite) rhodata, KK, JJ, II
 !f2py intent(hide) ic,jc,kc, fill
 
             fill=10000
             print*,'---> Started horisontal rho2u interpolation'
+!$omp parallel do collapse(2) private(ic)
             do kc=1,KK
                 do jc=1,JJ
                     do ic=2,II-1
@@ -214,6 +220,7 @@ Module interpolation
                     end do
                 end do
             end do
+!$omp end parallel do
             print*,'-----> Ended horisontal rho2u interpolation'
         end subroutine rho2u
             
@@ -233,12 +240,14 @@ Module interpolation
            REAL(4), dimension(KK,JJ,II) :: rhodata
            REAL(4), dimension(KK,JJ-1,II) :: vdata
 
+!f2py threadsafe
 !f2py intent(in,out,overwrite) vdata
 !f2py intent(in,overwrite) rhodata, KK, JJ, II
 !f2py intent(hide) ic,jc,kc, fill
             
             fill=10000
             print*,'---> Started horisontal rho2v interpolation'
+!$omp parallel do private(jc,ic)
             do kc=1,KK
                 do jc=2,JJ-1
                     do ic=1,II
@@ -258,6 +267,7 @@ Module interpolation
                     end do
                 end do
             end do
+!$omp end parallel do
             print*,'-----> Ended horisontal rho2v interpolation'
         end subroutine rho2v
             
@@ -277,11 +287,13 @@ Module interpolation
            REAL(4), dimension(JJ,II)  :: angle
            integer KK, II, JJ, kc, ic, jc
           
+!f2py threadsafe
 !f2py intent(in,out,overwrite) urot, vrot
 !f2py intent(in,overwrite)  u_rho, v_rho, angle, KK, JJ, II
 !f2py intent(hide) ic,jc,kc
     
            print*,'---> Started rotation of velocities'
+!$omp parallel do collapse(2) private(ic)
            do kc=1,KK
              do jc=1,JJ
                 do ic=1,II
@@ -296,7 +308,23 @@ Module interpolation
                 end do
              end do
             end do
+!$omp end parallel do
             print*,'-----> Ended rotation of velocities'
         end subroutine rotate
+
+        subroutine setNumThreads(nthreads)
+            ! ----------------------------------
+            ! Program : setNumThreads
+            !
+            ! Set the number of OpenMP threads used by the threaded versions of the kernels
+            ! (interpolation_omp, barotropic_omp, extrapolate_omp). The OpenMP runtime is shared
+            ! by all modules so it is enough to call this routine once. Does nothing in the serial build.
+            ! -------------------------------------------------------------------------------------------------------
+!$          use omp_lib
+            integer nthreads
+!f2py intent(in) nthreads
+
+!$          call omp_set_num_threads(nthreads)
+        end subroutine setNumThreads
     
      end module interpolation
\ No newline at end of file
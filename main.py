@@ -1,11 +1,14 @@
+import argparse
 import time
 from netCDF4 import datetime
 import configM2R
 import model2roms
 import IOstation
 import clim2bry
+import IOpatch
 import decimateGrid
 import atmosForcing
+import stationExtraction
 
 __author__ = 'Trond Kristiansen'
 __email__ = 'trond.kristiansen@niva.no'
@@ -16,19 +19,45 @@ __status__ = "Development"
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Create ROMS forcing files from model or reanalysis data")
+    parser.add_argument("--shard", type=int, default=None, help="shard of the time steps to convert (0 to nshards-1)")
+    parser.add_argument("--nshards", type=int, default=None, help="number of shards the time steps are split into")
+    args = parser.parse_args()
+
     print("Started model2roms")
     confM2R = configM2R.Model2romsConfig()
+    if args.nshards is not None:
+        confM2R.nshards = args.nshards
+    if args.shard is not None:
+        confM2R.shard = args.shard
+
+    # Station mode only creates the station time series and no ROMS forcing files
+    if (confM2R.createatmosforcing or confM2R.createoceanforcing) and not confM2R.stationmode:
 
-    if confM2R.createatmosforcing or confM2R.createoceanforcing:
+        if confM2R.createoceanforcing and confM2R.initmode:
+            model2roms.convertinit(confM2R)
 
-        if confM2R.createoceanforcing:
+        elif confM2R.createoceanforcing:
             model2roms.convertMODEL2ROMS(confM2R)
 
-            clim2bry.writebry(confM2R)
+            # In bryonly mode the BRY file is written directly by convertMODEL2ROMS. With MPI rank 0 creates
+            # the BRY files from the merged CLIM files. With nshards each shard creates the BRY part file from
+            # its CLIM part file (merge both with mergeParts.py).
+            # In patch mode only the patched variables and records are copied to the existing BRY files.
+            if not confM2R.bryonly and confM2R.mpirank == 0:
+                for gridconf in [confM2R] + confM2R.extratargets:
+                    if confM2R.patchmode:
+                        clim2bry.patchbry(gridconf, confM2R.patchrecords,
+                                          IOpatch.climvariables(confM2R, IOpatch.patchvariables(confM2R)))
+                    else:
+                        clim2bry.writebry(gridconf)
 
       #  if confM2R.createAtmosForcing:
       #      atmosForcing.createAtmosFileUV(confM2R)
 
+    if confM2R.stationmode:
+        stationExtraction.extractstations(confM2R)
+
     if confM2R.decimategridfile:
         decimateGrid.createGrid(confM2R.grdROMS, "/Users/trondkr/Projects/KINO/GRID/kino_1600m_18072015.nc",
                                 "/Users/trondkr/Projects/KINO/GRID/kino_1600m_18072015v2.nc", 2)
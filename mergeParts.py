@@ -0,0 +1,127 @@
+from __future__ import print_function
+import argparse
+import os
+
+from netCDF4 import Dataset
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Merge the part files of a run split in time (shards, or MPI ranks in mpiPartition.py) into one file by
+    concatenating all variables with the ocean_time dimension in the order the parts are given. Variables
+    without ocean_time (grid, s-coordinates) are copied from the first part. From the command line:
+
+        python mergeParts.py a20_clim_SODA3_20000101_to_20101231.nc a20_clim_*_part*.nc
+
+    The parts are sorted by name unless --nosort is given.
+
+    For NETCDF4 files and variables with one record per chunk (the default for the ROMS files written with an
+    unlimited ocean_time), the compressed chunks are copied directly with h5py (read_direct_chunk and
+    write_direct_chunk) when the compression and chunk settings of the part and the merged file are the same.
+    This avoids decompressing and compressing the data again. Other variables, and all variables when h5py
+    is not installed, are copied through netCDF4.
+    """
+
+
+def directcopy(variable):
+    # The chunks of variable can be copied directly when each chunk holds one ocean_time record
+    chunking = variable.chunking()
+    return (h5py is not None and variable.dimensions[0] == 'ocean_time' and
+            chunking not in [None, 'contiguous'] and chunking[0] == 1)
+
+
+def mergeparts(parts, filename):
+    """
+    Concatenate the files parts (in time order) along ocean_time into filename. Variables without the
+    ocean_time dimension (grid, s-coordinates) are copied from the first part.
+    """
+    print("=>Merging %s part files into %s" % (len(parts), filename))
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    first = Dataset(parts[0])
+    f1 = Dataset(filename, mode='w', format=first.data_model)
+    f1.setncatts(dict((name, first.getncattr(name)) for name in first.ncattrs()))
+
+    for name, dimension in first.dimensions.items():
+        f1.createDimension(name, None if dimension.isunlimited() else len(dimension))
+
+    settings = {}
+    for name, variable in first.variables.items():
+        filters = variable.filters() or {}
+        chunking = variable.chunking()
+        attributes = dict((attr, variable.getncattr(attr)) for attr in variable.ncattrs() if attr != '_FillValue')
+        v = f1.createVariable(name, variable.dtype, variable.dimensions, zlib=filters.get('zlib', False),
+                              complevel=filters.get('complevel', 4), shuffle=filters.get('shuffle', False),
+                              fletcher32=filters.get('fletcher32', False),
+                              chunksizes=None if chunking in [None, 'contiguous'] else chunking,
+                              fill_value=getattr(variable, '_FillValue', None))
+        v.setncatts(attributes)
+        settings[name] = (variable.dtype, filters, chunking)
+        if 'ocean_time' not in variable.dimensions:
+            v[:] = variable[:]
+    hdf5 = first.data_model.startswith('NETCDF4')
+    first.close()
+
+    # Variables that can not be copied chunk by chunk are copied through netCDF4 (ocean_time first)
+    chunkcopy = []
+    ntime = 0
+    for part in parts:
+        cdf = Dataset(part)
+        records = len(cdf.dimensions['ocean_time'])
+        for name, variable in cdf.variables.items():
+            if 'ocean_time' not in variable.dimensions:
+                continue
+            same = (variable.dtype, variable.filters() or {}, variable.chunking()) == settings[name]
+            if hdf5 and same and directcopy(variable):
+                chunkcopy.append((part, name, ntime, records))
+            else:
+                f1.variables[name][ntime:ntime + records] = variable[:]
+        ntime += records
+        cdf.close()
+    f1.close()
+
+    if chunkcopy:
+        copychunks(filename, chunkcopy, ntime)
+
+
+def copychunks(filename, chunkcopy, ntimes):
+    # Copy the compressed chunks of (part, variable, first record, records) into filename without decompressing
+    print("=>Copying the compressed chunks of %s variables directly" % len(chunkcopy))
+    merged = h5py.File(filename, 'r+')
+    for part, name, ntime, records in chunkcopy:
+        dataset = merged[name]
+        if dataset.shape[0] < ntimes:
+            dataset.resize(ntimes, axis=0)
+
+        source = h5py.File(part, 'r')[name]
+        for index in range(source.id.get_num_chunks()):
+            info = source.id.get_chunk_info(index)
+            filtermask, chunk = source.id.read_direct_chunk(info.chunk_offset)
+            offset = (info.chunk_offset[0] + ntime,) + tuple(info.chunk_offset[1:])
+            dataset.id.write_direct_chunk(offset, chunk, filtermask)
+        source.file.close()
+    merged.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concatenate model2roms part files along ocean_time")
+    parser.add_argument("output", help="name of the merged file")
+    parser.add_argument("parts", nargs="+", help="the part files")
+    parser.add_argument("--nosort", action="store_true", help="merge the parts in the order given")
+    parser.add_argument("--remove", action="store_true", help="remove the part files after merging")
+    args = parser.parse_args()
+
+    parts = args.parts if args.nosort else sorted(args.parts)
+    mergeparts(parts, args.output)
+    if args.remove:
+        for part in parts:
+            os.remove(part)
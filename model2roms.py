@@ -1,14 +1,27 @@
 from __future__ import print_function
-from netCDF4 import Dataset, datetime, date2num, num2date
+from netCDF4 import datetime
 import numpy as np
+import copy
+import threading
+from multiprocessing.pool import ThreadPool
 import interp2D
-import interpolation as interp
+import fortranKernels
+import packedColumns
 import IOwrite
 import os
-import barotropic
 import IOinitial
+import IOBry
+import IOappend
+import IOpatch
 import IOsubset
+import IOverticalGrid
+import extrapolationMap
+import regridWeights
+import mpiPartition
 import datetimeFunctions
+import fieldCache
+import inputCatalog
+import inputReaders
 
 try:
     import ESMF
@@ -34,17 +47,17 @@ def verticalinterpolation(myvar, array1, array2, grdROMS, grdMODEL):
         print('Start vertical interpolation for %s (dimensions=%s x %s)' % (myvar, grdROMS.xi_rho, grdROMS.eta_rho))
         outdata = np.empty((outINDEX_ST), dtype=np.float64, order='Fortran')
 
-        outdata = interp.interpolation.dovertinter(np.asarray(outdata, order='Fortran'),
-                                                   np.asarray(array1, order='Fortran'),
-                                                   np.asarray(grdROMS.h, order='Fortran'),
-                                                   np.asarray(grdROMS.z_r, order='Fortran'),
-                                                   np.asarray(grdMODEL.z_r, order='Fortran'),
-                                                   int(grdROMS.nlevels),
-                                                   int(grdMODEL.nlevels),
-                                                   int(grdROMS.xi_rho),
-                                                   int(grdROMS.eta_rho),
-                                                   int(grdROMS.xi_rho),
-                                                   int(grdROMS.eta_rho))
+        outdata = fortranKernels.interp.interpolation.dovertinter(np.asarray(outdata, order='Fortran'),
+                                                                  np.asarray(array1, order='Fortran'),
+                                                                  np.asarray(grdROMS.h, order='Fortran'),
+                                                                  np.asarray(grdROMS.z_r, order='Fortran'),
+                                                                  np.asarray(grdMODEL.z_r, order='Fortran'),
+                                                                  int(grdROMS.nlevels),
+                                                                  int(grdMODEL.nlevels),
+                                                                  int(grdROMS.xi_rho),
+                                                                  int(grdROMS.eta_rho),
+                                                                  int(grdROMS.xi_rho),
+                                                                  int(grdROMS.eta_rho))
 
         outdata = np.ma.masked_where(abs(outdata) > 1000, outdata)
 
@@ -60,17 +73,17 @@ def verticalinterpolation(myvar, array1, array2, grdROMS, grdMODEL):
         outdataU = np.zeros((outINDEX_U), dtype=np.float64)
         outdataUBAR = np.zeros((outINDEX_UBAR), dtype=np.float64)
 
-        outdataU = interp.interpolation.dovertinter(np.asarray(outdataU, order='Fortran'),
-                                                    np.asarray(array1, order='Fortran'),
-                                                    np.asarray(grdROMS.h, order='Fortran'),
-                                                    np.asarray(grdROMS.z_r, order='Fortran'),
-                                                    np.asarray(grdMODEL.z_r, order='Fortran'),
-                                                    int(grdROMS.nlevels),
-                                                    int(grdMODEL.nlevels),
-                                                    int(grdROMS.xi_u),
-                                                    int(grdROMS.eta_u),
-                                                    int(grdROMS.xi_rho),
-                                                    int(grdROMS.eta_rho))
+        outdataU = fortranKernels.interp.interpolation.dovertinter(np.asarray(outdataU, order='Fortran'),
+                                                                   np.asarray(array1, order='Fortran'),
+                                                                   np.asarray(grdROMS.h, order='Fortran'),
+                                                                   np.asarray(grdROMS.z_r, order='Fortran'),
+                                                                   np.asarray(grdMODEL.z_r, order='Fortran'),
+                                                                   int(grdROMS.nlevels),
+                                                                   int(grdMODEL.nlevels),
+                                                                   int(grdROMS.xi_u),
+                                                                   int(grdROMS.eta_u),
+                                                                   int(grdROMS.xi_rho),
+                                                                   int(grdROMS.eta_rho))
 
         outdataU = np.ma.masked_where(abs(outdataU) > 1000, outdataU)
 
@@ -78,45 +91,45 @@ def verticalinterpolation(myvar, array1, array2, grdROMS, grdMODEL):
         outdataV = np.zeros((outINDEX_V), dtype=np.float64)
         outdataVBAR = np.zeros((outINDEX_VBAR), dtype=np.float64)
 
-        outdataV = interp.interpolation.dovertinter(np.asarray(outdataV, order='Fortran'),
-                                                    np.asarray(array2, order='Fortran'),
-                                                    np.asarray(grdROMS.h, order='Fortran'),
-                                                    np.asarray(grdROMS.z_r, order='Fortran'),
-                                                    np.asarray(grdMODEL.z_r, order='Fortran'),
-                                                    int(grdROMS.nlevels),
-                                                    int(grdMODEL.nlevels),
-                                                    int(grdROMS.xi_v),
-                                                    int(grdROMS.eta_v),
-                                                    int(grdROMS.xi_rho),
-                                                    int(grdROMS.eta_rho))
+        outdataV = fortranKernels.interp.interpolation.dovertinter(np.asarray(outdataV, order='Fortran'),
+                                                                   np.asarray(array2, order='Fortran'),
+                                                                   np.asarray(grdROMS.h, order='Fortran'),
+                                                                   np.asarray(grdROMS.z_r, order='Fortran'),
+                                                                   np.asarray(grdMODEL.z_r, order='Fortran'),
+                                                                   int(grdROMS.nlevels),
+                                                                   int(grdMODEL.nlevels),
+                                                                   int(grdROMS.xi_v),
+                                                                   int(grdROMS.eta_v),
+                                                                   int(grdROMS.xi_rho),
+                                                                   int(grdROMS.eta_rho))
 
         outdataV = np.ma.masked_where(abs(outdataV) > 1000, outdataV)
 
         z_wu = np.zeros((grdROMS.nlevels + 1, grdROMS.eta_u, grdROMS.xi_u), dtype=np.float64)
         z_wv = np.zeros((grdROMS.nlevels + 1, grdROMS.eta_v, grdROMS.xi_v), dtype=np.float64)
 
-        outdataUBAR = barotropic.velocity.ubar(np.asarray(outdataU, order='Fortran'),
-                                               np.asarray(outdataUBAR, order='Fortran'),
-                                               np.asarray(grdROMS.z_w, order='Fortran'),
-                                               np.asarray(z_wu, order='Fortran'),
-                                               grdROMS.nlevels,
-                                               grdROMS.xi_u,
-                                               grdROMS.eta_u,
-                                               grdROMS.xi_rho,
-                                               grdROMS.eta_rho)
+        outdataUBAR = fortranKernels.barotropic.velocity.ubar(np.asarray(outdataU, order='Fortran'),
+                                                              np.asarray(outdataUBAR, order='Fortran'),
+                                                              np.asarray(grdROMS.z_w, order='Fortran'),
+                                                              np.asarray(z_wu, order='Fortran'),
+                                                              grdROMS.nlevels,
+                                                              grdROMS.xi_u,
+                                                              grdROMS.eta_u,
+                                                              grdROMS.xi_rho,
+                                                              grdROMS.eta_rho)
         outdataUBAR = np.ma.masked_where(abs(outdataUBAR) > 1000, outdataUBAR)
 
         # plotData.contourMap(grdROMS, grdROMS.lon_rho, grdROMS.lat_rho, outdataUBAR,1, "ubar")
 
-        outdataVBAR = barotropic.velocity.vbar(np.asarray(outdataV, order='Fortran'),
-                                               np.asarray(outdataVBAR, order='Fortran'),
-                                               np.asarray(grdROMS.z_w, order='Fortran'),
-                                               np.asarray(z_wv, order='Fortran'),
-                                               grdROMS.nlevels,
-                                               grdROMS.xi_v,
-                                               grdROMS.eta_v,
-                                               grdROMS.xi_rho,
-                                               grdROMS.eta_rho)
+        outdataVBAR = fortranKernels.barotropic.velocity.vbar(np.asarray(outdataV, order='Fortran'),
+                                                              np.asarray(outdataVBAR, order='Fortran'),
+                                                              np.asarray(grdROMS.z_w, order='Fortran'),
+                                                              np.asarray(z_wv, order='Fortran'),
+                                                              grdROMS.nlevels,
+                                                              grdROMS.xi_v,
+                                                              grdROMS.eta_v,
+                                                              grdROMS.xi_rho,
+                                                              grdROMS.eta_rho)
 
         # plotData.contourMap(grdROMS, grdROMS.lon_rho, grdROMS.lat_rho, outdataVBAR,1, "vbar")
         outdataVBAR = np.ma.masked_where(abs(outdataVBAR) > 1000, outdataVBAR)
@@ -124,8 +137,57 @@ def verticalinterpolation(myvar, array1, array2, grdROMS, grdMODEL):
         return outdataU, outdataV, outdataUBAR, outdataVBAR
 
 
+def verticalinterpolationwet(myvar, array1, array2, grdROMS, grdMODEL):
+    """
+    Same as verticalinterpolation but only for the wet points of the ROMS grid (see packedColumns.py).
+    array1 and array2 are packed (level, nwet) at the rho points (temperature and salinity) or at the
+    U and V points (velocities), and the results are returned packed.
+    """
+    if myvar in ['salinity', 'temperature']:
+        print('Start vertical interpolation for %s (wet points=%s)' % (myvar, grdROMS.wet_rho.nwet))
+
+        return dovertinterwet(array1, grdROMS.wet_rho, grdROMS, grdMODEL)
+
+    if myvar == 'vvel':
+        print('Start vertical interpolation for uvel (wet points=%s)' % grdROMS.wet_u.nwet)
+        outdataU = dovertinterwet(array1, grdROMS.wet_u, grdROMS, grdMODEL)
+
+        print('Start vertical interpolation for vvel (wet points=%s)' % grdROMS.wet_v.nwet)
+        outdataV = dovertinterwet(array2, grdROMS.wet_v, grdROMS, grdMODEL)
+
+        outdataUBAR = packedColumns.depthaverage(outdataU, grdROMS.wet_u.z_w)
+        outdataVBAR = packedColumns.depthaverage(outdataV, grdROMS.wet_v.z_w)
+
+        return outdataU, outdataV, outdataUBAR, outdataVBAR
+
+
+def dovertinterwet(dat, wet, grdROMS, grdMODEL):
+    # The packed columns are passed to the kernel as a grid with JJ=1 and II=nwet
+    outdata = np.zeros((int(grdROMS.nlevels), 1, wet.nwet), dtype=np.float32, order='F')
+
+    outdata = fortranKernels.interp.interpolation.dovertinter(outdata,
+                                                              wet.columns(dat),
+                                                              wet.h,
+                                                              wet.z_r,
+                                                              np.asarray(grdMODEL.z_r, order='F'),
+                                                              int(grdROMS.nlevels),
+                                                              int(grdMODEL.nlevels),
+                                                              int(wet.nwet),
+                                                              1,
+                                                              int(wet.nwet),
+                                                              1)
+    return outdata[:, 0, :]
+
+
 def horizontalinterpolation(confM2R, myvar, data):
     print('Start %s horizontal interpolation for %s' % (confM2R.grdtype, myvar))
+
+    # With MPI the ESMF grids are decomposed across the ranks: every rank uses the complete regrid weights.
+    # The regrid weights are also used when variables are interpolated in several threads (variableworkers)
+    # since the ESMF fields are shared.
+    if confM2R.usempi or confM2R.variableworkers > 1:
+        return interp2D.dohorinterpolationblock(confM2R, myvar, np.asarray(data)[np.newaxis])[0]
+
     try:
         if myvar in ['temperature', 'salinity']:
             return interp2D.dohorinterpolationregulargrid(confM2R, data)
@@ -147,14 +209,14 @@ def rotate(grdROMS, grdMODEL, data, u, v):
     urot = np.zeros((int(grdMODEL.nlevels), int(grdROMS.eta_rho), int(grdROMS.xi_rho)), np.float64)
     vrot = np.zeros((int(grdMODEL.nlevels), int(grdROMS.eta_rho), int(grdROMS.xi_rho)), np.float64)
 
-    urot, vrot = interp.interpolation.rotate(np.asarray(urot, order='Fortran'),
-                                             np.asarray(vrot, order='Fortran'),
-                                             np.asarray(u, order='Fortran'),
-                                             np.asarray(v, order='Fortran'),
-                                             np.asarray(grdROMS.angle, order='Fortran'),
-                                             int(grdROMS.xi_rho),
-                                             int(grdROMS.eta_rho),
-                                             int(grdMODEL.nlevels))
+    urot, vrot = fortranKernels.interp.interpolation.rotate(np.asarray(urot, order='Fortran'),
+                                                            np.asarray(vrot, order='Fortran'),
+                                                            np.asarray(u, order='Fortran'),
+                                                            np.asarray(v, order='Fortran'),
+                                                            np.asarray(grdROMS.angle, order='Fortran'),
+                                                            int(grdROMS.xi_rho),
+                                                            int(grdROMS.eta_rho),
+                                                            int(grdMODEL.nlevels))
     return urot, vrot
 
 
@@ -164,501 +226,223 @@ def interpolate2uv(grdROMS, grdMODEL, urot, vrot):
 
     # Interpolate from RHO points to U and V points for velocities
 
-    Zu = interp.interpolation.rho2u(np.asarray(Zu, order='Fortran'),
-                                    np.asarray(urot, order='Fortran'),
-                                    int(grdROMS.xi_rho),
-                                    int(grdROMS.eta_rho),
-                                    int(grdMODEL.nlevels))
+    Zu = fortranKernels.interp.interpolation.rho2u(np.asarray(Zu, order='Fortran'),
+                                                   np.asarray(urot, order='Fortran'),
+                                                   int(grdROMS.xi_rho),
+                                                   int(grdROMS.eta_rho),
+                                                   int(grdMODEL.nlevels))
 
     # plotData.contourMap(grdROMS,grdMODEL,Zu[0,:,:],"1",'urot')
 
-    Zv = interp.interpolation.rho2v(np.asarray(Zv, order='Fortran'),
-                                    np.asarray(vrot, order='Fortran'),
-                                    int(grdROMS.xi_rho),
-                                    int(grdROMS.eta_rho),
-                                    int(grdMODEL.nlevels))
+    Zv = fortranKernels.interp.interpolation.rho2v(np.asarray(Zv, order='Fortran'),
+                                                   np.asarray(vrot, order='Fortran'),
+                                                   int(grdROMS.xi_rho),
+                                                   int(grdROMS.eta_rho),
+                                                   int(grdMODEL.nlevels))
 
     # plotData.contourMap(grdROMS,grdMODEL,Zv[0,:,:],"1",'vrot')
 
     return Zu, Zv
 
 
+def rotatewet(grdROMS, grdMODEL, u, v):
+    """
+    Same as rotate followed by interpolate2uv but only for the wet U and V points of the ROMS grid.
+    The rho points used by rho2u and rho2v for each wet U and V point are gathered into packed
+    columns, rotated, and averaged to packed U and V points (level, nwet).
+    """
+    wet_u = grdROMS.wet_u
+    wet_v = grdROMS.wet_v
+    stencil = [(wet_u, 0, -1), (wet_u, 0, 1), (wet_v, -1, 0), (wet_v, 1, 0)]
+
+    upacked = np.concatenate([wet.pack(u, dj, di) for wet, dj, di in stencil], axis=-1)
+    vpacked = np.concatenate([wet.pack(v, dj, di) for wet, dj, di in stencil], axis=-1)
+    anglepacked = np.concatenate([wet.pack(grdROMS.angle, dj, di) for wet, dj, di in stencil], axis=-1)
+
+    npacked = np.shape(upacked)[-1]
+    shape = (int(grdMODEL.nlevels), 1, npacked)
+    urot = np.zeros(shape, np.float32, order='F')
+    vrot = np.zeros(shape, np.float32, order='F')
+
+    urot, vrot = fortranKernels.interp.interpolation.rotate(urot,
+                                                            vrot,
+                                                            np.asarray(np.reshape(upacked, shape), order='F'),
+                                                            np.asarray(np.reshape(vpacked, shape), order='F'),
+                                                            np.asarray(np.reshape(anglepacked, (1, npacked)),
+                                                                       order='F'),
+                                                            int(npacked),
+                                                            1,
+                                                            int(grdMODEL.nlevels))
+
+    nu = wet_u.nwet
+    nv = wet_v.nwet
+    Zu = packedColumns.stagger(urot[:, 0, 0:nu], urot[:, 0, nu:2 * nu], wet_u.ii == 0)
+    Zv = packedColumns.stagger(vrot[:, 0, 2 * nu:2 * nu + nv], vrot[:, 0, 2 * nu + nv:], wet_v.jj == 0)
+
+    return Zu, Zv
+
+
 def getTime(confM2R, year, month, day):
     """
     Create a date object to keep track of Julian dates etc.
     Also create a reference date starting at 1948/01/01.
     Go here to check results:http://lena.gsfc.nasa.gov/lenaDEV/html/doy_conv.html
+    The time axis of each dataset is described by its reader (inputReaders.py).
     """
-    if confM2R.indatatype == 'SODA':
-        filename = getSODAfilename(confM2R, year, month, None)
-
-    if confM2R.indatatype == 'SODA3':
-        filename = getSODA3filename(confM2R, year, month, None)
-
-    if confM2R.indatatype == 'SODAMONTHLY':
-        filename = getSODAMONTHLYfilename(confM2R, year, month, None)
-
-    if confM2R.indatatype == 'GLORYS':
-        filename = getGLORYSfilename(confM2R, year, month, "S")
-
-    if confM2R.indatatype == 'WOAMONTHLY':
-        filename = getWOAMONTHLYfilename(confM2R, year, month, "temperature")
+    jd, jdref, myunits, currentdate = confM2R.reader.gettime(year, month, day)
 
-    if confM2R.indatatype == 'NORESM':
-        filename = getNORESMfilename(confM2R, year, month, "saln")
-
-    if confM2R.indatatype == 'NS8KM':
-        filename = getNS8KMfilename(confM2R, year, month, "salt")
-
-    if confM2R.indatatype == 'NS8KMZ':
-        filename, readFromOneFile = getNS8KMZfilename(confM2R, year, month, "salt")
-
-    # Now open the input file and get the time
-    cdf = Dataset(filename)
-
-    if confM2R.indatatype == 'NORESM':
-        jdref = date2num(datetime(1800, 1, 1), cdf.variables["time"].units, calendar=cdf.variables["time"].calendar)
-    elif confM2R.indatatype == 'NS8KMZ':
-        jdref = date2num(datetime(1948, 1, 1), units="days since 1948-01-01 00:00:00", calendar="standard")
-    elif confM2R.indatatype == 'GLORYS':
-        jdref = date2num(datetime(1948, 1, 1), cdf.variables["time_counter"].units,
-                         calendar=cdf.variables["time_counter"].calendar)
-    elif confM2R.indatatype == 'NS8KM':
-        jdref = date2num(datetime(1948, 1, 1), cdf.variables["ocean_time"].units,
-                         calendar=cdf.variables["ocean_time"].calendar)
-    elif confM2R.indatatype == 'SODA3':
-        jdref = date2num(datetime(1948, 1, 1), units="days since 1948-01-01 00:00:00", calendar="standard")
-    else:
-        jdref = date2num(datetime(1948, 1, 1), cdf.variables["time"].units, calendar=cdf.variables["time"].calendar)
-
-    if confM2R.indatatype == 'SODAMONTHLY':
-        # Find the day and month that the SODAMONTHLY file respresents based on the year and ID number.
-        # Each SODA file represents a 1 month average.
-
-        mycalendar = cdf.variables["time"].calendar
-        myunits = cdf.variables["time"].units
-        currentdate = datetime(year, month, day)
-        jd = date2num(currentdate, myunits, calendar=mycalendar)
-
-    if confM2R.indatatype == 'SODA3':
-        # Each SODA file represents 12 month averages.
-
-        myunits = cdf.variables["time"].units
-        currentdate = datetime(year, month, day)
-        jd = date2num(currentdate, units="days since 1948-01-01 00:00:00", calendar="standard")
-
-    if confM2R.indatatype == 'GLORYS':
-        # Find the day and month that the GLORYS file respresents based on the year and ID number.
-        # Each file represents a 1 month average.
-        mycalendar = cdf.variables["time_counter"].calendar
-        myunits = cdf.variables["time_counter"].units
-        currentdate = datetime(year, month, day)
-        jd = date2num(currentdate, myunits, calendar=mycalendar)
-
-    if confM2R.indatatype == 'NS8KM':
-        # Find the day and month that the GLORYS file respresents based on the year and ID number.
-        # Each file represents a 1 month average.
-        mycalendar = cdf.variables["ocean_time"].calendar
-        myunits = cdf.variables["ocean_time"].units
-        currentdate = datetime(year, month, day)
-        jd = date2num(currentdate, myunits, calendar=mycalendar)
-
-    if confM2R.indatatype == 'NS8KMZ':
-        # Find the day and month that the GLORYS file respresents based on the year and ID number.
-        # Each file represents a 1 month average.
-        currentdate = datetime(year, month, day)
-        myunits = cdf.variables["time"].units
-        jd = date2num(currentdate, myunits, calendar="gregorian")
-        print("Days:", jd, currentdate, year, month, day)
-
-    if confM2R.indatatype == 'NORESM':
-        # Find the day and month that the NORESM file. We need to use the time modules from
-        # netcdf4 for python as they handle calendars that are no_leap.
-        # http://www.esrl.noaa.gov/psd/people/jeffrey.s.whitaker/python/netcdftime.html#datetime
-        mydays = cdf.variables["time"][0]
-        mycalendar = cdf.variables["time"].calendar
-        myunits = cdf.variables["time"].units
-        currentdate = num2date(mydays, units=myunits, calendar=mycalendar)
-        jd = date2num(currentdate, myunits, calendar='noleap')
-
-    confM2R.grdROMS.time = (jd - jdref)
+    confM2R.grdROMS.time = jd
     confM2R.grdROMS.reftime = jdref
     confM2R.grdROMS.timeunits = myunits
-    cdf.close()
     print("-------------------------------")
     print('\nCurrent time of %s file : %s' % (confM2R.indatatype, currentdate))
     print("-------------------------------")
 
-def getGLORYSfilename(confM2R, year, month, myvar):
-    # Month indicates month
-    # myvar:S,T,U,V
-    print("MYVAR: %s - %s" % (myvar, confM2R.modelpath))
-    if myvar in ['iicevelu', 'iicevelv', 'ileadfra', 'iicethic']:
-        myvarPrefix = 'icemod'
-        myvar = "ice"
-    elif myvar in ['sossheig']:
-
-        if (confM2R.start_year == 2014):
-            myvarPrefix = 'grid2D'
-        elif (2013 > confM2R.start_year >= 2010 and confM2R.start_month == 12) or (2013 > confM2R.start_year >= 2011):
-            myvarPrefix = 'SSH'
-        elif confM2R.start_year == 2013:
-            myvarPrefix = 'SSH'
-        myvar = "ssh"
-    elif (myvar in ['vozocrtx', 'vomecrty']):
-        myvar = 'u-v'
-        myvarPrefix = 'gridUV'
-    elif myvar in ['votemper']:
-        myvar = 't'
-        myvarPrefix = 'gridT'
-    elif myvar in ['vosaline']:
-        myvar = 's'
-        myvarPrefix = 'gridS'
-    else:
-        myvarPrefix = 'grid' + str(myvar.upper())
-
-    # GLORYS change the name in the middle of the time-series (on December 2010) and we have to
-    # account for that
-    if confM2R.start_year == 2014:
-        production = "R20151218"
-    elif (confM2R.start_2013 > confM2R.start_year >= 2010 and confM2R.start_month == 12) or (
-            2013 > confM2R.start_year >= 2011):
-        production = "R20140520"
-    elif confM2R.start_year == 2013:
-        production = "R20141205"
-    else:
-        production = "R20130808"
 
-    if confM2R.start_month < 10:
-        filename = confM2R.modelpath + 'dataset-global-reanalysis-phys-001-009-ran-fr-glorys2v3-monthly-' \
-                   + str(myvar.lower()) + '/GLORYS2V3_ORCA025_' + str(confM2R.start_year) + '0' + str(
-            confM2R.start_month) \
-                   + '15_' + str(production) + '_' + str(myvarPrefix) + '.nc'
+def getinputvarname(confM2R, myvar):
+    # The name of myvar in the input files (the lists in configM2R.py have the same order)
+    return confM2R.inputdatavarnames[confM2R.globalvarnames.index(myvar)]
 
-    if confM2R.start_month >= 10:
-        filename = confM2R.modelpath + 'dataset-global-reanalysis-phys-001-009-ran-fr-glorys2v3-monthly-' \
-                   + str(myvar.lower()) + '/GLORYS2V3_ORCA025_' + str(confM2R.start_year) + str(confM2R.start_month) \
-                   + '15_' + str(production) + '_' + str(myvarPrefix) + '.nc'
 
-    return filename
+def get3ddata(confM2R, myvar, year, month, day):
+    # Only the input depth levels used by the ROMS grid are read (see IOverticalGrid.prunesourcelevels)
+    levels = slice(0, confM2R.grdMODEL.nlevels)
 
+    varname = getinputvarname(confM2R, myvar)
+    data = confM2R.reader.read3d(myvar, varname, year, month, day, levels)
 
-def getNORESMfilename(confM2R, year, month, myvar):
-    if myvar == 'grid':
-        filename = confM2R.modelpath + 'GRID/NorESM.nc'
-    else:
-        if myvar in ['iage', 'uvel', 'vvel', 'aice', 'hi', 'hs']:
-            filename = confM2R.modelpath + 'ICE/NRCP45AERCN_f19_g16_CLE_01.cice.h.' + str(year) + '.nc'
-        else:
-            if confM2R.start_month < 10:
-                filename = confM2R.modelpath + 'OCN/NRCP45AERCN_f19_g16_CLE_01.micom.hm.' + str(year) + '-0' + str(
-                    ID) + '.nc'
-            else:
-                filename = confM2R.modelpath + 'OCN/NRCP45AERCN_f19_g16_CLE_01.micom.hm.' + str(year) + '-' + str(
-                    ID) + '.nc'
+    if __debug__:
+        print("Data range of %s just after extracting from netcdf file: %s - %s" % (varname, data.min(), data.max()))
 
-    return filename
+    return data
 
 
-def getNS8KMfilename(confM2R, year, month, myvar):
-    if (confM2R.start_month < 10):
-        mymonth = '0%s' % (confM2R.start_month)
-    else:
-        mymonth = '%s' % (confM2R.start_month)
-    filename = confM2R.modelpath + str(confM2R.start_year) + str(
-        mymonth) + '15_mm-IMR-MODEL-ROMS-NWS-20140430-fv02.1.nc'
+def get2ddata(confM2R, myvar, year, month, day):
+    print("Current type %s and variable %s" % (confM2R.indatatype, myvar))
 
-    return filename, mymonth
+    varname = getinputvarname(confM2R, myvar)
+    data = confM2R.reader.read2d(myvar, varname, year, month, day)
 
+    if __debug__:
+        print("Data range of %s just after extracting from netcdf file: %s - %s" % (varname, data.min(), data.max()))
 
-def getNS8KMZfilename(confM2R, year, month, myvar):
-    # allInOneFile = '/work/users/trondk/KINO/FORCING/1600M/northsea_8km_z_mean.nc_2010-2013.nc'
-    allInOneFile = ''
+    return data
 
-    if os.path.exists(allInOneFile):
-        readFromOneFile = True
-        print("NOTE ! READING ALL MYOCEAN FORCING DATA FROM ONE FILE")
-        return allInOneFile, readFromOneFile
-    else:
-        readFromOneFile = False
-        if (confM2R.start_month < 10):
-            mymonth = '0%s' % (confM2R.start_month)
-        else:
-            mymonth = '%s' % (confM2R.start_month)
-        filename = confM2R.modelpath + str(confM2R.start_year) + str(
-            mymonth) + '15_mm-IMR-MODEL-ROMS-NWS-20160203-fv02.1.nc'
 
-        return filename, readFromOneFile
+def createforcingfields(confM2R, myvar, data, uveldata=None, array1=None):
+    """
+    Interpolate one variable (data as read from the input file) horizontally and vertically to the ROMS grid
+    confM2R.grdROMS. Returns the horizontally interpolated array and a list of the fields to write for myvar
+    (data1, data2, ... in IOwrite.writeclimfile). For uvel the list is empty: the horizontally interpolated
+    uvel is given as uveldata when vvel is processed so that the velocities can be rotated. If array1 is
+    given the data have already been horizontally interpolated (time-batched path).
+    """
+    # Take the input data and horizontally interpolate to your grid
 
+    if array1 is None:
+        array1 = horizontalinterpolation(confM2R, myvar, data)
 
-def getSODAMONTHLYfilename(confM2R, year, month, myvar):
-    if confM2R.start_month < 10:
-        return confM2R.modelpath + 'SODA_2.0.2_' + str(year) + '0' + str(month) + '.cdf'
-    elif confM2R.start_month >= 10:
-        return confM2R.modelpath + 'SODA_2.0.2_' + str(year) + str(month) + '.cdf'
+    if myvar in ['temperature', 'salinity'] and confM2R.usewetpoints:
+        STdata = verticalinterpolationwet(myvar, confM2R.grdROMS.wet_rho.pack(array1), None,
+                                          confM2R.grdROMS, confM2R.grdMODEL)
 
+        STdata = np.where(abs(STdata) > 1000, confM2R.grdROMS.fillval, STdata)
+        # Scatter back to the full grid: land points are set to fillval
+        STdata = confM2R.grdROMS.wet_rho.unpack(STdata, confM2R.grdROMS.fillval)
 
-def getSODAfilename(confM2R, year, month, myvar):
-    return confM2R.modelpath + "SODA_2.0.2_" + str(year) + "_" + str(month) + ".cdf"
+        return array1, [STdata]
 
+    if myvar in ['temperature', 'salinity']:
+        STdata = verticalinterpolation(myvar, array1, array1, confM2R.grdROMS, confM2R.grdMODEL)
 
-def getSODA3filename(confM2R, year, month, myvar):
-    if (myvar in ['cn', 'hi', 'hs']):
-        return confM2R.modelpath + "soda3.3.1_mn_ice_reg_" + str(year) + ".nc"
-    else:
-        return confM2R.modelpath + "soda3.3.1_mn_ocean_reg_" + str(year) + ".nc"
+        for dd in range(len(STdata[:, 0, 0])):
+            STdata[dd, :, :] = np.where(confM2R.grdROMS.mask_rho == 0, confM2R.grdROMS.fillval,
+                                        STdata[dd, :, :])
 
+        STdata = np.where(abs(STdata) > 1000, confM2R.grdROMS.fillval, STdata)
 
-def getWOAMONTHLYfilename(confM2R, year, month, myvar):
-    if myvar == "temperature":
-        return confM2R.modelpath + 'temperature_monthly_1deg.nc'
-    elif myvar == "salinity":
-        return confM2R.modelpath + 'salinity_monthly_1deg.nc'
-    else:
-        print("Could not find any input files in folder: %s" % confM2R.modelpath)
+        return array1, [STdata]
 
+    if myvar in ['ssh', 'ageice', 'aice', 'hice', 'snow_thick']:
+        SSHdata = array1[0, :, :]
 
-def get3ddata(confM2R, myvar, year, month, day):
-    if myvar == 'temperature':
-        varN = 0
-    if myvar == 'salinity':
-        varN = 1
-    if myvar == 'uvel':
-        varN = 3
-    if myvar == 'vvel':
-        varN = 4
-
-    # The variable splitExtract is defined in IOsubset.py and depends on the orientation
-    # and indatatype of grid (-180-180 or 0-360). Assumes regular grid.
-    if confM2R.useesmf:
-        if confM2R.indatatype == "SODA":
-            filename = getSODAfilename(confM2R, year, month, None)
-            cdf = Dataset(filename)
-            data = cdf.variables[confM2R.inputdatavarnames[varN]][0, :, :, :]
-
-        if confM2R.indatatype == "SODA3":
-            filename = getSODA3filename(confM2R, year, month, confM2R.inputdatavarnames[varN])
-            cdf = Dataset(filename)
-            print("=>Extracting data for month %s from SODA3 %s " % (month - 1, filename))
-            data = cdf.variables[confM2R.inputdatavarnames[varN]][month - 1, :, :, :]
-
-        if confM2R.indatatype == "SODAMONTHLY":
-            filename = getSODAMONTHLYfilename(confM2R, year, month, confM2R.inputdatavarnames[varN])
-            cdf = Dataset(filename)
-            data = cdf.variables[str(confM2R.inputdatavarnames[varN])][:, :, :]
-
-        if confM2R.indatatype == "WOAMONTHLY":
-            filename = getWOAMONTHLYfilename(confM2R, year, month, confM2R.inputdatavarnames[varN])
-            cdf = Dataset(filename)
-            data = cdf.variables[str(confM2R.inputdatavarnames[varN])][month - 1, :, :, :]
-
-        if confM2R.indatatype == "NORESM":
-            cdf = Dataset(getNORESMfilename(confM2R, year, month, confM2R.inputdatavarnames[varN]))
-            myunits = cdf.variables[str(confM2R.inputdatavarnames[varN])].units
-            data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][0, :, :, :])
-            data = np.where(data.mask, confM2R.grdROMS.fillval, data)
-
-            print("Data range", np.min(data), np.max(data))
-
-        if confM2R.indatatype == "NS8KMZ":
-            filename, readFromOneFile = getNS8KMZfilename(confM2R, year, month, confM2R.inputdatavarnames[varN])
-            cdf = Dataset(filename)
-            print("Reading from one file %s" % (readFromOneFile))
-
-            myunits = cdf.variables[str(confM2R.inputdatavarnames[varN])].units
-            if (readFromOneFile):
-                currentdate = datetime(year, month, day, 12)
-                jd = date2num(currentdate, cdf.variables["time"].units, calendar="gregorian")
-                print("Days:", jd, currentdate)
-
-                timesteps = (cdf.variables["time"][:]).tolist()
-                timeindex = timesteps.index(jd)
-                data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][timeindex, :, :, :])
-            else:
-                data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][0, :, :, :])
-                print("Range of data", varN, np.min(data), np.max(data))
-            data = np.where(data.mask, confM2R.grdROMS.fillval, data)
+        SSHdata = np.where(confM2R.grdROMS.mask_rho == 0, confM2R.grdROMS.fillval, SSHdata)
+        SSHdata = np.where(abs(SSHdata) > 100, confM2R.grdROMS.fillval, SSHdata)
+        SSHdata = np.where(abs(SSHdata) == 0, confM2R.grdROMS.fillval, SSHdata)
 
-        if confM2R.indatatype == "GLORYS":
-            cdf = Dataset(getGLORYSfilename(confM2R, year, month, confM2R.inputdatavarnames[varN]))
-            myunits = cdf.variables[str(confM2R.inputdatavarnames[varN])].units
-            data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][0, :, :, :])
-            data = np.where(data.mask, confM2R.grdROMS.fillval, data)
+        # Specific for ROMs. We set 0 where we should have fillvalue for ice otherwise ROMS blows up.
+        SSHdata = np.where(abs(SSHdata) == confM2R.grdROMS.fillval, 0, SSHdata)
 
-        cdf.close()
+        return array1, [SSHdata]
 
-    if myvar == 'temperature' and confM2R.indatatype in ["NS8KMZ", "GLORYS", "NORESM"]:
+    # The following are special routines used to calculate the u and v velocity
+    # of ice based on the transport, which is divided by snow and ice thickenss
+    # and then multiplied by grid size in dx or dy direction (opposite of transport).
+    if myvar in ['uice', 'vice']:
+        SSHdata = array1[0, :, :]
 
-        if myunits == "degree_Kelvin" or myunits == "K":
-            if confM2R.indatatype in ["GLORYS"]:
-                data = np.where(data <= -32.767, confM2R.grdROMS.fillval, data)
-            data = data - 273.15
+        if myvar == "uice": mymask = confM2R.grdROMS.mask_u
+        if myvar == "vice": mymask = confM2R.grdROMS.mask_v
 
-    if confM2R.indatatype == "GLORYS":
-        data = np.where(data <= -32.767, confM2R.grdROMS.fillval, data)
-        data = np.ma.masked_where(data <= confM2R.grdROMS.fillval, data)
+        SSHdata = np.where(mymask == 0, confM2R.grdROMS.fillval, SSHdata)
+        SSHdata = np.where(abs(SSHdata) > 100, confM2R.grdROMS.fillval, SSHdata)
+        SSHdata = np.where(abs(SSHdata) == 0, confM2R.grdROMS.fillval, SSHdata)
+        SSHdata = np.where(abs(SSHdata) == confM2R.grdROMS.fillval, 0, SSHdata)
 
-    if __debug__:
-        print("Data range of %s just after extracting from netcdf file: %s - %s" % (str(confM2R.inputdatavarnames[varN]),
-                                                                                    data.min(), data.max()))
+        # SSHdata = np.ma.masked_where(abs(SSHdata) > 1000, SSHdata)
 
-    return data
+        print("Data range of %s after interpolation: %3.3f to %3.3f" % (
+        myvar, SSHdata.min(), SSHdata.max()))
 
+        return array1, [SSHdata]
 
-def get2ddata(confM2R, myvar, year, month, day):
-    indexROMS_SSH = (confM2R.grdROMS.eta_rho, confM2R.grdROMS.xi_rho)
-
-    if confM2R.indatatype == "NORESM":
-        if myvar == 'ageice':
-            varN = 5
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'uice':
-            varN = 6
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'vice':
-            varN = 7
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'aice':
-            varN = 8
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'hice':
-            varN = 9
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'snow_thick':
-            varN = 10
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-
-    if confM2R.indatatype == "GLORYS":
-        if myvar == 'uice':
-            varN = 5
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'vice':
-            varN = 6
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'aice':
-            varN = 7
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'hice':
-            varN = 8
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
+    if myvar == 'vvel' and confM2R.usewetpoints:
+        u, v = rotatewet(confM2R.grdROMS, confM2R.grdMODEL, uveldata, array1)
 
-    print("Current type %s and variable %s" % (confM2R.indatatype, myvar))
-    if confM2R.indatatype == "SODA3":
-        if myvar == 'aice':
-            varN = 5
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'hice':
-            varN = 6
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-        if myvar == 'snow_thick':
-            varN = 7
-            SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-
-    if myvar == 'ssh':
-        varN = 2
-        SSHdata = np.zeros((indexROMS_SSH), dtype=np.float64)
-
-    if confM2R.useesmf:
-        if confM2R.indatatype == "SODA":
-            filename = getSODAfilename(confM2R, year, month, day, None)
-            cdf = Dataset(filename)
-            data = cdf.variables[confM2R.inputdatavarnames[varN]][0, :, :]
-
-        if confM2R.indatatype == "SODA3":
-            filename = getSODA3filename(confM2R, year, month, confM2R.inputdatavarnames[varN])
-            print("Trying to open file %s" % (filename))
-            cdf = Dataset(filename)
-            if myvar == 'aice':
-                # We only extract the first thickness concentration. Need to fix this so all 5 classes can be extracted.
-                # http://www.atmos.umd.edu/~ocean/index_files/soda3_readme.htm
-                # hi: sea ice thickness [m ice]
-                # mi: sea ice mass [kg/m^2]
-                # hs: snow thickness [m snow]
-                # {cn1,cn2,cn3,cn4,cn5}: sea ice concentration [0:1] in five ice thickness classes
-                data = cdf.variables[confM2R.inputdatavarnames[varN]][int(month - 1), 0, :, :]
-            else:
-                data = cdf.variables[confM2R.inputdatavarnames[varN]][int(month - 1), :, :]
-
-        if confM2R.indatatype == "SODAMONTHLY":
-            filename = getSODAMONTHLYfilename(confM2R, year, month, None)
-            cdf = Dataset(filename)
-            data = cdf.variables[str(confM2R.inputdatavarnames[varN])][:, :]
-
-        if confM2R.indatatype == "WOAMONTHLY":
-            filename = getWOAMONTHLYfilename(confM2R, year, month, myvar)
-            cdf = Dataset(filename)
-            data = cdf.variables[str(confM2R.inputdatavarnames[varN])][month - 1, :, :]
-
-        if confM2R.indatatype == "NORESM":
-            cdf = Dataset(getNORESMfilename(confM2R, year, month, confM2R.inputdatavarnames[varN]))
-            # myunits = cdf.variables[str(grdROMS.varNames[varN])].units
-            # For NORESM data are 12 months of data stored in ice files. Use ID as month indicator to get data.
-            if myvar in ['ageice', 'uice', 'vice', 'aice', 'hice', 'snow_thick']:
-                data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][month - 1, :, :])
-            else:
-                data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][0, :, :])
-            data = np.where(data.mask, confM2R.grdROMS.fillval, data)
-
-        if confM2R.indatatype == "GLORYS":
-            cdf = Dataset(getGLORYSfilename(confM2R, year, month, confM2R.inputdatavarnames[varN]))
-            data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][0, :, :])
-            data = np.where(data.mask, confM2R.grdROMS.fillval, data)
-
-        if confM2R.indatatype == "NS8KMZ":
-            filename, readFromOneFile = getNS8KMZfilename(confM2R, year, month, confM2R.inputdatavarnames[varN])
-            cdf = Dataset(filename)
-            print("Reading from file", filename)
-            if (readFromOneFile):
-                jdref = date2num(datetime(1948, 1, 1), cdf.variables["time"].units,
-                                 calendar=cdf.variables["time"].calendar)
-                currentdate = datetime(year, month, day, 12)
-                jd = date2num(currentdate, cdf.variables["time"].units, calendar="gregorian")
-
-                timesteps = (cdf.variables["time"][:]).tolist()
-                timeindex = timesteps.index(jd)
-                data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][timeindex, :, :])
-            else:
-                data = np.squeeze(cdf.variables[str(confM2R.inputdatavarnames[varN])][0, :, :])
+        Udata, Vdata, UBARdata, VBARdata = verticalinterpolationwet(myvar, u, v, confM2R.grdROMS,
+                                                                    confM2R.grdMODEL)
 
-            data = np.where(data.mask, confM2R.grdROMS.fillval, data)
+        fillval = confM2R.grdROMS.fillval
+        # Scatter back to the full grid: land points are set to fillval
+        Udata = confM2R.grdROMS.wet_u.unpack(np.where(abs(Udata) > 1000, fillval, Udata), fillval)
+        Vdata = confM2R.grdROMS.wet_v.unpack(np.where(abs(Vdata) > 1000, fillval, Vdata), fillval)
+        UBARdata = confM2R.grdROMS.wet_u.unpack(np.where(abs(UBARdata) > 1000, fillval, UBARdata), fillval)
+        VBARdata = confM2R.grdROMS.wet_v.unpack(np.where(abs(VBARdata) > 1000, fillval, VBARdata), fillval)
 
-            print("Extracted raw data: %s min: %s max: %s" % (myvar, np.min(data), np.max(data)))
-        cdf.close()
+        return array1, [Udata, Vdata, UBARdata, VBARdata]
 
-        if __debug__:
-            print("Data range of %s just after extracting from netcdf file: %s - %s" % (str(confM2R.inputdatavarnames[varN]),
-                                                                                        data.min(), data.max()))
+    if myvar == 'vvel':
+        urot, vrot = rotate(confM2R.grdROMS, confM2R.grdMODEL, data, uveldata, array1)
 
-    return data
+        u, v = interpolate2uv(confM2R.grdROMS, confM2R.grdMODEL, urot, vrot)
 
+        Udata, Vdata, UBARdata, VBARdata = verticalinterpolation(myvar, u, v, confM2R.grdROMS,
+                                                                 confM2R.grdMODEL)
 
-def convertMODEL2ROMS(confM2R):
-    # First opening of input file is just for initialization of grid
-    if confM2R.indatatype == 'SODA':
-        filenamein = getSODAfilename(confM2R, confM2R.start_year, confM2R.start_month, "salinity")
-    if confM2R.indatatype == 'SODA3':
-        filenamein = getSODA3filename(confM2R, confM2R.start_year, confM2R.start_month, "salinity")
-    if confM2R.indatatype == 'SODAMONTHLY':
-        filenamein = getSODAfilename(confM2R, confM2R.start_year, confM2R.start_month, "salinity")
-    if confM2R.indatatype == 'NORESM':
-        filenamein = getNORESMfilename(confM2R, confM2R.start_year, confM2R.start_month, "grid")
-    if confM2R.indatatype == 'WOAMONTHLY':
-        filenamein = getWOAMONTHLYfilename(confM2R, confM2R.start_year, confM2R.start_month, "temperature")
-    if confM2R.indatatype == 'GLORYS':
-        filenamein = getGLORYSfilename(confM2R, confM2R.start_year, confM2R.start_month, "S")
-    if confM2R.indatatype == 'GLORYS':
-        filenamein = getGLORYSfilename(confM2R, confM2R.start_year, confM2R.start_month, "S")
-    if confM2R.indatatype == 'NS8KM':
-        filenamein = getNS8KMfilename(confM2R, confM2R.start_year, confM2R.start_month, "S")
-    if confM2R.indatatype == 'NS8KMZ':
-        filenamein, readFromOneFile = getNS8KMZfilename(confM2R, confM2R.start_year, confM2R.start_month, "S")
+        #   print "Data range of U after interpolation: %3.3f to %3.3f - V after scaling: %3.3f to %3.3f" % (
+        #      Udata.min(), Udata.max(), Vdata.min(), Vdata.max())
+
+        Udata = np.where(confM2R.grdROMS.mask_u == 0, confM2R.grdROMS.fillval, Udata)
+        Udata = np.where(abs(Udata) > 1000, confM2R.grdROMS.fillval, Udata)
+        Vdata = np.where(confM2R.grdROMS.mask_v == 0, confM2R.grdROMS.fillval, Vdata)
+        Vdata = np.where(abs(Vdata) > 1000, confM2R.grdROMS.fillval, Vdata)
+        UBARdata = np.where(confM2R.grdROMS.mask_u == 0, confM2R.grdROMS.fillval, UBARdata)
+        UBARdata = np.where(abs(UBARdata) > 1000, confM2R.grdROMS.fillval, UBARdata)
+        VBARdata = np.where(confM2R.grdROMS.mask_v == 0, confM2R.grdROMS.fillval, VBARdata)
+        VBARdata = np.where(abs(VBARdata) > 1000, confM2R.grdROMS.fillval, VBARdata)
+
+        return array1, [Udata, Vdata, UBARdata, VBARdata]
+
+    # uvel is only horizontally interpolated here and used together with vvel
+    return array1, []
 
-    # Finalize creating the model grd object now that we know the filename for input data
-    confM2R.grdMODEL.opennetcdf(filenamein)
-    confM2R.grdMODEL.createobject(confM2R)
-    confM2R.grdMODEL.getdims()
 
-    if confM2R.useesmf:
+def initializetarget(confM2R):
+    """
+    Create the interpolation weights from the input grid (confM2R.grdMODEL) to the ROMS grid
+    (confM2R.grdROMS), and the extrapolation maps and wet points of the ROMS grid.
+    """
+    if confM2R.useesmf and not confM2R.usempi:
         print("=>Creating the interpolation weights and indexes using ESMF (this may take some time....):")
 
         print("  -> regridSrc2Dst at RHO points")
@@ -685,142 +469,523 @@ def convertMODEL2ROMS(confM2R):
                                                        regrid_method=ESMF.RegridMethod.BILINEAR,
                                                        unmapped_action=ESMF.UnmappedAction.IGNORE)
 
-    # Now we want to subset the data to avoid storing more information than we need.
-    # We do this by finding the indices of maximum and minimum latitude and longitude in the matrixes
-    if confM2R.subsetindata:
-        IOsubset.findSubsetIndices(confM2R.grdMODEL, min_lat=confM2R.subset[0], max_lat=confM2R.subset[1],
-                                   min_lon=confM2R.subset[2], max_lon=confM2R.subset[3])
+    # The time-batched path, MPI runs, and threaded variables regrid with the weights stored as a sparse matrix
+    if confM2R.useesmf and (confM2R.timebatch or confM2R.usempi or confM2R.variableworkers > 1):
+        regridWeights.createregridweights(confM2R)
 
-    print('==> Initializing done')
-    print('\n--------------------------')
-    print('==> Starting loop over time')
+    # The maps used for nearest wet point extrapolation are created (or read from cachedir) once
+    if confM2R.usefilter and confM2R.extrapolationmethod == "nearest":
+        extrapolationMap.createextrapolationmaps(confM2R)
 
-    time = 0
-    firstrun = True
+    # Gather the ocean points of the ROMS grid once so that only these are interpolated
+    if confM2R.usewetpoints:
+        packedColumns.createwetpoints(confM2R.grdROMS)
 
-    for year in confM2R.years:
-        months = datetimeFunctions.createlistofmonths(confM2R, year)
 
-        for month in months:
-            days = datetimeFunctions.createlistofdays(confM2R, year, month)
+def createboundaryconfigs(confM2R):
+    """
+    Used when only the BRY file is created (bryonly in configM2R.py). Returns a list of (boundary, confM2R)
+    where each confM2R is a copy with grdROMS replaced by a strip of the ROMS grid along the boundary, and a
+    copy of grdMODEL that stores the interpolation weights for that strip. The strips are three rho points
+    wide, which includes all the points used by rho2u and rho2v for the U and V points on the boundary.
+    The boundary sections are cut from the strips in IOBry.writebryfile.
+    """
+    grdROMS = confM2R.grdROMS
+    width = 3
+    windows = [("west", 0, grdROMS.eta_rho, 0, width),
+               ("east", 0, grdROMS.eta_rho, grdROMS.xi_rho - width, grdROMS.xi_rho),
+               ("south", 0, width, 0, grdROMS.xi_rho),
+               ("north", grdROMS.eta_rho - width, grdROMS.eta_rho, 0, grdROMS.xi_rho)]
+
+    targets = []
+    for boundary, j0, j1, i0, i1 in windows:
+        print("=>Creating grid for the %s boundary (eta_rho=%s, xi_rho=%s)" % (boundary, j1 - j0, i1 - i0))
+        bryconf = copy.copy(confM2R)
+        bryconf.outgrid = "%s_%s" % (confM2R.outgrid, boundary)
+        bryconf.grdROMS = grdROMS.createsubgrid(confM2R, j0, j1, i0, i1)
+        bryconf.grdMODEL = copy.copy(confM2R.grdMODEL)
+        targets.append((boundary, bryconf))
+
+    return targets
+
+
+def createtileconfigs(confM2R):
+    """
+    Used when the ROMS grid is processed in tiles (tilerows in configM2R.py). Returns a list of (tile, confM2R)
+    where each confM2R is a copy with grdROMS replaced by a band of tilerows eta rows of the ROMS grid plus
+    tilehalo rows on each side, and a copy of grdMODEL that stores the interpolation weights for that band.
+    The halo rows are used by rho2v and the extrapolation (filter) but not written. tile is
+    (j0, j1, start, i0, i1, istart): the rows j0:j1 and columns i0:i1 of the full grid are written and start
+    (istart) is the first row (column) of the band. The tiles of tilerows span all columns.
+    """
+    grdROMS = confM2R.grdROMS
+    halo = max(confM2R.tilehalo, 1)
+    method = tileextrapolationmethod(confM2R)
+
+    targets = []
+    for j0 in range(0, grdROMS.eta_rho, confM2R.tilerows):
+        j1 = min(j0 + confM2R.tilerows, grdROMS.eta_rho)
+        start = max(j0 - halo, 0)
+        stop = min(j1 + halo, grdROMS.eta_rho)
+
+        print("=>Creating grid for tile %s (eta_rho=%s to %s with halo %s to %s)" % (len(targets), j0, j1, start, stop))
+        tileconf = copy.copy(confM2R)
+        tileconf.outgrid = "%s_tile%s" % (confM2R.outgrid, len(targets))
+        tileconf.grdROMS = grdROMS.createsubgrid(confM2R, start, stop, 0, grdROMS.xi_rho)
+        tileconf.grdMODEL = copy.copy(confM2R.grdMODEL)
+        tileconf.extrapolationmethod = method
+        targets.append(((j0, j1, start, 0, grdROMS.xi_rho, 0), tileconf))
+
+    return targets
+
+
+def tileextrapolationmethod(confM2R):
+    # The Laplace fill (fill.f90) starts from the mean of the whole array it is given, so a tile filled on its
+    # own differs from the full grid at every filled point, not only near the halo. Tiles therefore use the
+    # nearest wet point extrapolation, which only depends on the valid points close by.
+    if confM2R.usefilter and confM2R.extrapolationmethod != "nearest":
+        print("=>NOTE! The tiles use the nearest wet point extrapolation instead of %s" % confM2R.extrapolationmethod)
+        return "nearest"
+    return confM2R.extrapolationmethod
+
+
+def createbandconfigs(confM2R):
+    """
+    Used when the CLIM file is only created within nudgingwidth points of the boundaries in nudgingboundaries
+    (configM2R.py). Returns a list of (tile, confM2R) as createtileconfigs for the bands along each boundary:
+    the southern and northern bands span all columns, and the western and eastern bands the rows between them.
+    The boundaries that are not in nudgingboundaries get a band of two points, which clim2bry.writebry copies
+    to the BRY file (the last U and V points lie between the last two rho points). Each band has tilehalo extra rows and columns on the sides that face the interior. The
+    interior of the grid is not interpolated and keeps the fill value in the CLIM file.
+    """
+    grdROMS = confM2R.grdROMS
+    halo = max(confM2R.tilehalo, 1)
+    method = tileextrapolationmethod(confM2R)
+    width = dict((boundary, max(confM2R.nudgingwidth, 2) if boundary in confM2R.nudgingboundaries else 2)
+                 for boundary in ['west', 'east', 'south', 'north'])
+
+    jsouth = width['south']
+    jnorth = grdROMS.eta_rho - width['north']
+    windows = [("south", 0, jsouth, 0, grdROMS.xi_rho),
+               ("north", jnorth, grdROMS.eta_rho, 0, grdROMS.xi_rho),
+               ("west", jsouth, jnorth, 0, width['west']),
+               ("east", jsouth, jnorth, grdROMS.xi_rho - width['east'], grdROMS.xi_rho)]
+
+    targets = []
+    for boundary, j0, j1, i0, i1 in windows:
+        if j1 <= j0:
+            continue
+        start, stop = max(j0 - halo, 0), min(j1 + halo, grdROMS.eta_rho)
+        istart, istop = max(i0 - halo, 0), min(i1 + halo, grdROMS.xi_rho)
+
+        print("=>Creating grid for the %s band (eta_rho=%s to %s, xi_rho=%s to %s)" % (boundary, j0, j1, i0, i1))
+        bandconf = copy.copy(confM2R)
+        bandconf.outgrid = "%s_band_%s" % (confM2R.outgrid, boundary)
+        bandconf.grdROMS = grdROMS.createsubgrid(confM2R, start, stop, istart, istop)
+        bandconf.grdMODEL = copy.copy(confM2R.grdMODEL)
+        bandconf.extrapolationmethod = method
+        targets.append(((j0, j1, start, i0, i1, istart), bandconf))
+
+    return targets
+
+
+def croptile(gridconf, tile, myvar, fields):
+    # Remove the halo rows and columns of the tile from the fields. Returns the rows and columns of the full
+    # grid and the cropped fields
+    j0, j1, start, i0, i1, istart = tile
+    rho = slice(j0 - start, j1 - start)
+    v = slice(j0 - start, min(j1, gridconf.grdROMS.eta_v) - start)
+    irho = slice(i0 - istart, i1 - istart)
+    u = slice(i0 - istart, min(i1, gridconf.grdROMS.xi_u) - istart)
+    vfields = {'vvel': [1, 3], 'vice': [0]}.get(myvar, [])
+    ufields = {'vvel': [0, 2], 'uice': [0]}.get(myvar, [])
+
+    return slice(j0, j1), slice(i0, i1), [field[..., v if n in vfields else rho, u if n in ufields else irho]
+                                          for n, field in enumerate(fields)]
+
+
+def getdatablock(confM2R, myvar, year, months):
+    """
+    Read the records of all months of one year in as few reads as possible (timebatch in configM2R.py).
+    Returns an array (month, level, eta, xi) for 3D variables and (month, eta, xi) for 2D.
+    """
+    levels = None
+    if myvar in ['temperature', 'salinity', 'uvel', 'vvel']:
+        # Only the input depth levels used by the ROMS grid are read (see IOverticalGrid.prunesourcelevels)
+        levels = slice(0, confM2R.grdMODEL.nlevels)
 
-            for day in days:
-                # Get the current date for given timestep 
-                getTime(confM2R, year, month, day)
+    return confM2R.reader.readblock(myvar, getinputvarname(confM2R, myvar), year, months, levels)
 
-                # Each MODEL file consist only of one time step. Get the subset data selected, and
-                # store that time step in a new array:
 
-                if firstrun:
-                    print("=> NOTE! Make sure that these two arrays are in sequential order:")
-                    print("==> myvars:     %s" % confM2R.inputdatavarnames)
-                    print("==> varNames    %s" % confM2R.globalvarnames)
-                    firstrun = False
+def convertyear(confM2R, targets, year, months, time):
+    """
+    Time-batched version of the time loop in convertMODEL2ROMS for one year (timebatch in configM2R.py). All
+    months of the year are read in one block, regridded in one sparse matrix product per variable and
+    target, vertically interpolated record by record, and written to file as one block of time records.
+    Returns the time index of the next record.
+    """
+    times = []
+    for month in months:
+        getTime(confM2R, year, month, 15)
+        times.append(confM2R.grdROMS.time)
+    ntimes = len(months)
+    block = slice(time, time + ntimes)
+
+    gridconfs = [confM2R] + confM2R.extratargets
+    for gridconf in gridconfs:
+        gridconf.grdROMS.reftime = confM2R.grdROMS.reftime
+        gridconf.grdROMS.timeunits = confM2R.grdROMS.timeunits
+
+    # Each target is written before the next one is interpolated, and the uvel of a target is only kept until
+    # its vvel is done
+    for group in createvariablegroups(confM2R.globalvarnames):
+        datablocks = [getdatablock(confM2R, myvar, year, months) for myvar in group]
+
+        for index, (boundary, targetconf, gridconf) in enumerate(targets):
+            uvelblock = None
+            for myvar, datablock in zip(group, datablocks):
+                arrayblock = interp2D.dohorinterpolationblock(targetconf, myvar, datablock)
+
+                if myvar == 'uvel':
+                    uvelblock = arrayblock
+                    continue
+
+                records = []
+                for t in range(ntimes):
+                    uvel = uvelblock[t] if myvar == 'vvel' else None
+                    records.append(createforcingfields(targetconf, myvar, datablock[t], uvel, arrayblock[t])[1])
+                fields = [np.asarray([record[n] for record in records]) for n in range(len(records[0]))]
+
+                if isinstance(boundary, str):
+                    gridconf.grdROMS.time = np.asarray(times)
+                    IOBry.writebryfile(gridconf, block, boundary, myvar, *fields)
+                    continue
+
+                rows = cols = None
+                if boundary is not None:
+                    rows, cols, fields = croptile(gridconf, boundary, myvar, fields)
+
+                if time == gridconf.grdROMS.inittime and gridconf.grdROMS.write_init is True:
+                    gridconf.grdROMS.time = times[0]
+                    IOinitial.createinitfile(gridconf, time, myvar, *[field[0] for field in fields], rows=rows)
+
+                gridconf.grdROMS.time = np.asarray(times)
+                IOwrite.writeclimfile(gridconf, block, myvar, *fields, rows=rows, cols=cols)
+
+    return time + ntimes
+
+
+def createvariablegroups(globalvarnames):
+    # The variables of a time step that can be converted independently. vvel needs the horizontally
+    # interpolated uvel to rotate the velocities so the two are converted together.
+    groups = []
+    for myvar in globalvarnames:
+        if myvar == 'uvel' and 'vvel' in globalvarnames:
+            groups.append(['uvel', 'vvel'])
+        elif not (myvar == 'vvel' and 'uvel' in globalvarnames):
+            groups.append([myvar])
+    return groups
+
+
+def convertvariables(confM2R, targets, group, year, month, day, iolock, fieldcache=None, write=None):
+    """
+    Read the variables of group (see createvariablegroups) for one time step and interpolate them to all
+    targets. Returns a list of (myvar, fields) where fields has the fields to write for each target. The input
+    files are read while holding iolock since the netCDF/HDF5 libraries are not thread safe. With fieldcache
+    (fieldCache.py) fields that were interpolated before are read from the cache instead.
+
+    With write (used for tiles, see tilerows in configM2R.py) the fields of each target are given to
+    write(index, myvar, fields) as soon as they are created and nothing is returned, so that only the fields
+    of one target (and the uvel of that target) are in memory at a time.
+    """
+    if fieldcache is not None:
+        key = fieldcache.createkey(confM2R, group, year, month, day)
+        results = fieldcache.get(key)
+        if results is not None:
+            return results
+
+    inputdata = []
+    for myvar in group:
+        with iolock:
+            if myvar in ['temperature', 'salinity', 'uvel', 'vvel']:
+                inputdata.append(get3ddata(confM2R, myvar, year, month, day))
+            else:
+                inputdata.append(get2ddata(confM2R, myvar, year, month, day))
+
+    results = [(myvar, []) for myvar in group]
+    for index, (boundary, targetconf, gridconf) in enumerate(targets):
+        uveldata = None
+        for n, myvar in enumerate(group):
+            array1, fields = createforcingfields(targetconf, myvar, inputdata[n], uveldata)
+
+            if myvar == 'uvel':
+                uveldata = array1
+            if write is not None:
+                write(index, myvar, fields)
+            else:
+                results[n][1].append(fields)
 
-                    if confM2R.subsetindata:
-                        # The first iteration we want to organize the subset indices we want to extract
-                        # from the input data to get the interpolation correct and to function fast
-                        IOsubset.organizeSplit(confM2R.grdMODEL, confM2R.grdROMS)
+    if write is not None:
+        return []
 
-                for myvar in confM2R.globalvarnames:
+    if fieldcache is not None:
+        fieldcache.put(key, results)
 
-                    if myvar in ['temperature', 'salinity', 'uvel', 'vvel']:
-                        data = get3ddata(confM2R, myvar, year, month, day)
+    return results
 
-                    if myvar in ['ssh', 'ageice', 'uice', 'vice', 'aice', 'hice', 'snow_thick']:
-                        data = get2ddata(confM2R, myvar, year, month, day)
 
-                    # Take the input data and horizontally interpolate to your grid
+def writefields(targets, targetfields, myvar, time, ntime):
+    # Write the fields of myvar for each target to record ntime of the CLIM or BRY (part) file, and to the INIT
+    # file for the first time step
+    for (boundary, targetconf, gridconf), fields in zip(targets, targetfields):
+        if not fields:
+            continue
 
-                    array1 = horizontalinterpolation(confM2R, myvar, data)
+        if isinstance(boundary, str):
+            IOBry.writebryfile(gridconf, ntime, boundary, myvar, *fields)
+            continue
 
-                    if myvar in ['temperature', 'salinity']:
-                        STdata = verticalinterpolation(myvar, array1, array1, confM2R.grdROMS, confM2R.grdMODEL)
+        # Tiles (and bands) only write their own rows and columns of the CLIM and INIT files
+        rows = cols = None
+        if boundary is not None:
+            rows, cols, fields = croptile(gridconf, boundary, myvar, fields)
 
-                        for dd in range(len(STdata[:, 0, 0])):
-                            STdata[dd, :, :] = np.where(confM2R.grdROMS.mask_rho == 0, confM2R.grdROMS.fillval,
-                                                        STdata[dd, :, :])
+        IOwrite.writeclimfile(gridconf, ntime, myvar, *fields, rows=rows, cols=cols)
 
-                        STdata = np.where(abs(STdata) > 1000, confM2R.grdROMS.fillval, STdata)
+        if time == gridconf.grdROMS.inittime and gridconf.grdROMS.write_init is True:
+            IOinitial.createinitfile(gridconf, time, myvar, *fields, rows=rows)
 
-                        IOwrite.writeclimfile(confM2R, time, myvar, STdata)
-                        if time == confM2R.grdROMS.inittime and confM2R.grdROMS.write_init is True:
-                            IOinitial.createinitfile(confM2R, time, myvar, STdata)
 
-                    if myvar in ['ssh', 'ageice', 'aice', 'hice', 'snow_thick']:
-                        SSHdata = array1[0, :, :]
+def initializeinputgrid(confM2R):
+    # Index the input files and check that all inputs of the run are found before starting
+    if confM2R.usecatalog:
+        confM2R.catalog = inputCatalog.createcatalog(confM2R)
 
-                        SSHdata = np.where(confM2R.grdROMS.mask_rho == 0, confM2R.grdROMS.fillval, SSHdata)
-                        SSHdata = np.where(abs(SSHdata) > 100, confM2R.grdROMS.fillval, SSHdata)
-                        SSHdata = np.where(abs(SSHdata) == 0, confM2R.grdROMS.fillval, SSHdata)
+    # The reader describes how the input dataset is stored (inputReaders.py)
+    confM2R.reader = inputReaders.createreader(confM2R)
 
-                        # Specific for ROMs. We set 0 where we should have fillvalue for ice otherwise ROMS blows up.
-                        SSHdata = np.where(abs(SSHdata) == confM2R.grdROMS.fillval, 0, SSHdata)
+    # First opening of input file is just for initialization of grid
+    filenamein = confM2R.reader.gridfilename()
 
-                        IOwrite.writeclimfile(confM2R, time,  myvar, SSHdata)
+    # Finalize creating the model grd object now that we know the filename for input data
+    confM2R.grdMODEL.opennetcdf(filenamein)
+    confM2R.grdMODEL.createobject(confM2R)
+    confM2R.grdMODEL.getdims()
 
-                        if time == confM2R.grdROMS.inittime:
-                            IOinitial.createinitfile(confM2R, time,  myvar, SSHdata)
 
-                    # The following are special routines used to calculate the u and v velocity
-                    # of ice based on the transport, which is divided by snow and ice thickenss
-                    # and then multiplied by grid size in dx or dy direction (opposite of transport).
-                    if myvar in ['uice', 'vice']:
-                        SSHdata = array1[0, :, :]
+def initializeoutputgrids(confM2R):
+    # Returns the configurations of all output grids (extraoutgrids in configM2R.py), which are forced from the
+    # same input data
+    gridconfs = [confM2R] + confM2R.extratargets
 
-                        if myvar == "uice": mymask = confM2R.grdROMS.mask_u
-                        if myvar == "vice": mymask = confM2R.grdROMS.mask_v
+    # Only read and interpolate the input levels the ROMS grids can use (the deepest grid decides)
+    if confM2R.prunelevels:
+        deepest = min(gridconfs, key=lambda gridconf: np.min(gridconf.grdROMS.z_r))
+        IOverticalGrid.prunesourcelevels(confM2R.grdMODEL, deepest.grdROMS)
 
-                        SSHdata = np.where(mymask == 0, confM2R.grdROMS.fillval, SSHdata)
-                        SSHdata = np.where(abs(SSHdata) > 100, confM2R.grdROMS.fillval, SSHdata)
-                        SSHdata = np.where(abs(SSHdata) == 0, confM2R.grdROMS.fillval, SSHdata)
-                        SSHdata = np.where(abs(SSHdata) == confM2R.grdROMS.fillval, 0, SSHdata)
+    # Each output grid needs its own copy of the input grid to store the interpolation weights
+    for gridconf in confM2R.extratargets:
+        gridconf.grdMODEL = copy.copy(confM2R.grdMODEL)
 
-                        # SSHdata = np.ma.masked_where(abs(SSHdata) > 1000, SSHdata)
+    return gridconfs
 
-                        print("Data range of %s after interpolation: %3.3f to %3.3f" % (
-                        myvar, SSHdata.min(), SSHdata.max()))
 
-                        IOwrite.writeclimfile(confM2R, time, myvar, SSHdata)
+def convertinit(confM2R):
+    """
+    Init mode (initmode in configM2R.py): only create the INIT file of each output grid for initdate, either
+    by converting the input data of that date or by extracting the record from the existing CLIM file
+    (initfromclim). All variables are written in one open of the INIT file and no CLIM or BRY files are created.
+    """
+    year, month, day = confM2R.initdate
+    gridconfs = [confM2R] + confM2R.extratargets
 
-                        if time == confM2R.grdROMS.inittime:
-                            if myvar == 'uice':
-                                IOinitial.createinitfile(confM2R, time,  myvar, SSHdata)
-                            if myvar == 'vice':
-                                IOinitial.createinitfile(confM2R, time,  myvar, SSHdata)
+    if confM2R.initfromclim:
+        for gridconf in gridconfs:
+            IOinitial.extractinitfromclim(gridconf, year, month, day)
+        return
 
-                    if myvar == 'uvel':
-                        array2 = array1
+    initializeinputgrid(confM2R)
+    gridconfs = initializeoutputgrids(confM2R)
+    targets = [(None, gridconf, gridconf) for gridconf in gridconfs]
+    for boundary, targetconf, gridconf in targets:
+        initializetarget(targetconf)
 
-                    if myvar == 'vvel':
-                        indexROMS_UBAR = (confM2R.grdROMS.eta_u, confM2R.grdROMS.xi_u)
-                        indexROMS_VBAR = (confM2R.grdROMS.eta_v, confM2R.grdROMS.xi_v)
-                      #  UBARdata = np.zeros((indexROMS_UBAR), dtype=np.float64)
-                      #  VBARdata = np.zeros((indexROMS_VBAR), dtype=np.float64)
+    if confM2R.subsetindata:
+        IOsubset.findSubsetIndices(confM2R.grdMODEL, min_lat=confM2R.subset[0], max_lat=confM2R.subset[1],
+                                   min_lon=confM2R.subset[2], max_lon=confM2R.subset[3])
+        IOsubset.organizeSplit(confM2R.grdMODEL, confM2R.grdROMS)
 
-                        urot, vrot = rotate(confM2R.grdROMS, confM2R.grdMODEL, data, array2, array1)
+    getTime(confM2R, year, month, day)
+    for gridconf in confM2R.extratargets:
+        gridconf.grdROMS.time = confM2R.grdROMS.time
+        gridconf.grdROMS.reftime = confM2R.grdROMS.reftime
+        gridconf.grdROMS.timeunits = confM2R.grdROMS.timeunits
 
-                        u, v = interpolate2uv(confM2R.grdROMS, confM2R.grdMODEL, urot, vrot)
+    iolock = threading.Lock()
+    results = []
+    for group in createvariablegroups(confM2R.globalvarnames):
+        results.extend(convertvariables(confM2R, targets, group, year, month, day, iolock))
 
-                        Udata, Vdata, UBARdata, VBARdata = verticalinterpolation(myvar, u, v, confM2R.grdROMS,
-                                                                                 confM2R.grdMODEL)
+    for index, gridconf in enumerate(gridconfs):
+        IOinitial.writeinitfields(gridconf, [(myvar, targetfields[index]) for myvar, targetfields in results])
 
-                    if myvar == 'vvel':
-                        #   print "Data range of U after interpolation: %3.3f to %3.3f - V after scaling: %3.3f to %3.3f" % (
-                        #      Udata.min(), Udata.max(), Vdata.min(), Vdata.max())
 
-                        Udata = np.where(confM2R.grdROMS.mask_u == 0, confM2R.grdROMS.fillval, Udata)
-                        Udata = np.where(abs(Udata) > 1000, confM2R.grdROMS.fillval, Udata)
-                        Vdata = np.where(confM2R.grdROMS.mask_v == 0, confM2R.grdROMS.fillval, Vdata)
-                        Vdata = np.where(abs(Vdata) > 1000, confM2R.grdROMS.fillval, Vdata)
-                        UBARdata = np.where(confM2R.grdROMS.mask_u == 0, confM2R.grdROMS.fillval, UBARdata)
-                        UBARdata = np.where(abs(UBARdata) > 1000, confM2R.grdROMS.fillval, UBARdata)
-                        VBARdata = np.where(confM2R.grdROMS.mask_v == 0, confM2R.grdROMS.fillval, VBARdata)
-                        VBARdata = np.where(abs(VBARdata) > 1000, confM2R.grdROMS.fillval, VBARdata)
+def convertMODEL2ROMS(confM2R):
+    initializeinputgrid(confM2R)
+    gridconfs = initializeoutputgrids(confM2R)
+
+    # With MPI each rank (or with nshards each shard) converts its own range of time steps and writes them to
+    # part files. In append mode only the time steps after the last record of the existing files are converted,
+    # and in patch mode only the time steps within patchdates are converted and written to their existing records.
+    partitioned = confM2R.usempi or confM2R.nshards > 1 or confM2R.appendmode or confM2R.patchmode
+    appending = False
+    confM2R.recordoffset = 0
+    if confM2R.appendmode or confM2R.patchmode:
+        if confM2R.usempi or confM2R.nshards > 1 or (confM2R.appendmode and confM2R.patchmode):
+            raise ValueError("appendmode and patchmode can not be combined with each other, usempi or nshards")
+    if confM2R.appendmode:
+        appending = IOappend.setupappend(confM2R, gridconfs, datetimeFunctions.createlistofdates(confM2R))
+    elif confM2R.patchmode:
+        IOpatch.setuppatch(confM2R, gridconfs, datetimeFunctions.createlistofdates(confM2R))
+        appending = True
+    elif confM2R.usempi:
+        mpiPartition.setupparts(confM2R, gridconfs, len(datetimeFunctions.createlistofdates(confM2R)),
+                                confM2R.mpirank, confM2R.mpisize)
+    elif partitioned:
+        mpiPartition.setupparts(confM2R, gridconfs, len(datetimeFunctions.createlistofdates(confM2R)),
+                                confM2R.shard, confM2R.nshards)
+
+    # The targets are the grids (or strips along the boundaries for bryonly, or tiles) that the input data are
+    # interpolated to: (boundary, targetconf, gridconf) where boundary is None for a full grid, the name of the
+    # boundary for a strip, and (j0, j1, start, i0, i1, istart) for a tile or a band along the boundaries
+    targets = []
+    for gridconf in gridconfs:
+        if confM2R.bryonly:
+            # Only interpolate narrow strips along the boundaries and write directly to the BRY file
+            targets.extend([(boundary, bryconf, gridconf) for boundary, bryconf in createboundaryconfigs(gridconf)])
+            if not appending:
+                IOBry.createBryFile(gridconf)
+        elif confM2R.nudgingwidth > 0:
+            # Only interpolate the bands along the boundaries that ROMS nudges to the CLIM fields. The INIT file
+            # needs the whole grid and is not written (create it with initmode).
+            targets.extend([(band, bandconf, gridconf) for band, bandconf in createbandconfigs(gridconf)])
+            if gridconf.grdROMS.write_init:
+                print("=>WARNING! The INIT file %s is not written when nudgingwidth > 0. Create it with initmode"
+                      % gridconf.initname)
+            gridconf.grdROMS.write_init = False
+        elif confM2R.tilerows > 0:
+            # Interpolate bands of rows one at a time so that the memory used depends on the tile size
+            targets.extend([(tile, tileconf, gridconf) for tile, tileconf in createtileconfigs(gridconf)])
+        else:
+            targets.append((None, gridconf, gridconf))
 
-                        IOwrite.writeclimfile(confM2R, time, myvar,  Udata, Vdata, UBARdata, VBARdata)
+    for boundary, targetconf, gridconf in targets:
+        initializetarget(targetconf)
 
-                        if time == confM2R.grdROMS.inittime:
-                            IOinitial.createinitfile(confM2R, time, myvar, Udata, Vdata, UBARdata, VBARdata)
+    # Now we want to subset the data to avoid storing more information than we need.
+    # We do this by finding the indices of maximum and minimum latitude and longitude in the matrixes
+    if confM2R.subsetindata:
+        IOsubset.findSubsetIndices(confM2R.grdMODEL, min_lat=confM2R.subset[0], max_lat=confM2R.subset[1],
+                                   min_lon=confM2R.subset[2], max_lon=confM2R.subset[3])
+
+    print('==> Initializing done')
+    print('\n--------------------------')
+    print('==> Starting loop over time')
+
+    time = 0
+    firstrun = True
+
+    # Independent variables of a time step can be converted at the same time in a pool of threads. The input
+    # and output files are only accessed by one thread at a time (iolock). In patch mode only the patch
+    # variables are converted.
+    if confM2R.patchmode:
+        groups = createvariablegroups(IOpatch.patchvariables(confM2R))
+    else:
+        groups = createvariablegroups(confM2R.globalvarnames)
+    iolock = threading.Lock()
+    pool = None
+    if confM2R.variableworkers > 1:
+        pool = ThreadPool(min(confM2R.variableworkers, len(groups)))
+
+    # Interpolated fields are stored in (and read from) cachedir for later runs
+    fieldcache = None
+    if confM2R.usefieldcache:
+        fieldcache = fieldCache.FieldCache(confM2R, targets)
+
+    # Tiles are written as soon as they are interpolated so that the memory used depends on the tile size
+    # and not on the size of the grid. The fields of all tiles would have to be kept for the field cache.
+    tiled = any(isinstance(boundary, tuple) for boundary, targetconf, gridconf in targets)
+    if tiled and fieldcache is not None:
+        print("=>NOTE! The field cache is not used when the grid is processed in tiles")
+        fieldcache = None
+
+    for year in confM2R.years:
+        months = datetimeFunctions.createlistofmonths(confM2R, year)
+
+        if confM2R.timebatch and confM2R.reader.recordsperfile == 12 and not partitioned:
+            time = convertyear(confM2R, targets, year, months, time)
+            continue
+
+        for month in months:
+            days = datetimeFunctions.createlistofdays(confM2R, year, month)
+
+            for day in days:
+                # The time steps of the other ranks (shards), already in the file in append mode, or outside
+                # patchdates in patch mode, are skipped. ntime is the record in the (part) file
+                ntime = time
+                if partitioned:
+                    if not confM2R.firsttime <= time < confM2R.lasttime:
+                        time += 1
+                        continue
+                    ntime = time - confM2R.firsttime + confM2R.recordoffset
+
+                # Get the current date for given timestep 
+                getTime(confM2R, year, month, day)
+
+                for gridconf in confM2R.extratargets:
+                    gridconf.grdROMS.time = confM2R.grdROMS.time
+                    gridconf.grdROMS.reftime = confM2R.grdROMS.reftime
+                    gridconf.grdROMS.timeunits = confM2R.grdROMS.timeunits
+
+                # Each MODEL file consist only of one time step. Get the subset data selected, and
+                # store that time step in a new array:
+
+                if firstrun:
+                    print("=> NOTE! Make sure that these two arrays are in sequential order:")
+                    print("==> myvars:     %s" % confM2R.inputdatavarnames)
+                    print("==> varNames    %s" % confM2R.globalvarnames)
+                    firstrun = False
+
+                    if confM2R.subsetindata:
+                        # The first iteration we want to organize the subset indices we want to extract
+                        # from the input data to get the interpolation correct and to function fast
+                        IOsubset.organizeSplit(confM2R.grdMODEL, confM2R.grdROMS)
+
+                # The groups of variables are converted in the worker threads (variableworkers) and written here
+                # in the order of globalvarnames. Tiles are written by the thread that converts them.
+                def writetile(index, myvar, fields):
+                    with iolock:
+                        writefields([targets[index]], [fields], myvar, time, ntime)
+                write = writetile if tiled else None
+
+                if pool is not None:
+                    steps = pool.imap(lambda group: convertvariables(confM2R, targets, group, year, month, day,
+                                                                     iolock, fieldcache, write), groups)
+                else:
+                    steps = (convertvariables(confM2R, targets, group, year, month, day, iolock, fieldcache, write)
+                             for group in groups)
+
+                for results in steps:
+                    for myvar, targetfields in results:
+                        with iolock:
+                            writefields(targets, targetfields, myvar, time, ntime)
 
                 time += 1
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # Merge the part files of all ranks into the final CLIM (and BRY) files
+    if confM2R.usempi:
+        mpiPartition.finishparts(confM2R, gridconfs)
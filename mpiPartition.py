@@ -0,0 +1,88 @@
+from __future__ import print_function
+import os
+import numpy as np
+
+from mergeParts import mergeparts
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    print("Could not find module mpi4py")
+    pass
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Distributed conversion with mpi4py (usempi in configM2R.py). Start with e.g.
+
+        mpirun -n 8 python main.py      (or aprun -B python main.py with mppwidth=8 in runM2R.sh)
+
+    The time steps of the run are split into one contiguous range per rank. Each rank converts its own time
+    steps and writes them to its own part of the CLIM file (and BRY file for bryonly), e.g.
+    a20_clim_SODA3_..._part002.nc. When all ranks are done, rank 0 concatenates the parts along ocean_time
+    into the final file (mergeParts.py) and removes the parts. The INIT file is written by the rank that owns
+    the first time step.
+
+    The regrid weights are created once by ESMF (all ranks take part since ESMF decomposes the grids across
+    the ranks) and written to cachedir. Every rank then reads the complete weights and does the horizontal
+    interpolation with the sparse matrix (regridWeights.py) for its own time steps.
+    """
+
+
+def getcommunicator():
+    # Returns the communicator, rank, and number of ranks of the run
+    comm = MPI.COMM_WORLD
+    return comm, comm.Get_rank(), comm.Get_size()
+
+
+def partitiontimes(ntimes, rank, size):
+    # Contiguous range of time steps [first, last) converted by rank
+    ranges = np.array_split(np.arange(ntimes), size)
+    if len(ranges[rank]) == 0:
+        return 0, 0
+    return int(ranges[rank][0]), int(ranges[rank][-1]) + 1
+
+
+def partname(filename, rank):
+    base, extension = os.path.splitext(filename)
+    return "%s_part%03d%s" % (base, rank, extension)
+
+
+def setupparts(confM2R, gridconfs, ntimes, part, nparts):
+    """
+    Find the time steps of part (MPI rank or shard) number part of nparts (confM2R.firsttime, confM2R.lasttime)
+    and let each output grid write its CLIM and BRY files to the part files. The final file names are kept in
+    mergednames.
+    """
+    confM2R.firsttime, confM2R.lasttime = partitiontimes(ntimes, part, nparts)
+    print("=>Part %s of %s converts time steps %s to %s" % (part, nparts, confM2R.firsttime, confM2R.lasttime - 1))
+    for gridconf in gridconfs:
+        gridconf.mergednames = (gridconf.climname, gridconf.bryname)
+        gridconf.climname = partname(gridconf.climname, part)
+        gridconf.bryname = partname(gridconf.bryname, part)
+
+
+def finishparts(confM2R, gridconfs):
+    """
+    Wait for all ranks and let rank 0 merge the part files into the final CLIM and BRY files. All ranks get the
+    final file names back so that e.g. clim2bry can be run on rank 0.
+    """
+    confM2R.mpicomm.Barrier()
+
+    for gridconf in gridconfs:
+        climname, bryname = gridconf.mergednames
+        if confM2R.mpirank == 0:
+            for filename in [climname, bryname]:
+                parts = [partname(filename, rank) for rank in range(confM2R.mpisize)]
+                parts = [part for part in parts if os.path.exists(part)]
+                if parts:
+                    mergeparts(parts, filename)
+                    for part in parts:
+                        os.remove(part)
+        gridconf.climname, gridconf.bryname = climname, bryname
+
+    confM2R.mpicomm.Barrier()
+
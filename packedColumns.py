@@ -0,0 +1,95 @@
+from __future__ import print_function
+import numpy as np
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Packed (wet point) representation of the ROMS grid. All ocean points of a mask (mask_rho, mask_u, or
+    mask_v) are gathered into one dimension so that a 3D field (level, eta, xi) is stored as a compact
+    2D array (level, nwet). The vertical interpolation, rotation, staggering to U and V points, and the
+    barotropic velocities are then only calculated for the ocean columns. Land points are set to
+    fillval when the packed data are scattered back to the full grid just before writing to file.
+
+    The Fortran kernels are called with the packed arrays by using JJ=1 and II=nwet, e.g. a packed
+    field (level, nwet) is passed to dovertinter as (level, 1, nwet).
+
+    Turned on with usewetpoints in configM2R.py. createwetpoints(grdROMS) is called once for the ROMS grid
+    and stores the packed rho, U, and V points as grdROMS.wet_rho, grdROMS.wet_u, and grdROMS.wet_v.
+    """
+
+
+class PackedColumns(object):
+
+    def __init__(self, mask):
+        self.shape = np.shape(mask)
+        self.jj, self.ii = np.nonzero(np.asarray(mask) > 0)
+        self.nwet = len(self.ii)
+
+    def pack(self, field, dj=0, di=0):
+        # Gather the wet columns of field (..., eta, xi). The offsets dj, di gather the neighbour
+        # points instead (used for the staggering) and are clipped to the edges of field.
+        jj = np.clip(self.jj + dj, 0, np.shape(field)[-2] - 1)
+        ii = np.clip(self.ii + di, 0, np.shape(field)[-1] - 1)
+        return np.asarray(np.asarray(field)[..., jj, ii])
+
+    def unpack(self, packed, fillval):
+        full = np.empty(np.shape(packed)[:-1] + self.shape, dtype=np.float64)
+        full.fill(fillval)
+        full[..., self.jj, self.ii] = packed
+        return full
+
+    def columns(self, packed):
+        # View the packed data as (level, 1, nwet) in the memory order used by the Fortran kernels
+        return np.asarray(np.reshape(packed, np.shape(packed)[:-1] + (1, self.nwet)), dtype=np.float32, order='F')
+
+
+def createwetpoints(grdROMS):
+    grdROMS.wet_rho = PackedColumns(grdROMS.mask_rho)
+    grdROMS.wet_u = PackedColumns(grdROMS.mask_u)
+    grdROMS.wet_v = PackedColumns(grdROMS.mask_v)
+
+    # The vertical interpolation uses the depth and z_r at the same (eta, xi) index as the output point
+    for wet in [grdROMS.wet_rho, grdROMS.wet_u, grdROMS.wet_v]:
+        wet.h = wet.columns(wet.pack(grdROMS.h))
+        wet.z_r = wet.columns(wet.pack(grdROMS.z_r))
+
+    # z_w averaged to U and V points for the barotropic velocities (as in barotropic.f90)
+    z_w = np.asarray(grdROMS.z_w, dtype=np.float32)
+    grdROMS.wet_u.z_w = np.float32(0.5) * (grdROMS.wet_u.pack(z_w) + grdROMS.wet_u.pack(z_w, 0, 1))
+    grdROMS.wet_v.z_w = np.float32(0.5) * (grdROMS.wet_v.pack(z_w) + grdROMS.wet_v.pack(z_w, 1, 0))
+
+    print("=>Packed wet points: rho %s of %s, u %s of %s, v %s of %s" % (
+        grdROMS.wet_rho.nwet, np.size(grdROMS.mask_rho), grdROMS.wet_u.nwet, np.size(grdROMS.mask_u),
+        grdROMS.wet_v.nwet, np.size(grdROMS.mask_v)))
+
+
+def stagger(first, second, isfirst):
+    """
+    Packed version of rho2u and rho2v in interpolation.f90: average the two neighbouring rho points
+    (first, second) of each U or V point, using only the wet neighbour if the other is above fill.
+    The U (V) points in the first column (row) are set to the first rho point as in the kernels.
+    """
+    fill = 10000
+    firstwet = np.abs(first) < fill
+    firstdry = np.abs(first) > fill
+    secondwet = np.abs(second) < fill
+    seconddry = np.abs(second) > fill
+
+    out = np.select([firstdry & secondwet, firstwet & seconddry, firstdry & seconddry],
+                    [second, first, np.zeros_like(first)],
+                    default=(first + second) * np.float32(0.5))
+    out[..., isfirst] = first[..., isfirst]
+    return out
+
+
+def depthaverage(dat, z_w):
+    """
+    Packed version of ubar and vbar in barotropic.f90: depth averaged velocity of the packed
+    columns dat (level, nwet) using z_w (level+1, nwet) averaged to the U or V points.
+    """
+    total = np.sum(dat * np.abs(z_w[1:, :] - z_w[:-1, :]), axis=0)
+    depth = np.abs(z_w[0, :])
+    return np.where(depth > 0.0, total / np.where(depth > 0.0, depth, 1.0), 0.0)
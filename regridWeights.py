@@ -0,0 +1,98 @@
+from __future__ import print_function
+import os
+import numpy as np
+from netCDF4 import Dataset
+
+try:
+    import ESMF
+except ImportError:
+    print("Could not find module ESMF")
+    pass
+
+try:
+    import scipy.sparse
+except ImportError:
+    print("Could not find module scipy")
+    pass
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    The ESMF regrid weights from the input grid to the ROMS grid stored as a sparse matrix. ESMF writes the
+    weights (bilinear, unmapped points ignored) to a netCDF file in cachedir and the matrix is created from
+    the row, col, and S variables of that file. The source and destination points are numbered in the
+    same order as a C-ordered (eta, xi) array so that
+
+        regridded = matrix * data.reshape(-1, eta*xi).T
+
+    gives the same values as the ESMF Regrid objects used in interp2D.py (unmapped points are zero).
+
+    Since all time records and levels are columns of one matrix product a whole block of data can be
+    regridded at once. Used by the time-batched path (timebatch in configM2R.py).
+    """
+
+
+class RegridWeights(object):
+
+    def __init__(self, filename, dstshape):
+        cdf = Dataset(filename)
+        row = np.asarray(cdf.variables["row"][:]) - 1
+        col = np.asarray(cdf.variables["col"][:]) - 1
+        weights = np.asarray(cdf.variables["S"][:])
+        nsrc = len(cdf.dimensions["n_a"])
+        ndst = len(cdf.dimensions["n_b"])
+        cdf.close()
+
+        self.dstshape = tuple(dstshape)
+        self.matrix = scipy.sparse.csr_matrix((weights, (row, col)), shape=(ndst, nsrc))
+
+    def regrid(self, data):
+        # Regrid data (..., eta, xi) on the input grid to (..., eta, xi) on the ROMS grid
+        shape = np.shape(data)
+        columns = np.reshape(np.asarray(data, dtype=np.float64), (-1, shape[-2] * shape[-1])).T
+        regridded = self.matrix.dot(columns)
+
+        return np.reshape(regridded.T, shape[:-2] + self.dstshape)
+
+
+def writeweightsfile(filename, row, col, weights, nsrc, ndst):
+    # Store weights calculated outside ESMF in the same format (1-based row and col) as the ESMF weight files
+    if os.path.exists(filename):
+        os.remove(filename)
+    cdf = Dataset(filename, "w")
+    cdf.createDimension("n_s", len(weights))
+    cdf.createDimension("n_a", nsrc)
+    cdf.createDimension("n_b", ndst)
+    for name, values, dtype in [("row", np.asarray(row) + 1, "i4"), ("col", np.asarray(col) + 1, "i4"),
+                                ("S", weights, "f8")]:
+        cdf.createVariable(name, dtype, ("n_s",))[:] = values
+    cdf.close()
+
+
+def createregridweights(confM2R):
+    grdROMS = confM2R.grdROMS
+    grdMODEL = confM2R.grdMODEL
+
+    if not os.path.exists(confM2R.cachedir):
+        os.makedirs(confM2R.cachedir)
+
+    print("=>Writing the ESMF interpolation weights to %s" % confM2R.cachedir)
+    for point, esmfgrid, dstshape in [("rho", grdROMS.esmfgrid, (grdROMS.eta_rho, grdROMS.xi_rho)),
+                                      ("u", grdROMS.esmfgrid_u, (grdROMS.eta_u, grdROMS.xi_u)),
+                                      ("v", grdROMS.esmfgrid_v, (grdROMS.eta_v, grdROMS.xi_v))]:
+        filename = os.path.join(confM2R.cachedir, "%s_%s_weights_%s.nc" % (confM2R.indatatype, confM2R.outgrid, point))
+        # With MPI all ranks take part in the regridding but only the first removes the old weights
+        if os.path.exists(filename) and ESMF.local_pet() == 0:
+            os.remove(filename)
+
+        fieldSrc = ESMF.Field(grdMODEL.esmfgrid, "fieldSrc", staggerloc=ESMF.StaggerLoc.CENTER)
+        fieldDst = ESMF.Field(esmfgrid, "fieldDst", staggerloc=ESMF.StaggerLoc.CENTER)
+        ESMF.Regrid(fieldSrc, fieldDst, filename=filename,
+                    regrid_method=ESMF.RegridMethod.BILINEAR,
+                    unmapped_action=ESMF.UnmappedAction.IGNORE)
+
+        setattr(grdMODEL, "weights_" + point, RegridWeights(filename, dstshape))
+        print("  -> weights at %s points: %s" % (point.upper(), filename))
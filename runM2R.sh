@@ -6,6 +6,7 @@
 #  Specify the project the job belongs to
 #PBS -A nn9297k
 #PBS -q normal
+#  Set mppwidth to the number of MPI ranks when usempi = True in configM2R.py
 #PBS -l mppwidth=1,walltime=06:10:00
 #PBS -l mppmem=1000MB
 
@@ -30,5 +31,8 @@ module load python
 export MPLCONFIGDIR=${pwd}
 export TMP=`pwd`
 export PYTHON_EGG_CACHE=/work/shared/nn9297k/model2roms
+# Stack size of the OpenMP threads used by the threaded Fortran kernels (usethreadedkernels in configM2R.py).
+# Must be set before python starts since the OpenMP runtime may be loaded by numpy or scipy.
+export OMP_STACKSIZE=512M
 
 aprun -B python main.py > output.log
\ No newline at end of file
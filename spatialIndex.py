@@ -0,0 +1,89 @@
+from __future__ import print_function
+import hashlib
+import os
+import pickle
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    print("Could not find module scipy")
+    pass
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    KD-tree index of the points of a 2D grid used to find the grid points closest to a set of positions
+    (e.g. stations in IOstation.py). The tree is built on the positions on the unit sphere so that the
+    distances are correct across the dateline and near the poles.
+
+    The tree is built once per grid and can be stored in cachedir in a file named after the type of
+    coordinates and a checksum of the grid coordinates, so that it is reused by the next run and different
+    grids or coordinates do not overwrite each other. All positions are found in one query:
+
+        index = spatialIndex.SpatialIndex(lon, lat, cachedir, "ROMS")
+        jj, ii, distance = index.query(stationlon, stationlat, 4)
+
+    returns the (eta, xi) indices of the 4 closest grid points of each station and the distances in km.
+    """
+
+
+EARTHRADIUS = 6371.0
+
+
+def lonlat2xyz(lon, lat):
+    # Position on the unit sphere so that the distances are correct across the dateline and near the poles
+    lon = np.radians(np.asarray(lon, dtype=np.float64).ravel())
+    lat = np.radians(np.asarray(lat, dtype=np.float64).ravel())
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+class SpatialIndex(object):
+
+    def __init__(self, lon, lat, cachedir=None, name="grid"):
+        self.shape = np.shape(lon)
+        self.xyz = lonlat2xyz(lon, lat)
+        self.gridkey = hashlib.sha1(self.xyz.tobytes()).hexdigest()
+        self.cachefile = None
+        if cachedir is not None:
+            self.cachefile = os.path.join(cachedir, "%s_spatialindex_%s.pkl" % (name, self.gridkey[0:16]))
+        self.tree = None
+        self.loadcache()
+
+        if self.tree is None:
+            self.tree = cKDTree(self.xyz)
+            self.savecache()
+
+    def loadcache(self):
+        if self.cachefile is None or not os.path.exists(self.cachefile):
+            return
+        with open(self.cachefile, "rb") as cache:
+            gridkey, tree = pickle.load(cache)
+        if gridkey == self.gridkey:
+            self.tree = tree
+            print("=>Read spatial index from %s" % self.cachefile)
+
+    def savecache(self):
+        if self.cachefile is None:
+            return
+        if not os.path.exists(os.path.dirname(self.cachefile)):
+            os.makedirs(os.path.dirname(self.cachefile))
+        with open(self.cachefile, "wb") as cache:
+            pickle.dump((self.gridkey, self.tree), cache, protocol=2)
+
+    def query(self, lon, lat, k):
+        """
+        Find the k grid points closest to each of the positions lon, lat (scalars or 1D arrays). Returns the
+        eta and xi indices and the distances (km), each (positions, k).
+        """
+        chord, nearest = self.tree.query(lonlat2xyz(lon, lat), k=k)
+        chord = np.reshape(chord, (-1, k))
+        nearest = np.reshape(nearest, (-1, k))
+
+        distance = 2.0 * EARTHRADIUS * np.arcsin(np.minimum(chord / 2.0, 1.0))
+        jj, ii = np.unravel_index(nearest, self.shape)
+
+        return jj, ii, distance
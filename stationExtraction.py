@@ -0,0 +1,220 @@
+from __future__ import print_function
+import os
+import time
+import numpy as np
+from netCDF4 import Dataset
+
+import datetimeFunctions
+import model2roms
+import regridWeights
+
+try:
+    import ESMF
+except ImportError:
+    print("Could not find module ESMF")
+    pass
+
+__version__ = "1.0"
+__status__ = "Development"
+
+
+def help():
+    """
+    Station mode (stationmode in configM2R.py): interpolate the input data directly to a set of station or
+    mooring positions (stationlons, stationlats) and depths (stationdepths) and write the time series to one
+    NETCDF4 file (stationfilename). No ROMS grid fields are created.
+
+    The horizontal interpolation uses bilinear weights from the input grid to the stations stored as a sparse
+    matrix (regridWeights.py). With useesmf the weights are created by ESMF regridding to a LocStream (the
+    same bilinear method as the main conversion); otherwise they are calculated for the regular lon/lat
+    input grid. Land points of the input data are left out and the weights of the remaining points scaled
+    to sum to one. The profiles are then linearly interpolated to stationdepths (fillval below the deepest
+    valid input level).
+
+    The time series are kept in memory and written at the end with one chunk per station holding the complete
+    time series (time-contiguous chunking) so that reading the series of one station is a single read.
+    """
+
+
+def createstationweights(confM2R):
+    grdMODEL = confM2R.grdMODEL
+    lon = np.asarray(confM2R.stationlons, dtype=np.float64)
+    lat = np.asarray(confM2R.stationlats, dtype=np.float64)
+
+    if not os.path.exists(confM2R.cachedir):
+        os.makedirs(confM2R.cachedir)
+    filename = os.path.join(confM2R.cachedir, "%s_stations_weights.nc" % confM2R.indatatype)
+
+    if confM2R.useesmf:
+        print("=>Creating ESMF interpolation weights for %s stations (LocStream)" % len(lon))
+        locstream = ESMF.LocStream(len(lon), coord_sys=ESMF.CoordSys.SPH_DEG)
+        locstream["ESMF:Lon"] = lon
+        locstream["ESMF:Lat"] = lat
+
+        if os.path.exists(filename):
+            os.remove(filename)
+        fieldSrc = ESMF.Field(grdMODEL.esmfgrid, "fieldSrc", staggerloc=ESMF.StaggerLoc.CENTER)
+        fieldDst = ESMF.Field(locstream, "fieldDst")
+        ESMF.Regrid(fieldSrc, fieldDst, filename=filename,
+                    regrid_method=ESMF.RegridMethod.BILINEAR,
+                    unmapped_action=ESMF.UnmappedAction.IGNORE)
+    else:
+        print("=>Calculating bilinear interpolation weights for %s stations" % len(lon))
+        row, col, weights = bilinearweights(grdMODEL.lon, grdMODEL.lat, lon, lat)
+        regridWeights.writeweightsfile(filename, row, col, weights, np.size(grdMODEL.lon), len(lon))
+
+    return regridWeights.RegridWeights(filename, (len(lon),))
+
+
+def bilinearweights(gridlon, gridlat, lon, lat):
+    # Bilinear weights from the regular lon/lat grid (eta, xi) to the positions lon, lat. Returns the station
+    # (row) and C-ordered grid point (col) of each weight.
+    lonaxis = np.asarray(gridlon)[0, :]
+    lataxis = np.asarray(gridlat)[:, 0]
+    nx = len(lonaxis)
+
+    # Make the station longitudes follow the convention of the grid (0-360 or -180-180)
+    lon = np.mod(lon - lonaxis[0], 360.0) + lonaxis[0]
+
+    i = np.clip(np.searchsorted(lonaxis, lon) - 1, 0, nx - 2)
+    j = np.clip(np.searchsorted(lataxis, lat) - 1, 0, len(lataxis) - 2)
+    fx = np.clip((lon - lonaxis[i]) / (lonaxis[i + 1] - lonaxis[i]), 0.0, 1.0)
+    fy = np.clip((lat - lataxis[j]) / (lataxis[j + 1] - lataxis[j]), 0.0, 1.0)
+
+    station = np.arange(len(lon))
+    row = np.concatenate([station] * 4)
+    col = np.concatenate([j * nx + i, j * nx + i + 1, (j + 1) * nx + i, (j + 1) * nx + i + 1])
+    weights = np.concatenate([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy])
+
+    return row, col, weights
+
+
+def interpolatestations(confM2R, stationweights, data):
+    # Horizontal interpolation of data (levels, eta, xi) or (eta, xi) to the stations using only the valid
+    # (ocean) input points. Returns (levels, stations) or (stations)
+    data = np.ma.filled(data, confM2R.grdROMS.fillval)
+    valid = (np.abs(data) < 10000).astype(np.float64)
+
+    total = stationweights.regrid(valid)
+    values = stationweights.regrid(np.where(valid > 0, data, 0.0))
+
+    return np.where(total > 0, values / np.maximum(total, 1.0e-12), confM2R.grdROMS.fillval)
+
+
+def interpolatedepths(confM2R, profiles):
+    # Linear interpolation of the profiles (levels, stations) at the input depths to stationdepths
+    depth = -np.asarray(confM2R.grdMODEL.z_r, dtype=np.float64)
+    stationdepths = np.asarray(confM2R.stationdepths, dtype=np.float64)
+    result = np.empty((np.shape(profiles)[1], len(stationdepths)))
+
+    for station in range(np.shape(profiles)[1]):
+        valid = np.abs(profiles[:, station]) < 10000
+        if not valid.any():
+            result[station, :] = confM2R.grdROMS.fillval
+            continue
+        result[station, :] = np.interp(stationdepths, depth[valid], profiles[valid, station],
+                                       right=confM2R.grdROMS.fillval)
+    return result
+
+
+def extractstations(confM2R):
+    model2roms.initializeinputgrid(confM2R)
+    stationweights = createstationweights(confM2R)
+
+    dates = datetimeFunctions.createlistofdates(confM2R)
+
+    nstations = len(confM2R.stationlons)
+    ndepths = len(confM2R.stationdepths)
+    times = np.zeros(len(dates))
+    series = {}
+    for myvar in confM2R.globalvarnames:
+        if myvar in ['temperature', 'salinity', 'uvel', 'vvel']:
+            series[myvar] = np.empty((len(dates), nstations, ndepths), dtype=np.float32)
+        else:
+            series[myvar] = np.empty((len(dates), nstations), dtype=np.float32)
+
+    print("=>Extracting %s time steps for %s stations" % (len(dates), nstations))
+    for ntime, (year, month, day) in enumerate(dates):
+        model2roms.getTime(confM2R, year, month, day)
+        times[ntime] = confM2R.grdROMS.time
+
+        for myvar in confM2R.globalvarnames:
+            if myvar in ['temperature', 'salinity', 'uvel', 'vvel']:
+                data = model2roms.get3ddata(confM2R, myvar, year, month, day)
+                series[myvar][ntime] = interpolatedepths(confM2R, interpolatestations(confM2R, stationweights, data))
+            else:
+                data = model2roms.get2ddata(confM2R, myvar, year, month, day)
+                series[myvar][ntime] = interpolatestations(confM2R, stationweights, data)
+
+    writestationfile(confM2R, times, series)
+
+
+def writestationfile(confM2R, times, series):
+    grdROMS = confM2R.grdROMS
+    names = {'temperature': ('temp', 'potential temperature', 'Celsius'),
+             'salinity': ('salt', 'salinity', 'PSU'),
+             'uvel': ('u_eastward', 'eastward velocity', 'meter second-1'),
+             'vvel': ('v_northward', 'northward velocity', 'meter second-1'),
+             'ssh': ('zeta', 'free-surface', 'meter')}
+
+    if os.path.exists(confM2R.stationfilename):
+        os.remove(confM2R.stationfilename)
+    print("=>Writing station time series to %s" % confM2R.stationfilename)
+
+    f1 = Dataset(confM2R.stationfilename, mode='w', format='NETCDF4')
+    f1.title = "Station time series from model2roms"
+    f1.grd_file = "Station positions defined in configM2R.py"
+    f1.history = 'Created ' + time.ctime(time.time())
+    f1.source = "%s (stationExtraction.py)" % confM2R.indatatype
+
+    ntimes = len(times)
+    nstations = len(confM2R.stationlons)
+    f1.createDimension('ocean_time', ntimes)
+    f1.createDimension('station', nstations)
+    f1.createDimension('depth', len(confM2R.stationdepths))
+
+    v = f1.createVariable('station_name', str, ('station',))
+    v.long_name = "name of station"
+    for station, name in enumerate(confM2R.stationnames):
+        v[station] = str(name)
+
+    for name, values, long_name, units in [('lon', confM2R.stationlons, "longitude of station", "degree_east"),
+                                           ('lat', confM2R.stationlats, "latitude of station", "degree_north")]:
+        v = f1.createVariable(name, 'd', ('station',))
+        v.long_name = long_name
+        v.units = units
+        v[:] = values
+
+    v = f1.createVariable('depth', 'd', ('depth',))
+    v.long_name = "depth below surface"
+    v.units = "meter"
+    v[:] = confM2R.stationdepths
+
+    v_time = f1.createVariable('ocean_time', 'd', ('ocean_time',))
+    if confM2R.indatatype == "NORESM":
+        v_time.units = 'seconds since 1800-01-01 00:00:00'
+        v_time.calendar = 'noleap'
+    else:
+        v_time.units = 'seconds since 1948-01-01 00:00:00'
+        v_time.calendar = 'standard'
+    v_time.long_name = v_time.units
+    if grdROMS.timeunits[0:7] == "seconds":
+        v_time[:] = times
+    else:
+        v_time[:] = times * 86400.0
+
+    # One chunk holds the complete time series of one station
+    for myvar in confM2R.globalvarnames:
+        name, long_name, units = names.get(myvar, (myvar, myvar, ""))
+        if series[myvar].ndim == 3:
+            v = f1.createVariable(name, 'f', ('ocean_time', 'station', 'depth'), zlib=confM2R.myzlib,
+                                  chunksizes=(ntimes, 1, len(confM2R.stationdepths)), fill_value=grdROMS.fillval)
+        else:
+            v = f1.createVariable(name, 'f', ('ocean_time', 'station'), zlib=confM2R.myzlib,
+                                  chunksizes=(ntimes, 1), fill_value=grdROMS.fillval)
+        v.long_name = long_name
+        v.units = units
+        v.time = "ocean_time"
+        v[:] = series[myvar]
+
+    f1.close()